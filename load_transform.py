@@ -15,7 +15,7 @@ from typing import Callable, Dict
 
 from redis import Redis
 from write_funcs import add_game_record, add_schedule, add_player
-from models import BoardGameClubLoadTransformError, GameRecordTypedDict
+from models import BoardGameClubLoadTransformError, BoardGameClubNotUniqueError, GameRecordTypedDict
 
 
 def create_path_obj(path_str: str) -> Path:
@@ -36,7 +36,7 @@ def process_csv_file(path: Path, func: Callable[[Dict[str, str]], None], label:
             try:
                 func(dict(zip(header, row)))
                 success += 1
-            except BoardGameClubLoadTransformError:
+            except (BoardGameClubLoadTransformError, BoardGameClubNotUniqueError):
                 skipped += 1
             if (i + 1) % 500 == 0:
                 print(f"{label}: Processed {i+1} records...")
@@ -56,7 +56,7 @@ def process_game_records_csv(path: Path, redis_client: Redis):
             try:
                 add_game_record(redis_client, record)
                 success += 1
-            except BoardGameClubLoadTransformError:
+            except (BoardGameClubLoadTransformError, BoardGameClubNotUniqueError):
                 skipped += 1
             if (i + 1) % 500 == 0:
                 print(f"game_records.csv: Processed {i+1} records...")
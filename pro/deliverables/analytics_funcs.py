@@ -1,36 +1,237 @@
-﻿from redis import Redis
+﻿import cluster
+import config
 import keys
 import json
+import math
+import rankings
+import seq_sketch
+from connection import get_read_client
+from instrumentation import traced
+from models import BoardGameClubConfigError
 
 # Connect to Redis
-r = Redis(host='localhost', port=6379, decode_responses=True)
+r = get_read_client()
 
 # --- Analytics Functions ---
 
+@traced
 def get_shortest_game():
     game_id = r.get(keys.ANALYTICS_SHORTEST_GAME)
     num_turns = r.get(keys.ANALYTICS_SHORTEST_GAME_TURNS)
     return {"game_id": game_id, "number_of_turns": int(num_turns) if num_turns else None}
 
+@traced
 def get_check_counts():
-    keys_list = r.keys("game:*:number_of_checks")
-    return {key.split(":")[1]: int(r.get(key)) for key in keys_list}
+    keys_list = r.keys(keys.GAME_CHECKS.format(gid="*"))
+    return {keys.unwrap_hash_tag(key.split(":")[1]): int(r.get(key)) for key in keys_list}
 
+@traced
 def get_most_frequent_opening():
-    opening = r.get(keys.ANALYTICS_MOST_FREQ_OPENING)
-    count = r.get(keys.ANALYTICS_MOST_FREQ_OPENING_COUNT)
-    return {"opening_eco": opening, "count": int(count) if count else 0}
+    # ties are broken by ascending ECO code
+    most_freq = rankings.leader(r, keys.GLOBAL_OPENINGS_RANKING)
+    opening, count = most_freq if most_freq else (None, 0)
+    return {"opening_eco": opening, "count": int(count)}
 
+@traced
+def get_top_openings(k=5):
+    return [
+        {"opening_eco": opening, "count": int(count)}
+        for opening, count in rankings.top_k(r, keys.GLOBAL_OPENINGS_RANKING, k)
+    ]
+
+@traced
+def get_opening_rank(eco):
+    return rankings.rank(r, keys.GLOBAL_OPENINGS_RANKING, eco)
+
+@traced
 def get_most_common_3move_sequence():
+    if config.SEQ_STATS_MODE == "approx":
+        top = seq_sketch.top_sequences(r)
+        count = top[0][1] if top else 0
+        return {"sequences": [seq for seq, seq_count in top if seq_count == count], "count": count}
     sequences = r.smembers(keys.ANALYTICS_MOST_COMMON_SEQS)
     count = r.get(keys.ANALYTICS_MOST_COMMON_SEQ_COUNT)
     return {"sequences": list(sequences), "count": int(count) if count else 0}
 
+@traced
+def get_top_3move_sequences(k=10):
+    # NOTE: only the approximate mode keeps a ranking of all sequences (see seq_sketch.py)
+    if config.SEQ_STATS_MODE != "approx":
+        raise BoardGameClubConfigError("top-k three-move sequences require BGC_SEQ_STATS_MODE=approx")
+    return [{"sequence": seq, "count": count} for seq, count in seq_sketch.top_sequences(r)[:k]]
+
+@traced
+def get_3move_sequence_counts(sequences):
+    if config.SEQ_STATS_MODE == "approx":
+        return dict(zip(sequences, seq_sketch.query_sequences(r, sequences)))
+    pipe = r.pipeline(transaction=False)
+    for seq in sequences:
+        pipe.get(keys.GLOBAL_SEQ_COUNT.format(seq=seq))
+    return {seq: int(count or 0) for seq, count in zip(sequences, pipe.execute())}
+
+@traced
 def get_least_common_3move_sequence():
+    # NOTE: a Count-Min Sketch only bounds overestimates, so it cannot identify the least common sequences
+    if config.SEQ_STATS_MODE == "approx":
+        raise BoardGameClubConfigError("least common three-move sequences require BGC_SEQ_STATS_MODE=exact")
     sequences = r.smembers(keys.ANALYTICS_LEAST_COMMON_SEQS)
     count = r.get(keys.ANALYTICS_LEAST_COMMON_SEQ_COUNT)
     return {"sequences": list(sequences), "count": int(count) if count else 0}
 
+# --- Game Distributions (histograms and cross-tabulations maintained at ingest) ---
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+# nearest-rank percentiles (ARGV) of the scores of the sorted set KEYS[1], looked up by rank on the server so that they
+# are sent in the same round trip as the histograms (nil for an empty sorted set)
+# NOTE: EVAL is not read-only for routing.py, so a pipeline holding this script is sent to the primary
+__PERCENTILES_SCRIPT = """
+local games = redis.call("ZCARD", KEYS[1])
+local values = {}
+for i, percentile in ipairs(ARGV) do
+    local rank = math.max(1, math.ceil(tonumber(percentile) / 100 * games))
+    values[i] = redis.call("ZRANGE", KEYS[1], rank - 1, rank - 1, "WITHSCORES")[2] or false
+end
+return values
+"""
+
+def __queue_turns_percentiles(pipe, percentiles):
+    # NOTE: queued as a raw command, as the cluster pipeline of redis-py refuses `eval`
+    pipe.execute_command("EVAL", __PERCENTILES_SCRIPT, 1, keys.ANALYTICS_GAMES_BY_TURNS, *percentiles)
+
+def __distribution(histogram, bucket_width, percentiles, exact_values=None):
+    # percentiles are nearest-rank: the exact values if given (one per percentile, None without games), and otherwise
+    # the lower bound of the bucket holding them
+    buckets = sorted((int(bucket), int(games)) for bucket, games in histogram.items())
+    total = sum(games for _, games in buckets)
+    result = {
+        "bucket_width": bucket_width,
+        "games": total,
+        "buckets": [{"from": bucket, "to": bucket + bucket_width - 1, "games": games} for bucket, games in buckets],
+        "percentiles": {},
+    }
+    if exact_values is not None:
+        for percentile, value in zip(percentiles, exact_values):
+            if value is not None:
+                result["percentiles"][percentile] = int(float(value))
+        return result
+    for percentile in percentiles:
+        rank = max(1, math.ceil(percentile / 100 * total))
+        cumulative = 0
+        for bucket, games in buckets:
+            cumulative += games
+            if cumulative >= rank:
+                result["percentiles"][percentile] = bucket
+                break
+    return result
+
+def __crosstab(counts):
+    # "{row}:{winner}" -> games, as {row: {winner: games}}
+    table = {}
+    for field, games in counts.items():
+        row, winner = field.rsplit(":", 1)
+        table.setdefault(row, {})[winner] = int(games)
+    return table
+
+@traced
+def get_turns_distribution(percentiles=PERCENTILES):
+    # the percentiles are exact, from the per-game ranking (keys.ANALYTICS_GAMES_BY_TURNS)
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(keys.ANALYTICS_TURNS_HISTOGRAM)
+    __queue_turns_percentiles(pipe, percentiles)
+    histogram, exact_values = pipe.execute()
+    return __distribution(histogram, config.HISTOGRAM_TURNS_BUCKET, percentiles, exact_values)
+
+@traced
+def get_checks_distribution(percentiles=PERCENTILES):
+    return __distribution(r.hgetall(keys.ANALYTICS_CHECKS_HISTOGRAM), config.HISTOGRAM_CHECKS_BUCKET, percentiles)
+
+@traced
+def get_victory_status_outcomes():
+    return __crosstab(r.hgetall(keys.ANALYTICS_VICTORY_STATUS_OUTCOMES))
+
+@traced
+def get_opening_outcomes():
+    return __crosstab(r.hgetall(keys.ANALYTICS_OPENING_OUTCOMES))
+
+def __games(games_by_turns):
+    return [{"game_id": game_id, "number_of_turns": int(turns)} for game_id, turns in games_by_turns]
+
+def __queue_shortest_games(pipe, n):
+    # ties are broken by ascending game_id
+    pipe.zrange(keys.ANALYTICS_GAMES_BY_TURNS, 0, n - 1, withscores=True)
+
+def __queue_longest_games(pipe, n):
+    # ties are broken by descending game_id (the reverse order of the shortest games)
+    pipe.zrevrange(keys.ANALYTICS_GAMES_BY_TURNS, 0, n - 1, withscores=True)
+
+@traced
+def get_game_distributions(percentiles=PERCENTILES, n=10):
+    # every distribution, with the exact turns percentiles and the `n` shortest/longest games, in one round trip (the
+    # analytics keys share one hash slot in cluster mode)
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(keys.ANALYTICS_TURNS_HISTOGRAM)
+    pipe.hgetall(keys.ANALYTICS_CHECKS_HISTOGRAM)
+    pipe.hgetall(keys.ANALYTICS_VICTORY_STATUS_OUTCOMES)
+    pipe.hgetall(keys.ANALYTICS_OPENING_OUTCOMES)
+    __queue_turns_percentiles(pipe, percentiles)
+    __queue_shortest_games(pipe, n)
+    __queue_longest_games(pipe, n)
+    turns, checks, victory_status_outcomes, opening_outcomes, turns_percentiles, shortest, longest = pipe.execute()
+    return {
+        "number_of_turns": __distribution(turns, config.HISTOGRAM_TURNS_BUCKET, percentiles, turns_percentiles),
+        "number_of_checks": __distribution(checks, config.HISTOGRAM_CHECKS_BUCKET, percentiles),
+        "victory_status_outcomes": __crosstab(victory_status_outcomes),
+        "opening_outcomes": __crosstab(opening_outcomes),
+        "shortest_games": __games(shortest),
+        "longest_games": __games(longest),
+    }
+
+@traced
+def get_shortest_games(n=10):
+    pipe = r.pipeline(transaction=False)
+    __queue_shortest_games(pipe, n)
+    return __games(pipe.execute()[0])
+
+@traced
+def get_longest_games(n=10):
+    pipe = r.pipeline(transaction=False)
+    __queue_longest_games(pipe, n)
+    return __games(pipe.execute()[0])
+
+# --- Distinct Counts (HyperLogLog estimates, ~0.81% standard error) ---
+
+@traced
+def get_distinct_opponents_count(pid):
+    return r.pfcount(keys.PLAYER_OPPONENTS_HLL.format(pid=pid))
+
+@traced
+def get_distinct_openings_count(pid):
+    return r.pfcount(keys.PLAYER_OPENINGS_HLL.format(pid=pid))
+
+@traced
+def get_distinct_3move_sequences_count(load_id=None):
+    # `load_id` restricts the count to the sequences recorded while BGC_LOAD_ID was set to `load_id`
+    if load_id is not None:
+        return r.pfcount(keys.GLOBAL_LOAD_SEQS_HLL.format(load_id=load_id))
+    return r.pfcount(keys.GLOBAL_SEQS_HLL)
+
+@traced
+def get_group_distinct_opponents_count(pids):
+    return cluster.pfcount_union(r, [keys.PLAYER_OPPONENTS_HLL.format(pid=pid) for pid in pids])
+
+@traced
+def get_group_distinct_openings_count(pids):
+    return cluster.pfcount_union(r, [keys.PLAYER_OPENINGS_HLL.format(pid=pid) for pid in pids])
+
+@traced
+def get_friend_group_distinct_opponents_count(pid):
+    # the friend group of player `pid`
+    fid = r.get(keys.PLAYER_FRIEND_GROUP.format(pid=pid))
+    if fid is None:
+        return 0
+    return get_group_distinct_opponents_count(r.smembers(keys.GLOBAL_FRIEND_GROUP.format(fid=fid)))
+
 # --- print output ---
 
 if __name__ == "__main__":
@@ -67,6 +268,14 @@ if __name__ == "__main__":
         print("Sequences:\n")
         for seq in least['sequences'][:5]:
             print(f"- {seq}\n")
+        print("\n")
+
+        # Game Distributions
+        print("------------------------------------------\nNumber of Turns (percentiles):\n")
+        print(f"{get_turns_distribution()['percentiles']}\n")
+        print("Longest Games:\n")
+        for game in get_longest_games(5):
+            print(f"{game['game_id']}: {game['number_of_turns']}\n")
 
 
 
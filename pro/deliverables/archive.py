@@ -0,0 +1,137 @@
+"""archive.py
+This file provides the cold tier of the game moves (keys.GAME_MOVES), which are only needed at ingest and by backfills.
+`archive_games` moves the move lists of all but the `config.ARCHIVE_KEEP_RECENT` most recently ingested games (in the
+order of keys.GLOBAL_GAMES_LOG) into a new segment file in `config.ARCHIVE_DIR`, and records the location of each list
+in keys.ARCHIVE_INDEX. `get_game_moves` reads a move list from redis or, once archived, from its segment file.
+
+Segment files are append-only: each move list is stored as zlib-compressed JSON at the offset recorded in the index, so
+a single list is read (through mmap) without decompressing the rest of the segment. The segment of a running
+`archive_games` grows batch by batch while the index entries of its earlier batches are already published, so a map
+shorter than a location it must read is remapped.
+keys.ARCHIVE_WATERMARK counts the log entries already archived, so each run only processes the games ingested since the
+previous run.
+
+NOTE: every process reading archived moves must see the same `config.ARCHIVE_DIR` (e.g., a shared volume), and only one
+archiving process may run at a time
+
+Usage:
+    python archive.py                        # archive all but the `config.ARCHIVE_KEEP_RECENT` most recent games
+    python archive.py --keep-recent 50000
+"""
+
+import argparse
+import json
+import mmap
+import os
+import zlib
+from typing import Dict, List
+
+from redis import Redis
+
+import config
+import keys
+from connection import get_redis_client
+from instrumentation import traced
+
+# open segment files (segments are append-only, so they are mapped once per process, and remapped once they grew)
+__segments: Dict[str, mmap.mmap] = {}
+
+
+def __segment(name: str, size: int) -> mmap.mmap:
+    """Returns the read-only memory map of the segment file `name`, mapping at least its first `size` bytes"""
+    if name not in __segments or len(__segments[name]) < size:
+        # NOTE: the previous map is not closed, as another thread may still be reading it (it is unmapped once released)
+        with open(os.path.join(config.ARCHIVE_DIR, name), "rb") as segment_file:
+            __segments[name] = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return __segments[name]
+
+
+def read_archived_moves(location: str) -> List[str]:
+    """Reads the move list stored at `location` (a keys.ARCHIVE_INDEX value) from its segment file"""
+    name, offset, length = location.rsplit(":", 2)
+    start, end = int(offset), int(offset) + int(length)
+    return json.loads(zlib.decompress(__segment(name, end)[start:end]))
+
+
+@traced
+def get_games_moves(redis_client: Redis, gids: List[str]) -> List[List[str]]:
+    """Returns the move list of each game in `gids`, from redis or from the archive ([] for unknown games)"""
+    pipe = redis_client.pipeline(transaction=False)
+    for gid in gids:
+        pipe.lrange(keys.GAME_MOVES.format(gid=gid), 0, -1)
+    moves_per_game = pipe.execute()
+
+    archived = [i for i, moves in enumerate(moves_per_game) if not moves]
+    if archived:
+        locations = redis_client.hmget(keys.ARCHIVE_INDEX, [gids[i] for i in archived])
+        for i, location in zip(archived, locations):
+            if location is not None:
+                moves_per_game[i] = read_archived_moves(location)
+    return moves_per_game
+
+
+def get_game_moves(redis_client: Redis, gid: str) -> List[str]:
+    """Returns the move list of the game `gid`, from redis or from the archive ([] for an unknown game)"""
+    return get_games_moves(redis_client, [gid])[0]
+
+
+@traced
+def archive_games(
+        redis_client: Redis,
+        keep_recent: int = config.ARCHIVE_KEEP_RECENT,
+        batch_size: int = 1000) -> int:
+    """Moves the move lists of the games ingested before the `keep_recent` most recent ones (and after the previous
+    run) into a new segment file, and returns the number of move lists archived
+    """
+    watermark = int(redis_client.get(keys.ARCHIVE_WATERMARK) or 0)
+    end = redis_client.llen(keys.GLOBAL_GAMES_LOG) - keep_recent
+    if end <= watermark:
+        return 0
+
+    os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+    name = f"segment-{redis_client.incr(keys.ARCHIVE_NEXT_SEGMENT):06d}.zlib"
+    path = os.path.join(config.ARCHIVE_DIR, name)
+    archived = 0
+    with open(path, "xb") as segment_file:
+        for start in range(watermark, end, batch_size):
+            gids = redis_client.lrange(keys.GLOBAL_GAMES_LOG, start, min(start + batch_size, end) - 1)
+            pipe = redis_client.pipeline(transaction=False)
+            for gid in gids:
+                pipe.lrange(keys.GAME_MOVES.format(gid=gid), 0, -1)
+
+            locations: Dict[str, str] = {}
+            for gid, moves in zip(gids, pipe.execute()):
+                if not moves:  # no moves, or archived by an interrupted run
+                    continue
+                data = zlib.compress(json.dumps(moves).encode("utf-8"))
+                locations[gid] = f"{name}:{segment_file.tell()}:{len(data)}"
+                segment_file.write(data)
+            # the moves are only deleted from redis once they are durably stored in the segment file
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+
+            pipe = redis_client.pipeline(transaction=False)
+            if locations:
+                pipe.hset(keys.ARCHIVE_INDEX, mapping=locations)
+            for gid in locations:
+                pipe.delete(keys.GAME_MOVES.format(gid=gid))
+            pipe.set(keys.ARCHIVE_WATERMARK, start + len(gids))
+            pipe.execute()
+            archived += len(locations)
+
+    if archived == 0:
+        os.remove(path)
+    return archived
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive the move lists of older games to compressed segment files")
+    parser.add_argument(
+        "--keep-recent",
+        type=int,
+        default=config.ARCHIVE_KEEP_RECENT,
+        help="number of most recently ingested games whose moves stay in redis")
+    args = parser.parse_args()
+
+    archived = archive_games(get_redis_client(), args.keep_recent)
+    print(f"archived the moves of {archived} game(s) to {config.ARCHIVE_DIR}")
@@ -0,0 +1,451 @@
+"""backfill_funcs.py
+This file provides the backfills that build the derived indexes added after game records were already loaded, from the
+keys of every recorded game. Each backfill may be re-run safely.
+
+NOTE: pause ingest while a backfill runs; games recorded concurrently may be counted twice or not at all
+
+Usage:
+    python backfill_funcs.py head-to-head   # rebuild the head-to-head game sets and win/loss/draw records
+    python backfill_funcs.py opening-tree   # rebuild the opening explorer tree
+    python backfill_funcs.py game-bitmaps   # convert the game sets to bitmaps (see game_bitmaps.py)
+    python backfill_funcs.py directory      # rebuild the player directory (email lookup and prefix search)
+    python backfill_funcs.py games-log      # append the games missing from the ingest log (see archive.py)
+    python backfill_funcs.py profiles       # rebuild the materialized player profiles (see profiles.py)
+    python backfill_funcs.py histograms     # rebuild the game distribution histograms and cross-tabulations
+    python backfill_funcs.py openings       # rebuild the opening rankings and the most frequently used openings
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from redis import Redis
+
+import archive
+import cluster
+import config
+import game_bitmaps
+import keys
+import profiles
+from connection import get_redis_client
+from instrumentation import traced
+
+# per-opening counters of the databases loaded before the opening rankings (keys.PLAYER_OPENINGS_RANKING and
+# keys.GLOBAL_OPENINGS_RANKING), deleted by `backfill_openings`
+LEGACY_OPENING_COUNT_PATTERNS = ("player:*:openings:*:count", "global:openings:*:count")
+
+
+def __batches(items: Iterable[str], batch_size: int) -> Iterator[List[str]]:
+    """Yields `items` in lists of at most `batch_size` items"""
+    batch: List[str] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def __game_ids(redis_client: Redis, batch_size: int) -> Iterator[List[str]]:
+    """Yields the ids of every recorded game, in batches of at most `batch_size`
+    NOTE: the ids of the scheduled games are yielded too, as they share keys.GLOBAL_GAMES_IDS; they have no game keys
+    """
+    return __batches(redis_client.sscan_iter(keys.GLOBAL_GAMES_IDS, count=batch_size), batch_size)
+
+
+@traced
+def backfill_head_to_head(redis_client: Redis, batch_size: int = 1000) -> int:
+    """Rebuilds the head-to-head index (keys.H2H_GAMES and keys.H2H_RECORD) of every pair of opponents and returns the
+    number of pairs written
+    """
+    games: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    records: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: {"a_wins": 0, "b_wins": 0, "draws": 0})
+    for gids in __game_ids(redis_client, batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for gid in gids:
+            pipe.get(keys.GAME_WHITE_PLAYER.format(gid=gid))
+            pipe.get(keys.GAME_BLACK_PLAYER.format(gid=gid))
+            pipe.get(keys.GAME_WINNER.format(gid=gid))
+        values = pipe.execute()
+        for i, gid in enumerate(gids):
+            white, black, winner = values[3 * i:3 * i + 3]
+            if white is None or black is None:  # scheduled games share the id set but have no players
+                continue
+            pair = keys.canonical_pair(white, black)
+            games[pair].append(gid)
+            if winner not in ("white", "black"):
+                records[pair]["draws"] += 1
+            elif (white if winner == "white" else black) == pair[0]:
+                records[pair]["a_wins"] += 1
+            else:
+                records[pair]["b_wins"] += 1
+
+    pairs = list(games)
+    for i in range(0, len(pairs), batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for pid_a, pid_b in pairs[i:i + batch_size]:
+            games_key = keys.H2H_GAMES.format(pid_a=pid_a, pid_b=pid_b)
+            record_key = keys.H2H_RECORD.format(pid_a=pid_a, pid_b=pid_b)
+            pipe.delete(games_key)
+            pipe.delete(record_key)
+            pipe.sadd(games_key, *games[(pid_a, pid_b)])
+            pipe.hset(record_key, mapping=records[(pid_a, pid_b)])
+        pipe.execute()
+    return len(pairs)
+
+
+@traced
+def backfill_opening_tree(redis_client: Redis, batch_size: int = 1000) -> int:
+    """Rebuilds the opening tree (keys.OPENING_TREE_NODE) from the first `config.OPENING_TREE_DEPTH` plies of every game
+    and returns the number of nodes written
+    NOTE: nodes deeper than the current depth (left by a larger, earlier depth) are not deleted
+    """
+    if config.OPENING_TREE_DEPTH <= 0:
+        return 0
+    nodes: Dict[str, Counter] = defaultdict(Counter)
+    for gids in __game_ids(redis_client, batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for gid in gids:
+            pipe.get(keys.GAME_WINNER.format(gid=gid))
+        winners = pipe.execute()
+        for moves, winner in zip(archive.get_games_moves(redis_client, gids), winners):
+            outcome = winner if winner in ("white", "black") else "draw"
+            moves = moves[:config.OPENING_TREE_DEPTH]
+            for ply, move in enumerate(moves):
+                node = nodes[",".join(moves[:ply])]
+                node[f"{move}:games"] += 1
+                node[f"{move}:{outcome}"] += 1
+
+    paths = list(nodes)
+    for i in range(0, len(paths), batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for path in paths[i:i + batch_size]:
+            node_key = keys.OPENING_TREE_NODE.format(path=path)
+            pipe.delete(node_key)
+            pipe.hset(node_key, mapping=nodes[path])
+        pipe.execute()
+    return len(paths)
+
+
+def __intern_game_ids(redis_client: Redis, gids: List[str]) -> Dict[str, int]:
+    """Returns the game index of each game in `gids`, reserving indexes for the games that do not have one yet"""
+    if not gids:
+        return {}
+    indexes = {
+        gid: int(index)
+        for gid, index in zip(gids, redis_client.hmget(keys.GLOBAL_GAMES_INDEXES, gids))
+        if index is not None
+    }
+    missing = [gid for gid in gids if gid not in indexes]
+    if missing:
+        pipe = redis_client.pipeline(transaction=False)
+        for gid, index in zip(missing, game_bitmaps.reserve_indexes(redis_client, len(missing))):
+            game_bitmaps.queue_index_mapping(pipe, gid, index)
+            indexes[gid] = index
+        pipe.execute()
+    return indexes
+
+
+def __convert_game_sets(redis_client: Redis, conversions: List[Tuple[str, game_bitmaps.GameSet]]) -> int:
+    """Adds the members of each set of game ids to its game set, given as `(set key, game set)` pairs, and returns the
+    number of non-empty sets
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for set_key, _ in conversions:
+        pipe.smembers(set_key)
+    members = pipe.execute()
+    gids = sorted(set().union(*members))
+    if not gids:  # e.g., players who have not played yet
+        return 0
+    indexes = __intern_game_ids(redis_client, gids)
+    games = int(redis_client.get(keys.GLOBAL_GAMES_NEXT_INDEX))
+
+    game_bitmaps.load_scripts(redis_client)
+    pipe = redis_client.pipeline(transaction=False)
+    for (_, game_set), set_gids in zip(conversions, members):
+        if set_gids:
+            game_bitmaps.queue_add(pipe, game_set, sorted(indexes[gid] for gid in set_gids), games)
+    pipe.execute()
+    return sum(1 for set_gids in members if set_gids)
+
+
+@traced
+def backfill_game_bitmaps(redis_client: Redis, batch_size: int = 1000) -> int:
+    """Adds the members of every per-player and per-sequence game set (keys.PLAYER_GAMES_SET and keys.GLOBAL_SEQ_GAMES)
+    to its bitmap-encoded game set (see game_bitmaps.py), interning the game ids as needed, and returns the number of
+    non-empty sets converted. Games already added (by games recorded with bitmaps enabled) are kept.
+    NOTE: set `config.GAME_SETS_ENCODING` to "bitmap" once this completes; the sets may then be deleted
+    """
+    written = 0
+    for pids in __batches(redis_client.sscan_iter(keys.GLOBAL_PLAYERS_IDS, count=batch_size), batch_size):
+        written += __convert_game_sets(redis_client, [
+            (keys.PLAYER_GAMES_SET.format(pid=pid), game_bitmaps.player_game_set(pid))
+            for pid in pids
+        ])
+
+    seq_games_pattern = keys.GLOBAL_SEQ_GAMES.format(seq="*")
+    prefix, suffix = seq_games_pattern.split("*")
+    for set_keys in __batches(redis_client.scan_iter(match=seq_games_pattern, count=batch_size), batch_size):
+        written += __convert_game_sets(redis_client, [
+            (set_key, game_bitmaps.seq_game_set(set_key[len(prefix):-len(suffix)]))
+            for set_key in set_keys
+        ])
+    return written
+
+
+@traced
+def backfill_player_directory(redis_client: Redis, batch_size: int = 1000) -> int:
+    """Rebuilds the player directory (keys.GLOBAL_PLAYERS_BY_EMAIL, keys.GLOBAL_PIDS_LEX, and keys.GLOBAL_EMAILS_LEX)
+    from the `user_id` and email of every player, and returns the number of players indexed
+    """
+    redis_client.delete(keys.GLOBAL_PLAYERS_BY_EMAIL, keys.GLOBAL_PIDS_LEX, keys.GLOBAL_EMAILS_LEX)
+    indexed = 0
+    for pids in __batches(redis_client.sscan_iter(keys.GLOBAL_PLAYERS_IDS, count=batch_size), batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for pid in pids:
+            pipe.get(keys.PLAYER_EMAIL.format(pid=pid))
+        player_emails = pipe.execute()
+
+        pipe = redis_client.pipeline(transaction=False)
+        for pid, player_email in zip(pids, player_emails):
+            if player_email is not None:
+                pipe.hsetnx(keys.GLOBAL_PLAYERS_BY_EMAIL, player_email, pid)
+                pipe.zadd(keys.GLOBAL_EMAILS_LEX, {player_email: 0})
+        pipe.zadd(keys.GLOBAL_PIDS_LEX, dict.fromkeys(pids, 0))
+        pipe.execute()
+        indexed += len(pids)
+    return indexed
+
+
+@traced
+def backfill_games_log(redis_client: Redis, batch_size: int = 1000) -> int:
+    """Appends the recorded games missing from keys.GLOBAL_GAMES_LOG (i.e., ingested before it was kept) to the log, and
+    returns the number of games appended
+    NOTE: the ingest order of these games is unknown, so they are appended in an arbitrary order
+    """
+    logged = set(redis_client.lrange(keys.GLOBAL_GAMES_LOG, 0, -1))
+    appended = 0
+    for gids in __game_ids(redis_client, batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for gid in gids:
+            pipe.exists(keys.GAME_WINNER.format(gid=gid))  # scheduled games share the id set but have no winner
+        missing = [gid for gid, recorded in zip(gids, pipe.execute()) if recorded and gid not in logged]
+        if missing:
+            redis_client.rpush(keys.GLOBAL_GAMES_LOG, *missing)
+            appended += len(missing)
+    return appended
+
+
+@traced
+def backfill_profiles(redis_client: Redis, batch_size: int = 1000) -> int:
+    """Rebuilds the materialized profile (keys.PLAYER_PROFILE) of every player from the player keys, and returns the
+    number of profiles written
+    NOTE: the opponents of scheduled games whose PLAYER_SCHEDULED_GAME_OPPONENT key has expired are not known, so those
+    games are left out
+    """
+    profile_backend = profiles.backend(redis_client)
+    written = 0
+    for pids in __batches(redis_client.sscan_iter(keys.GLOBAL_PLAYERS_IDS, count=batch_size), batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for pid in pids:
+            pipe.get(keys.PLAYER_EMAIL.format(pid=pid))
+            pipe.get(keys.PLAYER_WINS.format(pid=pid))
+            pipe.get(keys.PLAYER_LOSSES.format(pid=pid))
+            pipe.get(keys.PLAYER_DRAWS.format(pid=pid))
+            pipe.get(keys.PLAYER_MOST_FREQ_OPENING.format(pid=pid))
+            pipe.get(keys.PLAYER_FRIEND_GROUP.format(pid=pid))
+            pipe.lrange(keys.PLAYER_GAMES_LIST.format(pid=pid), -config.PROFILE_WINDOW, -1)
+            pipe.lrange(keys.PLAYER_SCHEDULED_GAMES.format(pid=pid), 0, -1)
+        values = pipe.execute()
+
+        player_profiles = []
+        for i, pid in enumerate(pids):
+            email, wins, losses, draws, most_freq_opening, friend_group, recent_gids, scheduled_gids = \
+                values[8 * i:8 * i + 8]
+            profile = profiles.empty_profile(pid, email)
+            profile.update({
+                "wins": int(wins or 0),
+                "losses": int(losses or 0),
+                "draws": int(draws or 0),
+                "most_freq_opening": most_freq_opening,
+                "friend_group": friend_group,
+            })
+            player_profiles.append((profile, recent_gids[::-1], scheduled_gids))
+
+        pipe = redis_client.pipeline(transaction=False)
+        for profile, recent_gids, scheduled_gids in player_profiles:
+            for gid in recent_gids:
+                pipe.get(keys.GAME_WHITE_PLAYER.format(gid=gid))
+                pipe.get(keys.GAME_BLACK_PLAYER.format(gid=gid))
+                pipe.get(keys.GAME_WINNER.format(gid=gid))
+                pipe.get(keys.GAME_OPENING_ECO.format(gid=gid))
+                pipe.get(keys.GAME_TURNS.format(gid=gid))
+            for gid in scheduled_gids:
+                pipe.get(keys.PLAYER_SCHEDULED_GAME_OPPONENT.format(pid=profile["user_id"], gid=gid))
+        values = iter(pipe.execute())
+
+        pipe = redis_client.pipeline(transaction=False)
+        for profile, recent_gids, scheduled_gids in player_profiles:
+            for gid in recent_gids:
+                white, black, winner, opening_eco, number_of_turns = (next(values) for _ in range(5))
+                color, opponent = ("white", black) if white == profile["user_id"] else ("black", white)
+                profile["recent_games"].append({
+                    "game_id": gid,
+                    "color": color,
+                    "opponent": opponent,
+                    "result": "win" if winner == color else "draw" if winner not in ("white", "black") else "loss",
+                    "opening_eco": opening_eco,
+                    "number_of_turns": int(number_of_turns),
+                })
+            for gid in scheduled_gids:
+                opponent = next(values)
+                if opponent is not None:
+                    profile["scheduled_games"].append({"game_id": gid, "opponent": opponent})
+            profiles.queue_replace(pipe, profile_backend, profile)
+        pipe.execute()
+        written += len(player_profiles)
+    return written
+
+
+@traced
+def backfill_histograms(redis_client: Redis, batch_size: int = 1000) -> int:
+    """Rebuilds the game distributions (the keys.ANALYTICS_*_HISTOGRAM and keys.ANALYTICS_*_OUTCOMES hashes, and
+    keys.ANALYTICS_GAMES_BY_TURNS) from the keys of every recorded game, and returns the number of games counted
+    """
+    histograms: Dict[str, Counter] = defaultdict(Counter)
+    distribution_keys = (
+        keys.ANALYTICS_TURNS_HISTOGRAM,
+        keys.ANALYTICS_CHECKS_HISTOGRAM,
+        keys.ANALYTICS_VICTORY_STATUS_OUTCOMES,
+        keys.ANALYTICS_OPENING_OUTCOMES,
+    )
+    redis_client.delete(keys.ANALYTICS_GAMES_BY_TURNS, *distribution_keys)
+    counted = 0
+    for gids in __game_ids(redis_client, batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for gid in gids:
+            pipe.get(keys.GAME_WINNER.format(gid=gid))
+            pipe.get(keys.GAME_VICTORY_STATUS.format(gid=gid))
+            pipe.get(keys.GAME_TURNS.format(gid=gid))
+            pipe.get(keys.GAME_CHECKS.format(gid=gid))
+            pipe.get(keys.GAME_OPENING_ECO.format(gid=gid))
+        values = pipe.execute()
+
+        games_by_turns = {}
+        for i, gid in enumerate(gids):
+            winner, victory_status, number_of_turns, number_of_checks, opening_eco = values[5 * i:5 * i + 5]
+            if winner is None:  # scheduled games share the id set but have no winner
+                continue
+            number_of_turns, number_of_checks = int(number_of_turns), int(number_of_checks)
+            turns_bucket = keys.histogram_bucket(number_of_turns, config.HISTOGRAM_TURNS_BUCKET)
+            checks_bucket = keys.histogram_bucket(number_of_checks, config.HISTOGRAM_CHECKS_BUCKET)
+            histograms[keys.ANALYTICS_TURNS_HISTOGRAM][turns_bucket] += 1
+            histograms[keys.ANALYTICS_CHECKS_HISTOGRAM][checks_bucket] += 1
+            histograms[keys.ANALYTICS_VICTORY_STATUS_OUTCOMES][f"{victory_status}:{winner}"] += 1
+            histograms[keys.ANALYTICS_OPENING_OUTCOMES][f"{opening_eco}:{winner}"] += 1
+            games_by_turns[gid] = number_of_turns
+        if games_by_turns:
+            redis_client.zadd(keys.ANALYTICS_GAMES_BY_TURNS, games_by_turns)
+            counted += len(games_by_turns)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for key, counts in histograms.items():
+        pipe.hset(key, mapping=counts)
+    pipe.execute()
+    return counted
+
+
+def __most_freq_opening(counts: Counter) -> Tuple[str, int]:
+    """Returns the most frequently used opening of `counts` and its count, with ties broken by ascending ECO code (as
+    `rankings.leader`)
+    """
+    return min(counts.items(), key=lambda pair: (-pair[1], pair[0]))
+
+
+@traced
+def backfill_openings(redis_client: Redis, batch_size: int = 1000) -> int:
+    """Rebuilds the opening rankings (keys.PLAYER_OPENINGS_RANKING and keys.GLOBAL_OPENINGS_RANKING) from the keys of
+    every recorded game, sets the most frequently used openings derived from them (keys.PLAYER_MOST_FREQ_OPENING,
+    keys.ANALYTICS_MOST_FREQ_OPENING, and the `most_freq_opening` of the profiles), deletes the per-opening counters
+    of databases loaded before the rankings (see LEGACY_OPENING_COUNT_PATTERNS), and returns the number of games counted
+    """
+    player_counts: Dict[str, Counter] = defaultdict(Counter)
+    global_counts: Counter = Counter()
+    counted = 0
+    for gids in __game_ids(redis_client, batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for gid in gids:
+            pipe.get(keys.GAME_WHITE_PLAYER.format(gid=gid))
+            pipe.get(keys.GAME_BLACK_PLAYER.format(gid=gid))
+            pipe.get(keys.GAME_OPENING_ECO.format(gid=gid))
+        values = pipe.execute()
+        for i in range(len(gids)):
+            white, black, opening_eco = values[3 * i:3 * i + 3]
+            if opening_eco is None:  # scheduled games share the id set but have no game keys
+                continue
+            player_counts[white][opening_eco] += 1
+            player_counts[black][opening_eco] += 1
+            global_counts[opening_eco] += 1
+            counted += 1
+
+    for pattern in LEGACY_OPENING_COUNT_PATTERNS:
+        for legacy_keys in __batches(redis_client.scan_iter(match=pattern, count=batch_size), batch_size):
+            redis_client.delete(*legacy_keys)
+
+    profile_backend = profiles.backend(redis_client)
+    for pids in __batches(redis_client.sscan_iter(keys.GLOBAL_PLAYERS_IDS, count=batch_size), batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for pid in pids:
+            pipe.delete(keys.PLAYER_OPENINGS_RANKING.format(pid=pid))
+            if player_counts[pid]:
+                most_freq_opening, count = __most_freq_opening(player_counts[pid])
+                pipe.zadd(keys.PLAYER_OPENINGS_RANKING.format(pid=pid), player_counts[pid])
+                cluster.mset(pipe, {
+                    keys.PLAYER_MOST_FREQ_OPENING.format(pid=pid): most_freq_opening,
+                    keys.PLAYER_MOST_FREQ_OPENING_COUNT.format(pid=pid): count,
+                })
+                profiles.queue_fields(pipe, profile_backend, pid, {"most_freq_opening": most_freq_opening})
+        pipe.execute()
+
+    redis_client.delete(keys.GLOBAL_OPENINGS_RANKING)
+    if global_counts:
+        most_freq_opening, count = __most_freq_opening(global_counts)
+        redis_client.zadd(keys.GLOBAL_OPENINGS_RANKING, global_counts)
+        redis_client.mset({
+            keys.ANALYTICS_MOST_FREQ_OPENING: most_freq_opening,
+            keys.ANALYTICS_MOST_FREQ_OPENING_COUNT: count,
+        })
+    return counted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild derived indexes from the recorded games")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("head-to-head", help="rebuild the head-to-head game sets and records")
+    subparsers.add_parser("opening-tree", help="rebuild the opening explorer tree")
+    subparsers.add_parser("game-bitmaps", help="convert the game sets to bitmaps")
+    subparsers.add_parser("directory", help="rebuild the player directory")
+    subparsers.add_parser("games-log", help="append the games missing from the ingest log")
+    subparsers.add_parser("profiles", help="rebuild the materialized player profiles")
+    subparsers.add_parser("histograms", help="rebuild the game distribution histograms and cross-tabulations")
+    subparsers.add_parser("openings", help="rebuild the opening rankings and the most frequently used openings")
+    args = parser.parse_args()
+
+    redis_client = get_redis_client()
+    if args.command == "head-to-head":
+        print(f"rebuilt the head-to-head index of {backfill_head_to_head(redis_client)} pair(s) of opponents")
+    elif args.command == "opening-tree":
+        print(f"rebuilt {backfill_opening_tree(redis_client)} opening tree node(s)")
+    elif args.command == "game-bitmaps":
+        print(f"converted {backfill_game_bitmaps(redis_client)} game set(s)")
+    elif args.command == "directory":
+        print(f"indexed {backfill_player_directory(redis_client)} player(s) in the directory")
+    elif args.command == "games-log":
+        print(f"appended {backfill_games_log(redis_client)} game(s) to the ingest log")
+    elif args.command == "profiles":
+        print(f"rebuilt the profiles of {backfill_profiles(redis_client)} player(s)")
+    elif args.command == "histograms":
+        print(f"rebuilt the game distributions from {backfill_histograms(redis_client)} game(s)")
+    elif args.command == "openings":
+        print(f"rebuilt the opening rankings from {backfill_openings(redis_client)} game(s)")
@@ -0,0 +1,143 @@
+"""cluster.py
+This file provides the multi-key operations used by the deliverables in a form that works against both a single Redis
+server and a Redis Cluster. Against a single server (or when every key hashes to the same slot) each function issues the
+native multi-key command. Otherwise, the work is scattered to the nodes owning each key and gathered client-side.
+
+To keep the data transferred small, set intersections/differences only fetch the members of one set and then check
+those members against the other sets with SMISMEMBER. Server-side merges of keys from different slots (e.g., PFMERGE)
+copy the sources into temporary keys sharing one slot with DUMP/RESTORE, while bitmaps from different slots are combined
+client-side.
+"""
+
+import uuid
+from typing import Dict, List, Set, Union
+
+from redis import Redis
+from redis.client import NEVER_DECODE, Pipeline
+from redis.cluster import ClusterPipeline, RedisCluster
+from redis.crc import key_slot
+
+import keys
+
+# expiry (in seconds) of the temporary keys holding intermediate results
+TMP_KEY_TTL = 60
+
+
+def is_cluster(redis_client: Union[Redis, Pipeline]) -> bool:
+    """Returns True if `redis_client` (a client or a pipeline) talks to a Redis Cluster"""
+    return isinstance(redis_client, (RedisCluster, ClusterPipeline))
+
+
+def _same_slot(names: List[str]) -> bool:
+    """Returns True if every key in `names` hashes to the same cluster slot"""
+    return len({key_slot(name.encode("utf-8")) for name in names}) <= 1
+
+
+def mset(redis_client: Union[Redis, Pipeline], mapping: Dict[str, object]) -> None:
+    """MSET that splits `mapping` per hash slot in cluster mode; `redis_client` may be a client or a pipeline
+    NOTE: in cluster mode the keys of different slots are not set atomically
+    """
+    if isinstance(redis_client, ClusterPipeline):
+        # NOTE: redis-py refuses to queue MSET on a cluster pipeline, even for keys of a single slot
+        for name, value in mapping.items():
+            redis_client.set(name, value)
+    elif not is_cluster(redis_client) or _same_slot(list(mapping)):
+        redis_client.mset(mapping)
+    else:
+        redis_client.mset_nonatomic(mapping)
+
+
+def _filter_members(redis_client: Redis, candidates: List[str], names: List[str], keep_if_member: bool) -> Set[str]:
+    """Keeps the `candidates` that are (or, if `keep_if_member` is False, are not) members of every set in `names`"""
+    if not candidates or not names:
+        return set(candidates)
+    pipe = redis_client.pipeline()
+    for name in names:
+        pipe.smismember(name, candidates)
+    memberships = pipe.execute()
+    return {
+        candidate
+        for i, candidate in enumerate(candidates)
+        if all(bool(membership[i]) == keep_if_member for membership in memberships)
+    }
+
+
+def sinter(redis_client: Redis, *names: str) -> Set[str]:
+    """SINTER that gathers the intersection client-side when the sets live in different cluster slots"""
+    if not is_cluster(redis_client) or _same_slot(list(names)):
+        return set(redis_client.sinter(*names))
+
+    pipe = redis_client.pipeline()
+    for name in names:
+        pipe.scard(name)
+    sizes = pipe.execute()
+    if min(sizes) == 0:
+        return set()
+
+    # only the smallest set is transferred; its members are then checked against the other sets
+    smallest = names[sizes.index(min(sizes))]
+    others = [name for name in names if name != smallest]
+    return _filter_members(redis_client, list(redis_client.smembers(smallest)), others, keep_if_member=True)
+
+
+def sdiff(redis_client: Redis, name: str, *others: str) -> Set[str]:
+    """SDIFF that gathers the difference client-side when the sets live in different cluster slots"""
+    if not is_cluster(redis_client) or _same_slot([name, *others]):
+        return set(redis_client.sdiff(name, *others))
+    return _filter_members(redis_client, list(redis_client.smembers(name)), list(others), keep_if_member=False)
+
+
+def pfcount_union(redis_client: Redis, names: List[str]) -> int:
+    """Returns the estimated cardinality of the union of the HyperLogLogs in `names` (missing keys count as empty),
+    merging them with PFMERGE into a temporary key
+    """
+    if not names:
+        return 0
+    token = uuid.uuid4().hex
+    destination = keys.TMP_KEY.format(token=token, name="union")
+
+    if not is_cluster(redis_client) or _same_slot([destination, *names]):
+        pipe = redis_client.pipeline()
+        pipe.pfmerge(destination, *names)
+        pipe.pfcount(destination)
+        pipe.delete(destination)
+        return pipe.execute()[1]
+
+    # NOTE: the keys are dumped one at a time, as raw (undecoded) replies cannot be requested on a cluster pipeline
+    dumps = [redis_client.execute_command("DUMP", name, **{NEVER_DECODE: True}) for name in names]
+    dumps = [dump for dump in dumps if dump is not None]
+    if not dumps:
+        return 0
+    sources = [keys.TMP_KEY.format(token=token, name=i) for i in range(len(dumps))]
+    pipe = redis_client.pipeline()
+    for source, dump in zip(sources, dumps):
+        pipe.restore(source, TMP_KEY_TTL * 1000, dump)
+    pipe.execute()
+    # NOTE: PFMERGE/PFCOUNT cannot be queued on a cluster pipeline
+    redis_client.pfmerge(destination, *sources)
+    redis_client.expire(destination, TMP_KEY_TTL)
+    count = redis_client.pfcount(destination)
+    redis_client.delete(destination, *sources)
+    return count
+
+
+def bitop_and(redis_client: Redis, *names: str) -> bytes:
+    """Returns the raw BITOP AND of the bitmaps in `names` (missing keys count as empty), computed in a temporary key,
+    or client-side when the bitmaps live in different cluster slots
+    """
+    destination = keys.TMP_KEY.format(token=uuid.uuid4().hex, name="and")
+    if not is_cluster(redis_client) or _same_slot([destination, *names]):
+        # NOTE: raw replies are not available within MULTI/EXEC, whose replies are decoded together
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.bitop("AND", destination, *names)
+        pipe.execute_command("GET", destination, **{NEVER_DECODE: True})
+        pipe.delete(destination)
+        return pipe.execute()[1] or b""
+
+    # NOTE: the bitmaps are read one at a time, as raw (undecoded) replies cannot be requested on a cluster pipeline
+    bitmaps = [redis_client.execute_command("GET", name, **{NEVER_DECODE: True}) or b"" for name in names]
+    length = min(len(bitmap) for bitmap in bitmaps)
+    result = int.from_bytes(bitmaps[0][:length], "big")
+    for bitmap in bitmaps[1:]:
+        result &= int.from_bytes(bitmap[:length], "big")
+    return result.to_bytes(length, "big")
@@ -0,0 +1,82 @@
+"""config.py
+This file provides the runtime settings shared by the deliverables. Every setting is read once, at import time, from an
+environment variable prefixed with "BGC_" so that the scripts can be reconfigured without editing any code.
+
+    Example: `BGC_INSTRUMENTATION=1 BGC_INSTRUMENTATION_SAMPLE_RATE=0.05 python load_transform.py`
+"""
+
+import os
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Reads a boolean environment variable; "1", "true", "yes", and "on" (case-insensitive) are truthy"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# redis connection
+REDIS_HOST = os.environ.get("BGC_REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("BGC_REDIS_PORT", "6379"))
+REDIS_DB   = int(os.environ.get("BGC_REDIS_DB", "0"))
+REDIS_CLUSTER = _env_bool("BGC_REDIS_CLUSTER", False)  # REDIS_HOST:REDIS_PORT is any node of the cluster
+
+# read routing to replicas (see routing.py); REDIS_REPLICAS are "host:port" addresses of replicas of the primary
+REDIS_REPLICAS         = [address for address in os.environ.get("BGC_REDIS_REPLICAS", "").split(",") if address]
+REPLICA_MAX_LAG_BYTES  = int(os.environ.get("BGC_REPLICA_MAX_LAG_BYTES", "1048576"))
+REPLICA_REFRESH_MS     = int(os.environ.get("BGC_REPLICA_REFRESH_MS", "1000"))
+
+# label of the current bulk load; when set, distinct statistics are also tracked per load (e.g., GLOBAL_LOAD_SEQS_HLL)
+LOAD_ID = os.environ.get("BGC_LOAD_ID")
+
+# instrumentation (see instrumentation.py)
+INSTRUMENTATION_ENABLED      = _env_bool("BGC_INSTRUMENTATION", False)
+INSTRUMENTATION_SAMPLE_RATE  = float(os.environ.get("BGC_INSTRUMENTATION_SAMPLE_RATE", "1.0"))
+INSTRUMENTATION_DUMP_PATH    = os.environ.get("BGC_INSTRUMENTATION_DUMP_PATH")
+INSTRUMENTATION_HTTP_PORT    = int(os.environ.get("BGC_INSTRUMENTATION_HTTP_PORT", "0"))  # 0 = no HTTP endpoint
+
+# streams ingest (see ingest_stream.py)
+INGEST_BATCH_SIZE    = int(os.environ.get("BGC_INGEST_BATCH_SIZE", "100"))
+INGEST_BLOCK_MS      = int(os.environ.get("BGC_INGEST_BLOCK_MS", "5000"))
+INGEST_CLAIM_IDLE_MS = int(os.environ.get("BGC_INGEST_CLAIM_IDLE_MS", "60000"))
+
+# three-move sequence statistics (see seq_sketch.py)
+SEQ_STATS_MODE           = os.environ.get("BGC_SEQ_STATS_MODE", "exact")  # "exact" or "approx"
+SEQ_SKETCH_BACKEND       = os.environ.get("BGC_SEQ_SKETCH_BACKEND", "redisbloom")  # "redisbloom" or "python"
+SEQ_SKETCH_ERROR         = float(os.environ.get("BGC_SEQ_SKETCH_ERROR", "0.0001"))  # overestimate <= error * total
+SEQ_SKETCH_PROBABILITY   = float(os.environ.get("BGC_SEQ_SKETCH_PROBABILITY", "0.01"))  # chance of exceeding it
+SEQ_TOPK                 = int(os.environ.get("BGC_SEQ_TOPK", "50"))
+SEQ_GAMES_MIN_COUNT      = int(os.environ.get("BGC_SEQ_GAMES_MIN_COUNT", "0"))
+
+# opening explorer (see game_funcs.opening_explorer)
+OPENING_TREE_DEPTH = int(os.environ.get("BGC_OPENING_TREE_DEPTH", "10"))  # plies per game; 0 = no opening tree
+
+# incremental reloads (see load_transform.py --incremental)
+LOAD_CHUNK_SIZE = int(os.environ.get("BGC_LOAD_CHUNK_SIZE", "10000"))  # CSV rows per fingerprinted chunk
+
+# game sets (see game_bitmaps.py)
+GAME_SETS_ENCODING         = os.environ.get("BGC_GAME_SETS_ENCODING", "set")  # "set" or "bitmap"
+GAME_SETS_BITMAP_MIN_GAMES = int(os.environ.get("BGC_GAME_SETS_BITMAP_MIN_GAMES", "128"))  # smaller sets stay sets
+
+# cold-tier archive of the game moves (see archive.py)
+ARCHIVE_DIR         = os.environ.get(
+    "BGC_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "archive"))
+ARCHIVE_KEEP_RECENT = int(os.environ.get("BGC_ARCHIVE_KEEP_RECENT", "10000"))  # most recent games kept in redis
+
+# Elo ratings (see ratings.py); run `python ratings.py` to recompute the ratings after changing these
+RATING_INITIAL = float(os.environ.get("BGC_RATING_INITIAL", "1500"))
+RATING_K       = float(os.environ.get("BGC_RATING_K", "32"))  # maximum rating change per game
+
+# write-behind buffer of the hot global writes (see write_buffer.py and write_funcs.enable_write_buffer)
+WRITE_BUFFER_MAX_PENDING  = int(os.environ.get("BGC_WRITE_BUFFER_MAX_PENDING", "10000"))  # buffered writes per flush
+WRITE_BUFFER_MAX_DELAY_MS = int(os.environ.get("BGC_WRITE_BUFFER_MAX_DELAY_MS", "1000"))  # max delay of a write
+
+# game distribution histograms (see analytics_funcs.py); run `python backfill_funcs.py histograms` after changing these
+HISTOGRAM_TURNS_BUCKET  = int(os.environ.get("BGC_HISTOGRAM_TURNS_BUCKET", "10"))  # turns per bucket
+HISTOGRAM_CHECKS_BUCKET = int(os.environ.get("BGC_HISTOGRAM_CHECKS_BUCKET", "1"))  # checks per bucket
+
+# materialized player profiles (see profiles.py)
+PROFILE_BACKEND = os.environ.get("BGC_PROFILE_BACKEND", "auto")  # "auto", "json", or "hash"
+PROFILE_WINDOW  = int(os.environ.get("BGC_PROFILE_WINDOW", "10"))  # recent (and scheduled) games kept per profile
@@ -0,0 +1,53 @@
+"""connection.py
+This file provides the single place where the deliverables create their Redis clients, so that deployment-specific
+behavior (see config.py) is applied consistently by every script.
+"""
+
+from redis import Redis
+from redis.cluster import RedisCluster
+
+import config
+from instrumentation import InstrumentedRedis
+from routing import ReplicaRouter, RoutedRedis
+
+
+def __standalone_client(host: str, port: int) -> Redis:
+    """Returns a client for the standalone Redis server at `host:port`, instrumented if enabled"""
+    if config.INSTRUMENTATION_ENABLED:
+        return InstrumentedRedis(
+            host=host,
+            port=port,
+            db=config.REDIS_DB,
+            decode_responses=True,
+            sample_rate=config.INSTRUMENTATION_SAMPLE_RATE)
+    return Redis(host=host, port=port, db=config.REDIS_DB, decode_responses=True)
+
+
+def get_redis_client() -> Redis:
+    """Returns a client for the configured Redis server
+    NOTE: `decode_responses` is set to True so that bytes are automatically converted to str
+    NOTE: in cluster mode, a `RedisCluster` client is returned; its commands are not recorded by instrumentation.py
+    """
+    if config.REDIS_CLUSTER:
+        return RedisCluster(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+    return __standalone_client(config.REDIS_HOST, config.REDIS_PORT)
+
+
+def get_read_client() -> Redis:
+    """Returns a client for query functions, which sends read-only commands to the configured replicas (see routing.py)
+    and every other command to the primary; without replicas, this is the same client as `get_redis_client`
+    NOTE: in cluster mode, reads are spread over the replicas of each shard by `RedisCluster` itself
+    """
+    if config.REDIS_CLUSTER:
+        return RedisCluster(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            decode_responses=True,
+            read_from_replicas=True)
+    if not config.REDIS_REPLICAS:
+        return get_redis_client()
+    replicas = [
+        __standalone_client(host, int(port))
+        for host, port in (address.rsplit(":", 1) for address in config.REDIS_REPLICAS)
+    ]
+    return RoutedRedis(ReplicaRouter(get_redis_client(), replicas))
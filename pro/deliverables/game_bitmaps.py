@@ -0,0 +1,156 @@
+"""game_bitmaps.py
+This file provides the bitmap encoding of the game sets (per-player games and per-sequence games) used when
+`config.GAME_SETS_ENCODING` is "bitmap". Every recorded game is interned to a dense integer index (see
+keys.GLOBAL_GAMES_NEXT_INDEX). A game set starts as a Redis set of the indexes of its games (an intset, about 4 bytes
+per game). Once it holds at least `config.GAME_SETS_BITMAP_MIN_GAMES` games and at least 1 in 32 of the recorded games
+(so that its bitmap is no larger than its set), it is converted to a Redis bitmap, in which the bit at each game's index
+is set. Popular sequences and active players then cost one bit per recorded game and are intersected with BITOP AND,
+while the long tail of rare sequences stays a few bytes per game.
+
+Each game set is a `GameSet`: the key of its set of indexes and the key of its bitmap, of which at most one exists. The
+conversion is done by a Lua script, so that concurrent writers never add to a set that is being converted.
+
+Bit offsets follow the Redis convention: offset 0 is the most significant bit of the first byte.
+"""
+
+import hashlib
+from typing import Iterable, List, Tuple
+
+from redis import Redis
+from redis.client import NEVER_DECODE, Pipeline
+
+import cluster
+import config
+import keys
+
+# (key of the set of game indexes, key of the bitmap) of a game set
+GameSet = Tuple[str, str]
+
+# maximum number of game indexes passed to one call of the script (Lua's `unpack` is bounded by the C stack)
+ADD_BATCH_SIZE = 1000
+
+# adds the game indexes ARGV[3..] to the game set KEYS[1] (set of indexes) / KEYS[2] (bitmap), and converts the set to
+# the bitmap once it holds at least ARGV[2] games and 1 in 32 of the ARGV[1] recorded games
+__ADD_SCRIPT = """
+local indexes = {unpack(ARGV, 3)}
+if redis.call("EXISTS", KEYS[2]) == 0 then
+    redis.call("SADD", KEYS[1], unpack(indexes))
+    local games = redis.call("SCARD", KEYS[1])
+    if games < tonumber(ARGV[2]) or games * 32 < tonumber(ARGV[1]) then
+        return 0
+    end
+    indexes = redis.call("SMEMBERS", KEYS[1])
+    redis.call("DEL", KEYS[1])
+end
+for _, index in ipairs(indexes) do
+    redis.call("SETBIT", KEYS[2], index, 1)
+end
+return 1
+"""
+__ADD_SCRIPT_SHA = hashlib.sha1(__ADD_SCRIPT.encode("utf-8")).hexdigest()
+
+
+def player_game_set(pid: str) -> GameSet:
+    """Returns the game set of the games of the player `pid`"""
+    return keys.PLAYER_GAMES_INDEXES.format(pid=pid), keys.PLAYER_GAMES_BITMAP.format(pid=pid)
+
+
+def seq_game_set(seq: str) -> GameSet:
+    """Returns the game set of the games in which the three-move sequence `seq` was played"""
+    return keys.GLOBAL_SEQ_GAMES_INDEXES.format(seq=seq), keys.GLOBAL_SEQ_GAMES_BITMAP.format(seq=seq)
+
+
+def load_scripts(redis_client: Redis) -> None:
+    """Loads the script queued by `queue_add` (on every primary in cluster mode)
+    NOTE: call it before executing a pipeline onto which `queue_add` was called, as a cluster pipeline cannot load
+    scripts itself
+    """
+    redis_client.script_load(__ADD_SCRIPT)
+
+
+def reserve_indexes(redis_client: Redis, count: int) -> List[int]:
+    """Reserves `count` consecutive game indexes and returns them"""
+    if count <= 0:
+        return []
+    last = redis_client.incrby(keys.GLOBAL_GAMES_NEXT_INDEX, count)
+    return list(range(last - count, last))
+
+
+def queue_index_mapping(pipe: Pipeline, gid: str, index: int) -> None:
+    """Queues the writes mapping `gid` to its game index (and back) onto `pipe`"""
+    pipe.hset(keys.GLOBAL_GAMES_INDEXES, gid, index)
+    pipe.hset(keys.GLOBAL_GAMES_BY_INDEX, index, gid)
+
+
+def queue_add(pipe: Pipeline, game_set: GameSet, indexes: List[int], games: int) -> None:
+    """Queues the addition of the games `indexes` to `game_set` onto `pipe`, given the number of recorded games `games`
+    (the highest game index + 1)
+    """
+    for i in range(0, len(indexes), ADD_BATCH_SIZE):
+        pipe.execute_command(
+            "EVALSHA", __ADD_SCRIPT_SHA, 2, *game_set, games, config.GAME_SETS_BITMAP_MIN_GAMES,
+            *indexes[i:i + ADD_BATCH_SIZE])
+
+
+def get_bytes(redis_client: Redis, name: str) -> bytes:
+    """Returns the raw value of the bitmap at `name` (b"" if it does not exist), even if `redis_client` decodes
+    responses
+    """
+    return redis_client.execute_command("GET", name, **{NEVER_DECODE: True}) or b""
+
+
+def positions(bitmap: bytes) -> List[int]:
+    """Returns the offsets of the set bits of `bitmap`, in ascending order"""
+    return [
+        8 * byte_index + bit
+        for byte_index, byte in enumerate(bitmap)
+        if byte
+        for bit in range(8)
+        if byte & (0x80 >> bit)
+    ]
+
+
+def game_ids(redis_client: Redis, indexes: Iterable[int]) -> List[str]:
+    """Decodes the game ids of the game `indexes` with a single HMGET, sorted by game id"""
+    indexes = list(indexes)
+    if not indexes:
+        return []
+    return sorted(gid for gid in redis_client.hmget(keys.GLOBAL_GAMES_BY_INDEX, indexes) if gid is not None)
+
+
+def members(redis_client: Redis, game_set: GameSet) -> List[str]:
+    """Returns the game ids of `game_set`, sorted by game id"""
+    indexes_key, bitmap_key = game_set
+    indexes = [int(index) for index in redis_client.smembers(indexes_key)]
+    if not indexes:
+        indexes = positions(get_bytes(redis_client, bitmap_key))
+    return game_ids(redis_client, indexes)
+
+
+def intersection(redis_client: Redis, *game_sets: GameSet) -> List[str]:
+    """Returns the game ids present in every game set of `game_sets`, sorted by game id. Bitmaps are intersected with
+    BITOP AND, unless one of the game sets is still a set, whose games are then looked up in the bitmaps with GETBIT.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for indexes_key, _ in game_sets:
+        pipe.smembers(indexes_key)
+    candidates = None
+    bitmap_keys = []
+    for (_, bitmap_key), indexes in zip(game_sets, pipe.execute()):
+        if indexes:
+            indexes = {int(index) for index in indexes}
+            candidates = indexes if candidates is None else candidates & indexes
+        else:  # a bitmap, or an empty game set
+            bitmap_keys.append(bitmap_key)
+    if candidates is None:
+        return game_ids(redis_client, positions(cluster.bitop_and(redis_client, *bitmap_keys)))
+
+    candidates = sorted(candidates)
+    for bitmap_key in bitmap_keys:
+        if not candidates:
+            break
+        pipe = redis_client.pipeline(transaction=False)
+        for index in candidates:
+            pipe.getbit(bitmap_key, index)
+        candidates = [index for index, bit in zip(candidates, pipe.execute()) if bit]
+    return game_ids(redis_client, candidates)
@@ -0,0 +1,97 @@
+"""game_funcs.py
+This file contains the read functionalities needed to satisfy the board-game club's three-move sequence search
+requirements, as well as the opening explorer. To demonstrate these functionalities, this file may be invoked as a
+Python script to run example queries.
+
+Three-move sequences and opening lines are represented as comma-separated strings of moves in standard chess notation
+(e.g., "e4,c5,Nf3").
+"""
+
+from typing import Dict, List
+from typing_extensions import TypedDict
+
+from redis import Redis
+
+import cluster
+import config
+import game_bitmaps
+import keys
+from connection import get_read_client
+from instrumentation import traced
+
+
+class OpeningMoveTypedDict(TypedDict):
+    """Python typed dictionary representing one move of the opening explorer and the outcomes of the games that played
+    it (rates are percentages of `games`)
+    """
+    move: str
+    games: int
+    white: int
+    black: int
+    draw: int
+    white_rate: float
+    black_rate: float
+    draw_rate: float
+
+
+@traced
+def player_seq(r: Redis, pid: str, seq: str) -> List[str]:
+    """Requirement: List all games of an arbitrary player (P0) in which the three-move sequence `seq` was played."""
+    if config.GAME_SETS_ENCODING == "bitmap":
+        return game_bitmaps.intersection(r, game_bitmaps.seq_game_set(seq), game_bitmaps.player_game_set(pid))
+    return sorted(cluster.sinter(r, keys.GLOBAL_SEQ_GAMES.format(seq=seq), keys.PLAYER_GAMES_SET.format(pid=pid)))
+
+
+@traced
+def global_seq(r: Redis, seq: str) -> List[str]:
+    """Requirement: List all games in which the three-move sequence `seq` was played."""
+    if config.GAME_SETS_ENCODING == "bitmap":
+        return game_bitmaps.members(r, game_bitmaps.seq_game_set(seq))
+    return sorted(r.smembers(keys.GLOBAL_SEQ_GAMES.format(seq=seq)))
+
+
+@traced
+def opening_explorer(r: Redis, line: str = "") -> List[OpeningMoveTypedDict]:
+    """Lists the moves played after the opening line `line` ("" for the first move of the game) with their game counts
+    and outcome rates, most played first
+    NOTE: only the first `config.OPENING_TREE_DEPTH` plies of each game are tracked, so deeper lines have no moves
+    """
+    fields = r.hgetall(keys.OPENING_TREE_NODE.format(path=line))
+    tallies: Dict[str, Dict[str, int]] = {}
+    for field, count in fields.items():
+        move, outcome = field.rsplit(":", 1)
+        tallies.setdefault(move, {"games": 0, "white": 0, "black": 0, "draw": 0})[outcome] = int(count)
+
+    explorer: List[OpeningMoveTypedDict] = [
+        {
+            "move": move,
+            **tally,
+            "white_rate": 100.0 * tally["white"] / tally["games"],
+            "black_rate": 100.0 * tally["black"] / tally["games"],
+            "draw_rate": 100.0 * tally["draw"] / tally["games"],
+        }
+        for move, tally in tallies.items()
+    ]
+    return sorted(explorer, key=lambda entry: (-entry["games"], entry["move"]))
+
+
+if __name__ == "__main__":
+    redis_client = get_read_client()
+
+    print("Three-Move Sequence Query Demonstration")
+    print()
+
+    pid, seq = "evianwahter", "e4,c5,Nf3"
+    print(f"Games of '{pid}' containing '{seq}':")
+    print(player_seq(redis_client, pid, seq))
+    print()
+
+    seq = "Qxd6,Qe7,Bc5"
+    print(f"Games containing '{seq}':")
+    print(global_seq(redis_client, seq))
+    print()
+
+    line = "e4,c5,Nf3"
+    print(f"Moves played after '{line}':")
+    for entry in opening_explorer(redis_client, line):
+        print(entry)
@@ -7,9 +7,13 @@ from typing import List
 
 from redis import Redis
 
+import cluster
 import keys
+from connection import get_read_client
+from instrumentation import traced
 
 
+@traced
 def get_friends_of_friends(r: Redis, pid: str) -> List[str]:
     """Requirement: List the “friends of friends” of an arbitrary player (P0). Here, ”friends” refers to all opponents
     a given player has had.
@@ -21,13 +25,12 @@ def get_friends_of_friends(r: Redis, pid: str) -> List[str]:
     if fid is None:
         return []
 
-    fof_set = set(
-        r.sdiff(keys.GLOBAL_FRIEND_GROUP.format(fid=fid), keys.PLAYER_OPPONENTS.format(pid=pid))
-    )
+    fof_set = cluster.sdiff(r, keys.GLOBAL_FRIEND_GROUP.format(fid=fid), keys.PLAYER_OPPONENTS.format(pid=pid))
     fof_set.discard(pid)
     return list(fof_set)
 
 
+@traced
 def get_filtered_friends_of_friends(r: Redis, pid: str) -> List[str]:
     """Requirement: Filter the “friends of friends” query above to return only those players who have a higher total
     number of wins than P0.
@@ -50,6 +53,7 @@ def get_filtered_friends_of_friends(r: Redis, pid: str) -> List[str]:
     ]
 
 
+@traced
 def get_longest_connected_component() -> List[str]:
     """Requirement: For a graph where all vertices are players, and an edge exists between two verticies if the players
     have played a game against each other, what is the longest connected component?
@@ -58,7 +62,7 @@ def get_longest_connected_component() -> List[str]:
 
 
 if __name__ == "__main__":
-    redis_client = Redis(host="localhost", port=6379, db=0, decode_responses=True)
+    redis_client = get_read_client()
 
     print("Friends of Friends Query Demonstration")
     print()
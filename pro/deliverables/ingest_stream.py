@@ -0,0 +1,208 @@
+"""ingest_stream.py
+This file provides an asynchronous ingest mode for game records. Producers append each record to a Redis Stream with a
+single XADD (`enqueue_game_record`), and a pool of workers in a consumer group reads the stream in batches, applies each
+batch with `add_game_records`, then acknowledges (and deletes) the applied entries.
+
+Entries delivered to a worker that crashed (or whose batch failed) before acknowledging them stay in the group's pending
+entries list; any worker reclaims them with XAUTOCLAIM once they have been idle for `config.INGEST_CLAIM_IDLE_MS`
+milliseconds. Entries that can never be applied (see `write_funcs.validate_game_record`) are moved to the dead-letter
+stream keys.STREAM_DEAD_LETTERS, along with their entry id and error, instead of failing their batch.
+
+NOTE: `add_game_records` claims a `game_id` before writing the rest of the record, so a record whose worker crashed
+(e.g., lost its connection) midway through `add_game_records` is skipped as a duplicate when it is reclaimed, and must
+be repaired manually
+
+Usage:
+    python ingest_stream.py worker --workers 4   # run a pool of 4 consumer processes
+    python ingest_stream.py stats                # print queue depth, pending entries, and lag
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+from typing import Any, Dict, List, Tuple
+
+from redis import Redis
+from redis.exceptions import ResponseError
+
+import config
+import keys
+from connection import get_redis_client
+from instrumentation import traced
+from models import BoardGameClubInvalidRecordError, GameRecordTypedDict
+from write_funcs import add_game_records, validate_game_record
+
+CONSUMER_GROUP = "game-record-appliers"
+
+# seconds a worker waits before retrying after a failed batch
+WORKER_RETRY_DELAY = 1.0
+
+
+@traced
+def enqueue_game_record(redis_client: Redis, game_record: GameRecordTypedDict) -> str:
+    """Appends `game_record` to the ingest stream and returns the stream entry id"""
+    fields = dict(game_record)
+    if isinstance(fields["moveset"], list):
+        fields["moveset"] = json.dumps(fields["moveset"])
+    return redis_client.xadd(keys.STREAM_GAME_RECORDS, fields)
+
+
+def ensure_consumer_group(redis_client: Redis) -> None:
+    """Creates the ingest stream and its consumer group if they do not exist yet"""
+    try:
+        redis_client.xgroup_create(keys.STREAM_GAME_RECORDS, CONSUMER_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+@traced
+def consume_batch(
+        redis_client: Redis,
+        consumer: str,
+        count: int = config.INGEST_BATCH_SIZE,
+        block_ms: int = config.INGEST_BLOCK_MS) -> int:
+    """Applies at most `count` stream entries and returns the number of game records that were added. Entries abandoned
+    by crashed workers are reclaimed first; otherwise new entries are read, waiting up to `block_ms` for them to arrive.
+    """
+    _, entries, *_ = redis_client.xautoclaim(
+        keys.STREAM_GAME_RECORDS,
+        CONSUMER_GROUP,
+        consumer,
+        min_idle_time=config.INGEST_CLAIM_IDLE_MS,
+        start_id="0-0",
+        count=count)
+    if not entries:
+        response = redis_client.xreadgroup(
+            CONSUMER_GROUP,
+            consumer,
+            {keys.STREAM_GAME_RECORDS: ">"},
+            count=count,
+            block=block_ms)
+        entries = response[0][1] if response else []
+    if not entries:
+        return 0
+
+    # NOTE: entries deleted from the stream while pending are returned with no fields
+    game_records = []
+    dead_letters = []
+    for entry_id, fields in entries:
+        if not fields:
+            continue
+        try:
+            validate_game_record(fields)
+            game_records.append(fields)
+        except BoardGameClubInvalidRecordError as e:
+            dead_letters.append((entry_id, fields, str(e)))
+    if dead_letters:
+        __dead_letter(redis_client, dead_letters)
+    added = add_game_records(redis_client, game_records)
+
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xack(keys.STREAM_GAME_RECORDS, CONSUMER_GROUP, *entry_ids)
+    pipe.xdel(keys.STREAM_GAME_RECORDS, *entry_ids)
+    pipe.execute()
+    return len(added)
+
+
+@traced
+def __dead_letter(redis_client: Redis, dead_letters: List[Tuple[str, Dict[str, str], str]]) -> None:
+    """Moves the `(entry id, fields, error)` entries that cannot be applied to the dead-letter stream, and acknowledges
+    (and deletes) them in the ingest stream
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for entry_id, fields, error in dead_letters:
+        pipe.xadd(keys.STREAM_DEAD_LETTERS, {**fields, "entry_id": entry_id, "error": error})
+    entry_ids = [entry_id for entry_id, _, _ in dead_letters]
+    pipe.xack(keys.STREAM_GAME_RECORDS, CONSUMER_GROUP, *entry_ids)
+    pipe.xdel(keys.STREAM_GAME_RECORDS, *entry_ids)
+    pipe.execute()
+
+
+def run_worker(consumer: str) -> None:
+    """Consumes the ingest stream forever under the consumer name `consumer`; a failed batch is reported and left
+    pending, to be reclaimed once idle (see the module docstring)
+    """
+    redis_client = get_redis_client()
+    ensure_consumer_group(redis_client)
+    while True:
+        try:
+            consume_batch(redis_client, consumer)
+        except Exception:  # NOTE: keep the worker alive (e.g., through a failover); the batch is retried when reclaimed
+            traceback.print_exc()
+            time.sleep(WORKER_RETRY_DELAY)
+
+
+def __entry_age_seconds(entry_id: str) -> float:
+    """Returns the age of a stream entry, based on the millisecond timestamp embedded in its id"""
+    milliseconds = int(entry_id.split("-")[0])
+    return max(0.0, time.time() - milliseconds / 1000)
+
+
+@traced
+def get_ingest_stats(redis_client: Redis) -> Dict[str, Any]:
+    """Returns the ingest queue metrics:
+
+    - `depth`: entries in the stream (acknowledged entries are deleted, so this is the unapplied backlog)
+    - `pending`: entries delivered to a worker but not acknowledged yet
+    - `undelivered`: entries not delivered to any worker yet (None if the server cannot report it)
+    - `lag_seconds`: age of the oldest unapplied entry
+    - `consumers`: per-consumer pending counts and idle times (in milliseconds)
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xlen(keys.STREAM_GAME_RECORDS)
+    pipe.xrange(keys.STREAM_GAME_RECORDS, count=1)
+    pipe.xinfo_groups(keys.STREAM_GAME_RECORDS)
+    pipe.xinfo_consumers(keys.STREAM_GAME_RECORDS, CONSUMER_GROUP)
+    depth, oldest, groups, consumers = pipe.execute()
+
+    group = next((g for g in groups if g["name"] == CONSUMER_GROUP), {})
+    return {
+        "depth": depth,
+        "pending": group.get("pending", 0),
+        # NOTE: the `lag` field of XINFO GROUPS is only reported by Redis 7.0 and newer
+        "undelivered": group.get("lag"),
+        "lag_seconds": __entry_age_seconds(oldest[0][0]) if oldest else 0.0,
+        "consumers": {
+            c["name"]: {"pending": c["pending"], "idle_ms": c["idle"]}
+            for c in consumers
+        },
+    }
+
+
+def __consumer_name(index: int) -> str:
+    """Returns a consumer name that is unique across hosts and processes"""
+    return f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+
+def __worker_main(index: int) -> None:
+    """Entry point of a worker process"""
+    run_worker(__consumer_name(index))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Redis Streams ingest queue for game records")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="run a pool of consumer processes")
+    worker_parser.add_argument("--workers", type=int, default=1)
+    subparsers.add_parser("stats", help="print queue depth, pending entries, and lag")
+    args = parser.parse_args()
+
+    redis_client = get_redis_client()
+    ensure_consumer_group(redis_client)
+    if args.command == "stats":
+        print(json.dumps(get_ingest_stats(redis_client), indent=2))
+    else:
+        processes: List[multiprocessing.Process] = []
+        for i in range(args.workers):
+            process = multiprocessing.Process(target=__worker_main, args=(i,), daemon=True)
+            process.start()
+            processes.append(process)
+        print(f"started {args.workers} ingest worker(s); press Ctrl+C to stop")
+        for process in processes:
+            process.join()
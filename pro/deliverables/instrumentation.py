@@ -0,0 +1,259 @@
+"""instrumentation.py
+This file provides command-level instrumentation for the board-game club's Redis traffic. Every Redis command,
+round-trip, and (approximate) payload byte count is attributed to the innermost function decorated with `@traced` that
+was running when the command was sent (e.g., `add_game_record`, `__update_common_seqs`, `get_check_counts`).
+
+The collected metrics are exposed in the Prometheus text format, either through a dump file or through an HTTP
+endpoint. Round-trips are sampled with a configurable probability; sampled observations are weighted by the inverse of
+the sample rate so that the exported counters estimate the true totals.
+
+    Example:
+    redis_client = InstrumentedRedis(host="localhost", port=6379, decode_responses=True, sample_rate=0.1)
+    add_game_record(redis_client, game_record)
+    dump_prometheus("redis_metrics.prom")
+"""
+
+import functools
+import random
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple, TypeVar
+
+from redis import Redis
+from redis.client import Pipeline
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# upper bounds (in seconds) of the round-trip latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+UNATTRIBUTED = "unattributed"
+
+_current_function: ContextVar[str] = ContextVar("bgc_current_function", default=UNATTRIBUTED)
+
+
+def traced(func: F) -> F:
+    """Decorator that attributes every Redis command issued while `func` runs to `func.__name__`"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_function.set(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_function.reset(token)
+
+    return wrapper  # type: ignore[return-value]
+
+
+def _payload_size(value: Any) -> int:
+    """Approximates the number of bytes `value` occupies on the wire (RESP framing is not counted)"""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, (list, tuple, set)):
+        return sum(_payload_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_payload_size(k) + _payload_size(v) for k, v in value.items())
+    return len(str(value))
+
+
+class CommandMetrics:
+    """Thread-safe registry of the per-function command counts, round-trips, byte counts, and latency histograms"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._commands: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._roundtrips: Dict[str, float] = defaultdict(float)
+        self._request_bytes: Dict[str, float] = defaultdict(float)
+        self._response_bytes: Dict[str, float] = defaultdict(float)
+        self._latency_buckets: Dict[str, List[float]] = {}
+        self._latency_sum: Dict[str, float] = defaultdict(float)
+
+    def observe(
+            self,
+            function: str,
+            commands: List[str],
+            latency: float,
+            request_bytes: int,
+            response_bytes: int,
+            weight: float) -> None:
+        """Records a single round-trip carrying `commands` (one entry per command, e.g., a whole pipeline)"""
+        with self._lock:
+            for command in commands:
+                self._commands[(function, command)] += weight
+            self._roundtrips[function] += weight
+            self._request_bytes[function] += request_bytes * weight
+            self._response_bytes[function] += response_bytes * weight
+            counts = self._latency_buckets.setdefault(function, [0.0] * (len(self.buckets) + 1))
+            for i, upper_bound in enumerate(self.buckets):
+                if latency <= upper_bound:
+                    counts[i] += weight
+                    break
+            else:
+                counts[-1] += weight
+            self._latency_sum[function] += latency * weight
+
+    def reset(self) -> None:
+        """Discards every recorded observation"""
+        with self._lock:
+            self._commands.clear()
+            self._roundtrips.clear()
+            self._request_bytes.clear()
+            self._response_bytes.clear()
+            self._latency_buckets.clear()
+            self._latency_sum.clear()
+
+    def render_prometheus(self) -> str:
+        """Renders the recorded metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                "# HELP bgc_redis_commands_total Redis commands issued, by enclosing function and command",
+                "# TYPE bgc_redis_commands_total counter",
+            ]
+            for (function, command), count in sorted(self._commands.items()):
+                lines.append(f'bgc_redis_commands_total{{function="{function}",command="{command}"}} {count:g}')
+
+            for metric, help_text, values in (
+                    ("bgc_redis_roundtrips_total", "Redis round-trips, by enclosing function", self._roundtrips),
+                    ("bgc_redis_request_bytes_total", "Approximate request payload bytes, by enclosing function",
+                     self._request_bytes),
+                    ("bgc_redis_response_bytes_total", "Approximate response payload bytes, by enclosing function",
+                     self._response_bytes)):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for function, value in sorted(values.items()):
+                    lines.append(f'{metric}{{function="{function}"}} {value:g}')
+
+            lines.append("# HELP bgc_redis_roundtrip_latency_seconds Redis round-trip latency, by enclosing function")
+            lines.append("# TYPE bgc_redis_roundtrip_latency_seconds histogram")
+            for function, counts in sorted(self._latency_buckets.items()):
+                cumulative = 0.0
+                for upper_bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(
+                        f'bgc_redis_roundtrip_latency_seconds_bucket{{function="{function}",le="{upper_bound:g}"}} '
+                        f'{cumulative:g}')
+                cumulative += counts[-1]
+                lines.append(
+                    f'bgc_redis_roundtrip_latency_seconds_bucket{{function="{function}",le="+Inf"}} {cumulative:g}')
+                lines.append(
+                    f'bgc_redis_roundtrip_latency_seconds_sum{{function="{function}"}} '
+                    f'{self._latency_sum[function]:g}')
+                lines.append(f'bgc_redis_roundtrip_latency_seconds_count{{function="{function}"}} {cumulative:g}')
+            return "\n".join(lines) + "\n"
+
+
+METRICS = CommandMetrics()
+
+
+class InstrumentedPipeline(Pipeline):
+    """redis-py `Pipeline` that records each `execute` call as a single round-trip"""
+
+    def __init__(self, connection_pool, response_callbacks, transaction, shard_hint,
+                 metrics: CommandMetrics, sample_rate: float) -> None:
+        self.metrics = metrics
+        self.sample_rate = sample_rate
+        super().__init__(connection_pool, response_callbacks, transaction, shard_hint)
+
+    def execute(self, raise_on_error: bool = True) -> List[Any]:
+        if not self.command_stack or random.random() >= self.sample_rate:
+            return super().execute(raise_on_error)
+
+        commands = [str(args[0]).upper() for args, _ in self.command_stack]
+        request_bytes = sum(_payload_size(args) for args, _ in self.command_stack)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = super().execute(raise_on_error)
+            return response
+        finally:
+            self.metrics.observe(
+                _current_function.get(),
+                commands,
+                time.perf_counter() - start,
+                request_bytes,
+                _payload_size(response),
+                1.0 / self.sample_rate)
+
+
+class InstrumentedRedis(Redis):
+    """Drop-in replacement for `redis.Redis` that records every (sampled) command in `metrics`
+
+    NOTE: `sample_rate` is the probability that a given round-trip is recorded; 1.0 records everything
+    """
+
+    def __init__(self, *args, metrics: CommandMetrics = METRICS, sample_rate: float = 1.0, **kwargs) -> None:
+        if not 0.0 < sample_rate <= 1.0:
+            raise ValueError(f"sample_rate must be in (0, 1], got {sample_rate}")
+        self.metrics = metrics
+        self.sample_rate = sample_rate
+        super().__init__(*args, **kwargs)
+
+    def execute_command(self, *args, **options):
+        if random.random() >= self.sample_rate:
+            return super().execute_command(*args, **options)
+
+        start = time.perf_counter()
+        response = None
+        try:
+            response = super().execute_command(*args, **options)
+            return response
+        finally:
+            self.metrics.observe(
+                _current_function.get(),
+                [str(args[0]).upper()],
+                time.perf_counter() - start,
+                _payload_size(args),
+                _payload_size(response),
+                1.0 / self.sample_rate)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Any = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+            metrics=self.metrics,
+            sample_rate=self.sample_rate)
+
+
+def render_prometheus(metrics: CommandMetrics = METRICS) -> str:
+    """Returns the recorded metrics in the Prometheus text exposition format"""
+    return metrics.render_prometheus()
+
+
+def dump_prometheus(path: str, metrics: CommandMetrics = METRICS) -> None:
+    """Writes the recorded metrics, in the Prometheus text exposition format, to the file at `path`"""
+    with open(path, "w", encoding="utf-8") as dump_file:
+        dump_file.write(metrics.render_prometheus())
+
+
+def start_metrics_server(port: int, metrics: CommandMetrics = METRICS) -> ThreadingHTTPServer:
+    """Serves the recorded metrics at http://0.0.0.0:{port}/metrics from a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # keep scrapes out of the scripts' console output
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -7,26 +7,69 @@ Applies to all keys containing "{pid}", "{fid}", "{gid}", "{eco}", or "{seq}". T
 `str` function `.format` to substitute the parameters for concrete values.
 
     Example: `PLAYER_EMAIL.format(pid='example-pid')`
+
+Cluster Mode
+When `config.REDIS_CLUSTER` is enabled, the main parameter of every key family is wrapped in a Redis Cluster hash tag so
+that the keys of one player, game, sequence, etc. share a hash slot (e.g., `player:{example-pid}:email`), and all
+analytics keys share a single slot. Multi-key commands across different hash slots are handled by cluster.py.
 """
 
+from typing import Tuple
+
+from config import REDIS_CLUSTER
+
+
+def _hash_tag(*parameters: str) -> str:
+    """Returns the `{parameter}` placeholders (joined by ":"), wrapped in a hash tag when cluster mode is enabled"""
+    placeholders = ":".join("{" + parameter + "}" for parameter in parameters)
+    return "{{" + placeholders + "}}" if REDIS_CLUSTER else placeholders
+
+
+def _literal_hash_tag(value: str) -> str:
+    """Returns the literal `value`, wrapped in a hash tag when cluster mode is enabled"""
+    return "{" + value + "}" if REDIS_CLUSTER else value
+
+
+def unwrap_hash_tag(value: str) -> str:
+    """Returns a parameter value extracted from a key without its surrounding hash tag (if any)"""
+    if value.startswith("{") and value.endswith("}"):
+        return value[1:-1]
+    return value
+
+
+def canonical_pair(pid1: str, pid2: str) -> Tuple[str, str]:
+    """Returns the two player ids in the canonical `(pid_a, pid_b)` order used by the head-to-head keys"""
+    return (pid1, pid2) if pid1 <= pid2 else (pid2, pid1)
+
+
+def histogram_bucket(value: int, bucket_width: int) -> int:
+    """Returns the field of the histogram hashes (the lower bound of the `bucket_width`-wide bucket) counting `value`"""
+    return value // bucket_width * bucket_width
+
+
 # player
-PLAYER_PREFIX                  = "player:{pid}"
+PLAYER_PREFIX                  = "player:" + _hash_tag("pid")
 PLAYER_EMAIL                   = PLAYER_PREFIX + ":email"
 PLAYER_WINS                    = PLAYER_PREFIX + ":number_of_wins"
 PLAYER_LOSSES                  = PLAYER_PREFIX + ":number_of_losses"
 PLAYER_DRAWS                   = PLAYER_PREFIX + ":number_of_draws"
 PLAYER_GAMES_LIST              = PLAYER_PREFIX + ":games-list"
 PLAYER_GAMES_SET               = PLAYER_PREFIX + ":games-set"
+PLAYER_GAMES_INDEXES           = PLAYER_PREFIX + ":games-indexes"  # set: game indexes (see game_bitmaps.py)
+PLAYER_GAMES_BITMAP            = PLAYER_PREFIX + ":games-bitmap"
 PLAYER_OPPONENTS               = PLAYER_PREFIX + ":opponents"
-PLAYER_OPENING_COUNT           = PLAYER_PREFIX + ":openings:{eco}:count"
+PLAYER_OPPONENTS_HLL           = PLAYER_PREFIX + ":opponents:hll"
+PLAYER_OPENINGS_RANKING        = PLAYER_PREFIX + ":openings:ranking"
+PLAYER_OPENINGS_HLL            = PLAYER_PREFIX + ":openings:hll"
 PLAYER_MOST_FREQ_OPENING       = PLAYER_PREFIX + ":most_freq_opening"
 PLAYER_MOST_FREQ_OPENING_COUNT = PLAYER_PREFIX + ":most_freq_opening:count"
 PLAYER_FRIEND_GROUP            = PLAYER_PREFIX + ":friend_group"
 PLAYER_SCHEDULED_GAMES         = PLAYER_PREFIX + ":scheduled_games"
 PLAYER_SCHEDULED_GAME_OPPONENT = PLAYER_PREFIX + ":scheduled_games:{gid}:opponent"
+PLAYER_PROFILE                 = PLAYER_PREFIX + ":profile"  # materialized profile (see profiles.py)
 
 # game
-GAME_PREFIX          = "game:{gid}"
+GAME_PREFIX          = "game:" + _hash_tag("gid")
 GAME_WINNER          = GAME_PREFIX + ":winner"
 GAME_VICTORY_STATUS  = GAME_PREFIX + ":victory_status"
 GAME_TURNS           = GAME_PREFIX + ":number_of_turns"
@@ -36,19 +79,41 @@ GAME_BLACK_PLAYER    = GAME_PREFIX + ":black_player_id"
 GAME_OPENING_ECO     = GAME_PREFIX + ":opening_eco"
 GAME_MOVES           = GAME_PREFIX + ":moves"
 
+# head-to-head (parameters must be in canonical order, see `canonical_pair`)
+H2H_PREFIX = "h2h:" + _hash_tag("pid_a", "pid_b")
+H2H_GAMES  = H2H_PREFIX + ":games"
+H2H_RECORD = H2H_PREFIX + ":record"  # hash fields: "a_wins", "b_wins", "draws"
+
+# opening tree: one hash per position, where `path` is the comma-separated moves leading to it ("" for the starting
+# position) and the fields are "{move}:games", "{move}:white", "{move}:black", and "{move}:draw" for each next move
+OPENING_TREE_NODE = "opening_tree:" + _hash_tag("path")
+
 # global
-GLOBAL_PREFIX         = "global"
-GLOBAL_PLAYERS_EMAILS = GLOBAL_PREFIX + ":players:emails"
-GLOBAL_PLAYERS_IDS    = GLOBAL_PREFIX + ":players:ids"
-GLOBAL_GAMES_IDS      = GLOBAL_PREFIX + ":games:ids"
-GLOBAL_FRIEND_GROUP   = GLOBAL_PREFIX + ":friend_group:{fid}"
-GLOBAL_SEQ_PREFIX     = GLOBAL_PREFIX + ":seq:"
-GLOBAL_SEQ_GAMES      = GLOBAL_SEQ_PREFIX + "{seq}:games"
-GLOBAL_SEQ_COUNT      = GLOBAL_SEQ_PREFIX + "{seq}:count"
-GLOBAL_OPENING_COUNT  = GLOBAL_PREFIX + ":openings:{eco}:count"
+GLOBAL_PREFIX            = "global"
+GLOBAL_PLAYERS_EMAILS    = GLOBAL_PREFIX + ":players:emails"
+GLOBAL_PLAYERS_IDS       = GLOBAL_PREFIX + ":players:ids"
+GLOBAL_PLAYERS_BY_EMAIL  = GLOBAL_PREFIX + ":players:by_email"    # hash: email -> pid
+GLOBAL_PIDS_LEX          = GLOBAL_PREFIX + ":players:ids:lex"     # sorted set: every pid, with score 0
+GLOBAL_EMAILS_LEX        = GLOBAL_PREFIX + ":players:emails:lex"  # sorted set: every email, with score 0
+GLOBAL_GAMES_IDS         = GLOBAL_PREFIX + ":games:ids"
+GLOBAL_GAMES_LOG         = GLOBAL_PREFIX + ":games:log"  # list: game ids, in ingest order
+GLOBAL_GAMES_NEXT_INDEX  = GLOBAL_PREFIX + ":games:next_index"
+GLOBAL_GAMES_INDEXES     = GLOBAL_PREFIX + ":games:indexes"   # hash: game id -> game index (see game_bitmaps.py)
+GLOBAL_GAMES_BY_INDEX    = GLOBAL_PREFIX + ":games:by_index"  # hash: game index -> game id
+GLOBAL_FRIEND_GROUP      = GLOBAL_PREFIX + ":friend_group:" + _hash_tag("fid")
+GLOBAL_SEQ_PREFIX        = GLOBAL_PREFIX + ":seq:"
+GLOBAL_SEQ_GAMES         = GLOBAL_SEQ_PREFIX + _hash_tag("seq") + ":games"
+GLOBAL_SEQ_GAMES_INDEXES = GLOBAL_SEQ_PREFIX + _hash_tag("seq") + ":games-indexes"
+GLOBAL_SEQ_GAMES_BITMAP  = GLOBAL_SEQ_PREFIX + _hash_tag("seq") + ":games-bitmap"
+GLOBAL_SEQ_COUNT         = GLOBAL_SEQ_PREFIX + _hash_tag("seq") + ":count"
+GLOBAL_SEQS_SKETCH       = GLOBAL_PREFIX + ":seqs:count-min-sketch"
+GLOBAL_SEQS_TOPK         = GLOBAL_PREFIX + ":seqs:topk"
+GLOBAL_SEQS_HLL          = GLOBAL_PREFIX + ":seqs:hll"
+GLOBAL_LOAD_SEQS_HLL     = GLOBAL_PREFIX + ":loads:" + _hash_tag("load_id") + ":seqs:hll"
+GLOBAL_OPENINGS_RANKING  = GLOBAL_PREFIX + ":openings:ranking"
 
 # analytics
-ANALYTICS_PREFIX                  = "analytics"
+ANALYTICS_PREFIX                  = _literal_hash_tag("analytics")
 ANALYTICS_TOP_WINS                = ANALYTICS_PREFIX + ":top_wins"
 ANALYTICS_TOP_LOSSES              = ANALYTICS_PREFIX + ":top_losses"
 ANALYTICS_MOST_FREQ_OPENING       = ANALYTICS_PREFIX + ":most_freq_opening"
@@ -59,3 +124,32 @@ ANALYTICS_LEAST_COMMON_SEQS       = ANALYTICS_PREFIX + ":least_common_seqs"
 ANALYTICS_LEAST_COMMON_SEQ_COUNT  = ANALYTICS_PREFIX + ":least_common_seq:count"
 ANALYTICS_MOST_COMMON_SEQS        = ANALYTICS_PREFIX + ":most_common_seqs"
 ANALYTICS_MOST_COMMON_SEQ_COUNT   = ANALYTICS_PREFIX + ":most_common_seq:count"
+ANALYTICS_RATINGS                 = ANALYTICS_PREFIX + ":ratings"  # sorted set: pid -> Elo rating (see ratings.py)
+ANALYTICS_RATINGS_REBUILD         = ANALYTICS_PREFIX + ":ratings:rebuild"
+# game distributions: fixed-width histograms (hash: bucket lower bound -> games, see config.HISTOGRAM_*_BUCKET) and
+# cross-tabulations (hash: "{row}:{winner}" -> games)
+ANALYTICS_TURNS_HISTOGRAM         = ANALYTICS_PREFIX + ":histogram:number_of_turns"
+ANALYTICS_CHECKS_HISTOGRAM        = ANALYTICS_PREFIX + ":histogram:number_of_checks"
+ANALYTICS_VICTORY_STATUS_OUTCOMES = ANALYTICS_PREFIX + ":outcomes:victory_status"  # row: victory status
+ANALYTICS_OPENING_OUTCOMES        = ANALYTICS_PREFIX + ":outcomes:opening_eco"     # row: ECO code
+ANALYTICS_GAMES_BY_TURNS          = ANALYTICS_PREFIX + ":games_by_turns"  # sorted set: gid -> number of turns
+
+# incremental reloads (see load_transform.py), where `dataset` is the CSV file name
+LOAD_PREFIX        = "load:" + _hash_tag("dataset")
+LOAD_CHUNK_DIGESTS = LOAD_PREFIX + ":chunk_digests"  # hash: chunk index -> digest of the chunk's rows
+LOAD_ROW_DIGESTS   = LOAD_PREFIX + ":row_digests"    # hash: row id -> digest of the row
+
+# cold-tier archive of the game moves (see archive.py)
+ARCHIVE_PREFIX       = "archive"
+ARCHIVE_WATERMARK    = ARCHIVE_PREFIX + ":watermark"     # number of GLOBAL_GAMES_LOG entries archived
+ARCHIVE_NEXT_SEGMENT = ARCHIVE_PREFIX + ":next_segment"  # counter numbering the segment files
+ARCHIVE_INDEX        = ARCHIVE_PREFIX + ":index"         # hash: game id -> "{segment file}:{offset}:{length}"
+
+# streams
+STREAM_PREFIX       = "stream"
+STREAM_GAME_RECORDS = STREAM_PREFIX + ":game_records"
+STREAM_DEAD_LETTERS = STREAM_PREFIX + ":game_records:dead"  # entries that cannot be applied, with their error
+
+# temporary (intermediate results of multi-key queries; always created with an expiry)
+TMP_PREFIX = "tmp:" + _hash_tag("token")
+TMP_KEY    = TMP_PREFIX + ":{name}"
@@ -0,0 +1,173 @@
+"""keyspace_audit.py
+This file provides a memory audit of the Redis keyspace, broken down by the key patterns of keys.py. The keyspace is
+walked incrementally with SCAN (so the server is never blocked for long), every key is classified against the patterns,
+and the MEMORY USAGE and OBJECT ENCODING of up to `--samples` keys per pattern are sampled. The total bytes of each
+pattern are estimated from the average sampled size, and normalized by the number of recorded games to show how much
+each pattern grows per game.
+
+Keys that match no pattern are reported as "(unclassified)".
+
+Usage:
+    python keyspace_audit.py                          # print the report
+    python keyspace_audit.py --json audit.json        # also write the report as JSON, e.g., to track it over time
+    python keyspace_audit.py --samples 20 --pause-ms 5
+"""
+
+import argparse
+import itertools
+import json
+import re
+import string
+import time
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+from redis import Redis
+
+import cluster
+import keys
+from connection import get_redis_client
+from instrumentation import traced
+
+UNCLASSIFIED = "(unclassified)"
+
+
+def key_patterns() -> List[Tuple[str, Pattern]]:
+    """Returns a `(name, regex)` pair for every key template of keys.py, most specific (longest literal text) first"""
+    patterns = []
+    for name, template in vars(keys).items():
+        if not name.isupper() or not isinstance(template, str) or name.endswith("_PREFIX"):
+            continue
+        regex = ""
+        literal_length = 0
+        for literal, field, _, _ in string.Formatter().parse(template):
+            regex += re.escape(literal)
+            literal_length += len(literal)
+            if field is not None:
+                regex += "[^:]*"
+        patterns.append((literal_length, name, re.compile(regex + "$")))
+    patterns.sort(key=lambda pattern: -pattern[0])
+    return [(name, regex) for _, name, regex in patterns]
+
+
+def classify(patterns: List[Tuple[str, Pattern]], key: str) -> str:
+    """Returns the name of the first pattern of `patterns` matching `key`"""
+    for name, regex in patterns:
+        if regex.match(key):
+            return name
+    return UNCLASSIFIED
+
+
+def __used_memory(redis_client: Redis) -> Optional[int]:
+    """Returns the memory used by the server (by all primaries in cluster mode), if it can be read"""
+    if cluster.is_cluster(redis_client):
+        infos = redis_client.info("memory", target_nodes=redis_client.PRIMARIES)
+        return sum(info["used_memory"] for info in infos.values())
+    return redis_client.info("memory").get("used_memory")
+
+
+@traced
+def audit_keyspace(
+        redis_client: Redis,
+        samples: int = 100,
+        scan_count: int = 1000,
+        pause_ms: int = 0) -> Dict[str, Any]:
+    """Scans the whole keyspace and returns the memory report:
+
+    - `keys`: number of keys scanned
+    - `games`: number of recorded games (game keys with a winner), used for the per-game ratios
+    - `used_memory`: memory used by the server, for comparison with the estimated totals
+    - `patterns`: per-pattern `keys`, `sampled`, `avg_bytes`, `est_total_bytes`, `keys_per_game`, `bytes_per_game`, and
+      `encodings` (number of sampled keys per encoding), largest estimated total first
+
+    NOTE: keys created or deleted while the scan runs may be missed or counted twice
+    """
+    patterns = key_patterns()
+    counts: Dict[str, int] = {}
+    sizes: Dict[str, List[int]] = {}
+    encodings: Dict[str, Dict[str, int]] = {}
+
+    scanned = redis_client.scan_iter(count=scan_count)
+    while True:
+        batch = list(itertools.islice(scanned, scan_count))
+        if not batch:
+            break
+
+        sampled_keys: List[Tuple[str, str]] = []
+        for key in batch:
+            name = classify(patterns, key)
+            counts[name] = counts.get(name, 0) + 1
+            sizes.setdefault(name, [])
+            if counts[name] <= samples:
+                sampled_keys.append((name, key))
+        if sampled_keys:
+            pipe = redis_client.pipeline(transaction=False)
+            for _, key in sampled_keys:
+                pipe.memory_usage(key)
+                pipe.object("encoding", key)
+            replies = pipe.execute()
+            for i, (name, _) in enumerate(sampled_keys):
+                size, encoding = replies[2 * i:2 * i + 2]
+                if size is None:  # deleted since it was scanned
+                    continue
+                sizes[name].append(size)
+                encodings.setdefault(name, {})
+                encodings[name][encoding] = encodings[name].get(encoding, 0) + 1
+
+        if pause_ms:
+            time.sleep(pause_ms / 1000)
+
+    games = counts.get("GAME_WINNER", 0)
+    report_patterns = []
+    for name, count in counts.items():
+        avg_bytes = sum(sizes[name]) / len(sizes[name]) if sizes[name] else 0.0
+        report_patterns.append({
+            "pattern": name,
+            "template": getattr(keys, name, None),
+            "keys": count,
+            "sampled": len(sizes[name]),
+            "avg_bytes": avg_bytes,
+            "est_total_bytes": avg_bytes * count,
+            "keys_per_game": count / games if games else None,
+            "bytes_per_game": avg_bytes * count / games if games else None,
+            "encodings": encodings.get(name, {}),
+        })
+    report_patterns.sort(key=lambda pattern: -pattern["est_total_bytes"])
+    return {
+        "timestamp": time.time(),
+        "keys": sum(counts.values()),
+        "games": games,
+        "used_memory": __used_memory(redis_client),
+        "patterns": report_patterns,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Prints `report` (see `audit_keyspace`) as a table"""
+    print(f"{report['keys']} key(s), {report['games']} game(s), used_memory={report['used_memory']} bytes")
+    print(
+        f"{'pattern':<34} {'keys':>9} {'sampled':>7} {'avg B':>9} {'est. total B':>13} {'keys/game':>9} "
+        f"{'B/game':>9}  encodings")
+    for pattern in report["patterns"]:
+        per_game = pattern["keys_per_game"] is not None
+        print(
+            f"{pattern['pattern']:<34} {pattern['keys']:>9} {pattern['sampled']:>7} {pattern['avg_bytes']:>9.1f} "
+            f"{pattern['est_total_bytes']:>13.0f} "
+            f"{pattern['keys_per_game'] if per_game else float('nan'):>9.3f} "
+            f"{pattern['bytes_per_game'] if per_game else float('nan'):>9.1f}  "
+            f"{', '.join(f'{encoding}={count}' for encoding, count in sorted(pattern['encodings'].items()))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile Redis memory usage per keys.py key pattern")
+    parser.add_argument("--samples", type=int, default=100, help="keys sampled per pattern for MEMORY USAGE")
+    parser.add_argument("--scan-count", type=int, default=1000, help="COUNT hint of each SCAN call")
+    parser.add_argument("--pause-ms", type=int, default=0, help="pause between SCAN batches, to limit the load")
+    parser.add_argument("--json", metavar="PATH", help="also write the report to PATH as JSON")
+    args = parser.parse_args()
+
+    keyspace_report = audit_keyspace(get_redis_client(), args.samples, args.scan_count, args.pause_ms)
+    print_report(keyspace_report)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(keyspace_report, json_file, indent=2)
+        print(f"report written to {args.json}")
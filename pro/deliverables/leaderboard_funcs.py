@@ -0,0 +1,75 @@
+"""leaderboard_funcs.py
+This file contains the read functionalities needed to satisfy the board-game club's Leaderboard query requirements. The
+leaderboards are ordered by Elo rating (see ratings.py), so they reward strength rather than the number of games played.
+To demonstrate these functionalities, this file may be invoked as a Python script to run example queries.
+
+Ties are broken by ascending `user_id` (see rankings.py).
+"""
+
+from typing import List, Optional
+from typing_extensions import TypedDict
+
+from redis import Redis
+
+import keys
+import rankings
+from connection import get_read_client
+from instrumentation import traced
+
+
+class LeaderboardEntryTypedDict(TypedDict):
+    """Python typed dictionary representing a player's position on a leaderboard"""
+    player_id: str
+    rating: float
+
+
+@traced
+def top_10(r: Redis) -> List[LeaderboardEntryTypedDict]:
+    """Requirement: List the 10 highest-rated players, in descending rating order."""
+    return top_rated(r, 10)
+
+
+@traced
+def bottom_10(r: Redis) -> List[LeaderboardEntryTypedDict]:
+    """Requirement: List the 10 lowest-rated players, in ascending rating order."""
+    return [
+        {"player_id": pid, "rating": rating}
+        for pid, rating in rankings.bottom_k(r, keys.ANALYTICS_RATINGS, 10)
+    ]
+
+
+@traced
+def top_rated(r: Redis, k: int) -> List[LeaderboardEntryTypedDict]:
+    """Returns the `k` highest-rated players, in descending rating order"""
+    return [
+        {"player_id": pid, "rating": rating}
+        for pid, rating in rankings.top_k(r, keys.ANALYTICS_RATINGS, k)
+    ]
+
+
+@traced
+def player_rating_rank(r: Redis, pid: str) -> Optional[rankings.RankTypedDict]:
+    """Returns the rating, rank, and percentile of an arbitrary player (P0) among the rated players, or None if P0 has
+    not played a recorded game
+    """
+    return rankings.rank(r, keys.ANALYTICS_RATINGS, pid)
+
+
+if __name__ == "__main__":
+    redis_client = get_read_client()
+
+    print("Leaderboard Query Demonstration")
+    print()
+
+    print("Top 10 players by rating:")
+    for position, entry in enumerate(top_10(redis_client), start=1):
+        print(f"{position:>2}. {entry['player_id']} ({entry['rating']:.1f})")
+    print()
+
+    print("Bottom 10 players by rating:")
+    for position, entry in enumerate(bottom_10(redis_client), start=1):
+        print(f"{position:>2}. {entry['player_id']} ({entry['rating']:.1f})")
+    print()
+
+    pid = "shivangithegenius"
+    print(f"Rating rank of '{pid}': {player_rating_rank(redis_client, pid)}")
@@ -37,16 +37,46 @@ Expected `game_records.csv` Schema:
 | white_player_id | String       | The user_id of the player that was assigned the White pieces                  |
 | black_player_id | String       | The user_id of the player that was assigned the Black pieces                  |
 | opening_eco     | String       | A standardized code representing the opening moves                            |
+
+Incremental Reloads:
+With `--incremental`, each CSV dataset is read in chunks of `config.LOAD_CHUNK_SIZE` rows, and a digest of every chunk
+and row is kept in redis (see keys.LOAD_PREFIX). Chunks whose digest did not change since the previous reload are
+skipped; in the other chunks, only rows whose id was never loaded are applied. Rows whose id was loaded with different
+values are reported as modified and left untouched, as the write events only add new entities. The first incremental
+reload of a database bootstrapped without `--incremental` applies no rows and only records the digests.
+
+Usage:
+    python load_transform.py                 # bootstrap the database
+    python load_transform.py --incremental   # apply the rows added to the CSV datasets since the previous reload
+    python load_transform.py --write-buffer  # coalesce the hot global writes (see write_funcs.enable_write_buffer)
 """
 
+import argparse
 import csv
+import hashlib
 from pathlib import Path
-from typing import Callable, Dict
+from typing import Callable, Dict, List
+from typing_extensions import TypedDict
 
 from redis import Redis
 
+import config
+import keys
+from connection import get_redis_client
+from instrumentation import dump_prometheus, start_metrics_server
 from models import BoardGameClubLoadTransformError, BoardGameClubNotUniqueError, GameRecordTypedDict
-from write_funcs import add_game_record, add_player, add_schedule
+from write_funcs import (
+    add_game_record, add_game_records, add_players, add_schedule, disable_write_buffer, enable_write_buffer)
+
+
+class ReloadReportTypedDict(TypedDict):
+    """Python typed dictionary representing the outcome of an incremental reload of one CSV dataset"""
+    chunks: int
+    skipped_chunks: int
+    unchanged_rows: int
+    new_rows: int
+    applied_rows: int
+    modified_ids: List[str]
 
 
 def create_path_obj(path_str: str) -> Path:
@@ -85,33 +115,192 @@ def process_csv_file(path: Path, func: Callable[[Dict[str, str]], None]) -> None
                 func(dict(zip(header_row, row)))
 
 
+def process_csv_file_in_batches(
+        path: Path,
+        func: Callable[[List[Dict[str, str]]], object],
+        batch_size: int = config.LOAD_CHUNK_SIZE) -> None:
+    """Variant of `process_csv_file` that calls `func` with lists of at most `batch_size` rows"""
+    rows: List[Dict[str, str]] = []
+
+    def append_row(row: Dict[str, str]) -> None:
+        rows.append(row)
+        if len(rows) == batch_size:
+            func(rows[:])
+            rows.clear()
+
+    process_csv_file(path, append_row)
+    if rows:
+        func(rows)
+
+
+def __digest(data: bytes) -> str:
+    """Returns the fingerprint stored for a CSV row or chunk"""
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def process_csv_file_incrementally(
+        redis_client: Redis,
+        path: Path,
+        id_column: str,
+        apply_rows: Callable[[List[Dict[str, str]]], int]) -> ReloadReportTypedDict:
+    """Calls `apply_rows` with the rows of each changed chunk whose `id_column` value was never loaded, then records the
+    digests of the chunk and its rows; `apply_rows` should return the number of rows it added to the database
+    """
+    report: ReloadReportTypedDict = {
+        "chunks": 0,
+        "skipped_chunks": 0,
+        "unchanged_rows": 0,
+        "new_rows": 0,
+        "applied_rows": 0,
+        "modified_ids": [],
+    }
+    chunk_digests_key = keys.LOAD_CHUNK_DIGESTS.format(dataset=path.name)
+    row_digests_key = keys.LOAD_ROW_DIGESTS.format(dataset=path.name)
+    chunk_digests = redis_client.hgetall(chunk_digests_key)
+
+    def process_chunk(header_row: List[str], rows: List[List[str]]) -> None:
+        """Applies the new rows of one chunk, unless the chunk is unchanged"""
+        chunk_index = str(report["chunks"])
+        report["chunks"] += 1
+        row_digests = [__digest("\x1f".join(row).encode("utf-8")) for row in rows]
+        chunk_digest = __digest("\x1f".join([*header_row, *row_digests]).encode("utf-8"))
+        if chunk_digests.get(chunk_index) == chunk_digest:
+            report["skipped_chunks"] += 1
+            report["unchanged_rows"] += len(rows)
+            return
+
+        records = [dict(zip(header_row, row)) for row in rows]
+        stored_digests = redis_client.hmget(row_digests_key, [record[id_column] for record in records])
+        known: Dict[str, str] = {}
+        new_records = []
+        modified = False
+        for record, row_digest, stored_digest in zip(records, row_digests, stored_digests):
+            row_id = record[id_column]
+            known_digest = known.get(row_id, stored_digest)
+            if known_digest is None:
+                known[row_id] = row_digest
+                new_records.append(record)
+                report["new_rows"] += 1
+            elif known_digest == row_digest:
+                report["unchanged_rows"] += 1
+            else:
+                modified = True
+                report["modified_ids"].append(row_id)
+
+        report["applied_rows"] += apply_rows(new_records) if new_records else 0
+        pipe = redis_client.pipeline(transaction=False)
+        if known:
+            pipe.hset(row_digests_key, mapping=known)
+        # a chunk with modified rows is not recorded, so that they are reported again by the next reload
+        if not modified:
+            pipe.hset(chunk_digests_key, chunk_index, chunk_digest)
+        pipe.execute()
+
+    with open(path) as csv_file:
+        csv_reader = csv.reader(csv_file)
+        header_row = next(csv_reader, [])
+        rows: List[List[str]] = []
+        for row in csv_reader:
+            rows.append(row)
+            if len(rows) == config.LOAD_CHUNK_SIZE:
+                process_chunk(header_row, rows)
+                rows = []
+        if rows:
+            process_chunk(header_row, rows)
+    return report
+
+
+def __add_each(
+        redis_client: Redis,
+        add: Callable[[Redis, Dict[str, str]], None]) -> Callable[[List[Dict[str, str]]], int]:
+    """Returns an `apply_rows` function for `process_csv_file_incrementally` that calls `add` for each row, ignoring the
+    rows whose id is already taken
+    """
+    def apply_rows(rows: List[Dict[str, str]]) -> int:
+        added = 0
+        for row in rows:
+            try:
+                add(redis_client, row)
+                added += 1
+            except BoardGameClubNotUniqueError:
+                pass
+        return added
+    return apply_rows
+
+
+def print_reload_report(path: Path, report: ReloadReportTypedDict) -> None:
+    """Prints the outcome of an incremental reload of the CSV dataset at `path`"""
+    print(
+        f"completed reloading {path.name}: {report['skipped_chunks']}/{report['chunks']} chunk(s) unchanged, "
+        f"{report['unchanged_rows']} unchanged row(s), {report['new_rows']} new row(s) "
+        f"({report['applied_rows']} added), {len(report['modified_ids'])} modified row(s)")
+    if report["modified_ids"]:
+        print(f"  modified (not applied): {', '.join(report['modified_ids'])}")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the board-game club's CSV datasets into redis")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only apply the rows added since the previous reload, and report the modified rows")
+    parser.add_argument(
+        "--write-buffer",
+        action="store_true",
+        help="buffer the writes to the hottest global keys and flush them in aggregate")
+    args = parser.parse_args()
+
     players_csv_path = create_path_obj("players.csv")
     schedule_csv_path = create_path_obj("schedule.csv")
     game_records_csv_path = create_path_obj("game_records.csv")
 
-    redis_client = Redis(host="localhost", port=6379, db=0, decode_responses=True)
-    # decode_responses is set to True so that bytes are automatically converted to str
+    redis_client = get_redis_client()
     try:
         redis_client.ping()
         print("connection to redis successful: initial PING succeeded")
     except Exception as e:
         raise BoardGameClubLoadTransformError("no connection to redis: initial PING failed") from e
 
-    process_csv_file(players_csv_path, lambda row: add_player(redis_client, row))
-    print(f"completed processing {players_csv_path.name}")
+    if config.INSTRUMENTATION_ENABLED and config.INSTRUMENTATION_HTTP_PORT:
+        start_metrics_server(config.INSTRUMENTATION_HTTP_PORT)
+        print(f"serving redis metrics at http://localhost:{config.INSTRUMENTATION_HTTP_PORT}/metrics")
+
+    if args.write_buffer:
+        enable_write_buffer(redis_client)
+
+    if args.incremental:
+        for path, id_column, apply_rows in (
+                (players_csv_path, "user_id", lambda rows: len(add_players(redis_client, rows))),
+                (schedule_csv_path, "game_id", __add_each(redis_client, add_schedule)),
+                (game_records_csv_path, "game_id", lambda rows: len(add_game_records(redis_client, rows)))):
+            print_reload_report(path, process_csv_file_incrementally(redis_client, path, id_column, apply_rows))
+    else:
+        process_csv_file_in_batches(players_csv_path, lambda rows: add_players(redis_client, rows))
+        print(f"completed processing {players_csv_path.name}")
+
+        process_csv_file(schedule_csv_path, lambda row: add_schedule(redis_client, row))
+        print(f"completed processing {schedule_csv_path.name}")
+
+        def process_game_records_csv(row: GameRecordTypedDict) -> None:
+            """Composes more complex behavior for the process_csv_file call for game_records.csv"""
+            try:
+                add_game_record(redis_client, row)
+            except BoardGameClubNotUniqueError:
+                # duplicate rows will be ignored since the duplicate game_ids seem to relate to the same exact
+                # information
+                # print(f"DUPLICATE: {row['game_id']}")
+                pass
+
+        process_csv_file(game_records_csv_path, lambda row: process_game_records_csv(row))
+        print(f"completed processing {game_records_csv_path.name}")
 
-    process_csv_file(schedule_csv_path, lambda row: add_schedule(redis_client, row))
-    print(f"completed processing {schedule_csv_path.name}")
+    # flushes the buffered writes, if any
+    disable_write_buffer()
 
-    def process_game_records_csv(row: GameRecordTypedDict) -> None:
-        """Composes more complex behavior for the process_csv_file call for game_records.csv"""
-        try:
-            add_game_record(redis_client, row)
-        except BoardGameClubNotUniqueError:
-            # duplicate rows will be ignored since the duplicate game_ids seem to relate to the same exact information
-            # print(f"DUPLICATE: {row['game_id']}")
-            pass
+    if config.LOAD_ID:
+        distinct_sequences = redis_client.pfcount(keys.GLOBAL_LOAD_SEQS_HLL.format(load_id=config.LOAD_ID))
+        print(f"~{distinct_sequences} distinct three-move sequences recorded in load {config.LOAD_ID}")
 
-    process_csv_file(game_records_csv_path, lambda row: process_game_records_csv(row))
-    print(f"completed processing {game_records_csv_path.name}")
+    if config.INSTRUMENTATION_ENABLED and config.INSTRUMENTATION_DUMP_PATH:
+        dump_prometheus(config.INSTRUMENTATION_DUMP_PATH)
+        print(f"redis metrics written to {config.INSTRUMENTATION_DUMP_PATH}")
@@ -47,3 +47,9 @@ class BoardGameClubWriteError(BoardGameClubRootError):
 
 class BoardGameClubNotUniqueError(BoardGameClubWriteError):
     """Custom exception class: the user attempted to create an entity using an existing identifier"""
+
+class BoardGameClubInvalidRecordError(BoardGameClubWriteError):
+    """Custom exception class: the record cannot be written (e.g., a game record whose moveset cannot be parsed)"""
+
+class BoardGameClubConfigError(BoardGameClubRootError):
+    """Custom exception class: the requested operation is not available with the current configuration (config.py)"""
@@ -0,0 +1,144 @@
+"""player_funcs.py
+This file contains the read functionalities needed to satisfy the board-game club's Player-Centric query requirements.
+To demonstrate these functionalities, this file may be invoked as a Python script to run example queries.
+"""
+
+from typing import List, Optional, Tuple
+from typing_extensions import TypedDict
+
+from redis import Redis
+
+import keys
+import profiles
+import rankings
+from connection import get_read_client
+from instrumentation import traced
+
+
+class HeadToHeadTypedDict(TypedDict):
+    """Python typed dictionary representing a player's record against one opponent"""
+    games: int
+    wins: int
+    losses: int
+    draws: int
+
+
+# appended to a prefix, sorts after every (UTF-8 encoded) string starting with the prefix
+__LEX_MAX_SUFFIX = chr(0x10FFFF)
+
+
+@traced
+def in_league(r: Redis, player_email: str) -> bool:
+    """Requirement: Check whether an email address belongs to a player of the league."""
+    return bool(r.sismember(keys.GLOBAL_PLAYERS_EMAILS, player_email))
+
+
+@traced
+def resolve_emails(r: Redis, player_emails: List[str]) -> List[Optional[str]]:
+    """Returns the `user_id` of the player of each email address, or None for addresses outside the league"""
+    if not player_emails:
+        return []
+    return r.hmget(keys.GLOBAL_PLAYERS_BY_EMAIL, player_emails)
+
+
+def __prefix_search(r: Redis, key: str, prefix: str, count: int, after: Optional[str]) -> List[str]:
+    """Returns at most `count` members of the lexicographically sorted set at `key` that start with `prefix`, in
+    ascending order, starting after the member `after` (or at the first match if `after` is None)
+    """
+    if count <= 0:
+        return []
+    start = "(" + after if after is not None else "[" + prefix
+    return r.zrangebylex(key, start, "[" + prefix + __LEX_MAX_SUFFIX, start=0, num=count)
+
+
+@traced
+def search_players(r: Redis, prefix: str, count: int = 10, after: Optional[str] = None) -> List[str]:
+    """Returns at most `count` `user_id`s starting with `prefix`, in ascending order. To fetch the next page, pass the
+    last `user_id` of the current page as `after`.
+    """
+    return __prefix_search(r, keys.GLOBAL_PIDS_LEX, prefix, count, after)
+
+
+@traced
+def search_emails(r: Redis, prefix: str, count: int = 10, after: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Returns at most `count` `(email, user_id)` pairs whose email starts with `prefix`, in ascending email order. To
+    fetch the next page, pass the last email of the current page as `after`.
+    """
+    player_emails = __prefix_search(r, keys.GLOBAL_EMAILS_LEX, prefix, count, after)
+    return list(zip(player_emails, resolve_emails(r, player_emails)))
+
+
+@traced
+def games_against_opponent(r: Redis, pid: str, opponent_id: str) -> List[str]:
+    """Requirement: List all games played between an arbitrary player (P0) and one of their opponents (P1)."""
+    pid_a, pid_b = keys.canonical_pair(pid, opponent_id)
+    return sorted(r.smembers(keys.H2H_GAMES.format(pid_a=pid_a, pid_b=pid_b)))
+
+
+@traced
+def head_to_head_record(r: Redis, pid: str, opponent_id: str) -> HeadToHeadTypedDict:
+    """Returns the win/loss/draw record of an arbitrary player (P0) against one of their opponents (P1)"""
+    pid_a, pid_b = keys.canonical_pair(pid, opponent_id)
+    record = r.hgetall(keys.H2H_RECORD.format(pid_a=pid_a, pid_b=pid_b))
+    a_wins, b_wins, draws = (int(record.get(field, 0)) for field in ("a_wins", "b_wins", "draws"))
+    wins, losses = (a_wins, b_wins) if pid == pid_a else (b_wins, a_wins)
+    return {"games": wins + losses + draws, "wins": wins, "losses": losses, "draws": draws}
+
+
+@traced
+def player_profile(r: Redis, pid: str) -> Optional[profiles.ProfileTypedDict]:
+    """Returns the materialized profile of an arbitrary player (P0) in a single read (see profiles.py), or None if P0
+    has no profile
+    """
+    return profiles.get_profile(r, pid)
+
+
+@traced
+def player_most_freq_opening(r: Redis, pid: str) -> Optional[str]:
+    """Requirement: Find the opening (ECO code) an arbitrary player (P0) has used most frequently. Ties are broken by
+    ascending ECO code.
+    """
+    most_freq = rankings.leader(r, keys.PLAYER_OPENINGS_RANKING.format(pid=pid))
+    return most_freq[0] if most_freq else None
+
+
+@traced
+def player_top_openings(r: Redis, pid: str, k: int = 5) -> List[Tuple[str, int]]:
+    """Returns the `k` openings an arbitrary player (P0) has used most frequently, as `(eco, count)` pairs"""
+    return [
+        (eco, int(count))
+        for eco, count in rankings.top_k(r, keys.PLAYER_OPENINGS_RANKING.format(pid=pid), k)
+    ]
+
+
+@traced
+def player_opening_rank(r: Redis, pid: str, eco: str) -> Optional[rankings.RankTypedDict]:
+    """Returns the rank and percentile of the opening `eco` among the openings an arbitrary player (P0) has used, or
+    None if P0 has never used it
+    """
+    return rankings.rank(r, keys.PLAYER_OPENINGS_RANKING.format(pid=pid), eco)
+
+
+if __name__ == "__main__":
+    redis_client = get_read_client()
+
+    print("Player-Centric Query Demonstration")
+    print()
+
+    player_email = "skinnerua@hotmail.com"
+    print(f"Is '{player_email}' in the league? {in_league(redis_client, player_email)}")
+    player_emails = [player_email, "nobody@example.com"]
+    print(f"Players of {player_emails}: {resolve_emails(redis_client, player_emails)}")
+    print(f"First players starting with 'sh': {search_players(redis_client, 'sh')}")
+    print(f"First emails starting with 'sk': {search_emails(redis_client, 'sk')}")
+    print()
+
+    pid, opponent_id = "shivangithegenius", "rajuppi"
+    print(f"Games between '{pid}' and '{opponent_id}':")
+    print(games_against_opponent(redis_client, pid, opponent_id))
+    print(f"Record of '{pid}' against '{opponent_id}': {head_to_head_record(redis_client, pid, opponent_id)}")
+    print()
+
+    print(f"Most frequently used opening of '{pid}': {player_most_freq_opening(redis_client, pid)}")
+    print(f"Top 5 openings of '{pid}': {player_top_openings(redis_client, pid)}")
+    print(f"Profile of '{pid}': {player_profile(redis_client, pid)}")
@@ -0,0 +1,187 @@
+"""profiles.py
+This file provides the materialized player profiles (keys.PLAYER_PROFILE): one document per player holding everything a
+profile view shows (record, most frequently used opening, friend group, and the most recent games and scheduled games),
+so that rendering a profile is a single read instead of a dozen. Profiles are created by `add_player` and kept up to
+date by the write path of write_funcs.py; `python backfill_funcs.py profiles` rebuilds them from the underlying keys.
+
+Two backends are available (`config.PROFILE_BACKEND`):
+
+- "json": a RedisJSON document (included in the redis-stack images), updated in place with JSON.* path commands
+- "hash": a hash for plain Redis; the scalar fields are hash fields, and each bounded window is a ring of
+  `config.PROFILE_WINDOW` fields ("{window}:{slot}") whose next slot is given by the "{window}:count" field
+
+"auto" (the default) uses "json" if the server reports the RedisJSON module in MODULE LIST, and "hash" otherwise.
+
+NOTE: scheduled games stay in the profile after their PLAYER_SCHEDULED_GAME_OPPONENT key expires, until they are
+pushed out of the window; switching backends requires rebuilding the profiles
+"""
+
+import json
+from typing import Dict, List, Optional
+from typing_extensions import TypedDict
+
+from redis import Redis
+from redis.client import Pipeline
+from redis.exceptions import ResponseError
+
+import cluster
+import config
+import keys
+
+WINDOWS = ("recent_games", "scheduled_games")
+
+
+class ProfileGameTypedDict(TypedDict):
+    """Python typed dictionary representing a recorded game, from the point of view of the profile's player"""
+    game_id: str
+    color: str
+    opponent: str
+    result: str  # "win", "loss", or "draw"
+    opening_eco: str
+    number_of_turns: int
+
+
+class ProfileScheduleTypedDict(TypedDict):
+    """Python typed dictionary representing a game scheduled for the profile's player"""
+    game_id: str
+    opponent: str
+
+
+class ProfileTypedDict(TypedDict):
+    """Python typed dictionary representing a materialized player profile (most recent window entries first)"""
+    user_id: str
+    email: Optional[str]
+    wins: int
+    losses: int
+    draws: int
+    most_freq_opening: Optional[str]
+    friend_group: Optional[str]
+    recent_games: List[ProfileGameTypedDict]
+    scheduled_games: List[ProfileScheduleTypedDict]
+
+
+# resolved backend of this process ("json" or "hash"), see `backend`
+__resolved_backend: Optional[str] = None
+
+
+def backend(redis_client: Redis) -> str:
+    """Returns the profile backend in use ("json" or "hash"), detecting RedisJSON once per process in "auto" mode"""
+    global __resolved_backend
+    if __resolved_backend is None:
+        if config.PROFILE_BACKEND != "auto":
+            __resolved_backend = config.PROFILE_BACKEND
+        else:
+            try:
+                # in cluster mode, every node is expected to load the same modules
+                options = {"target_nodes": redis_client.get_random_node()} if cluster.is_cluster(redis_client) else {}
+                # NOTE: the command name is passed as one argument, so that redis-py parses the reply into dictionaries
+                modules = redis_client.execute_command("MODULE LIST", **options)
+            except ResponseError:  # e.g., MODULE is not allowed for this user
+                modules = []
+            names = {module["name"].lower() for module in modules}
+            __resolved_backend = "json" if names & {"rejson", "json"} else "hash"
+    return __resolved_backend
+
+
+def empty_profile(pid: str, email: Optional[str] = None) -> ProfileTypedDict:
+    """Returns the profile of a player without any game"""
+    return {
+        "user_id": pid,
+        "email": email,
+        "wins": 0,
+        "losses": 0,
+        "draws": 0,
+        "most_freq_opening": None,
+        "friend_group": None,
+        "recent_games": [],
+        "scheduled_games": [],
+    }
+
+
+def queue_replace(pipe: Pipeline, profile_backend: str, profile: ProfileTypedDict) -> None:
+    """Queues the writes replacing the whole profile of `profile["user_id"]` with `profile` onto `pipe`"""
+    name = keys.PLAYER_PROFILE.format(pid=profile["user_id"])
+    pipe.delete(name)
+    if profile_backend == "json":
+        windowed = dict(profile)
+        for window in WINDOWS:
+            windowed[window] = profile[window][:config.PROFILE_WINDOW]
+        pipe.execute_command("JSON.SET", name, "$", json.dumps(windowed))
+        return
+
+    mapping: Dict[str, object] = {
+        field: value
+        for field, value in profile.items()
+        if field not in WINDOWS and value is not None
+    }
+    for window in WINDOWS:
+        # the ring slots are written as if the entries had been pushed oldest first
+        entries = profile[window][:config.PROFILE_WINDOW]
+        for slot, entry in enumerate(reversed(entries)):
+            mapping[f"{window}:{slot}"] = json.dumps(entry)
+        mapping[f"{window}:count"] = len(entries)
+    pipe.hset(name, mapping=mapping)
+
+
+def __queue_ensure(pipe: Pipeline, profile_backend: str, pid: str) -> None:
+    """Queues the creation of an empty profile if the player has none (e.g., a player added before profiles were kept),
+    so that the JSON path updates that follow have a document to apply to
+    """
+    if profile_backend == "json":
+        pipe.execute_command("JSON.SET", keys.PLAYER_PROFILE.format(pid=pid), "$", json.dumps(empty_profile(pid)), "NX")
+
+
+def queue_fields(pipe: Pipeline, profile_backend: str, pid: str, fields: Dict[str, object]) -> None:
+    """Queues the writes setting scalar profile `fields` (e.g., {"wins": 3}) of the player `pid` onto `pipe`"""
+    if not fields:
+        return
+    name = keys.PLAYER_PROFILE.format(pid=pid)
+    if profile_backend == "json":
+        __queue_ensure(pipe, profile_backend, pid)
+        for field, value in fields.items():
+            pipe.execute_command("JSON.SET", name, f"$.{field}", json.dumps(value))
+    else:
+        pipe.hset(name, mapping=fields)
+
+
+def push(redis_client: Redis, pid: str, window: str, entry: Dict[str, object], fields: Dict[str, object]) -> None:
+    """Pushes `entry` onto the `window` ("recent_games" or "scheduled_games") of the player `pid`, dropping the oldest
+    entry once the window is full, and sets the scalar profile `fields` along the way
+    """
+    profile_backend = backend(redis_client)
+    name = keys.PLAYER_PROFILE.format(pid=pid)
+    pipe = redis_client.pipeline(transaction=False)
+    queue_fields(pipe, profile_backend, pid, fields)
+    if profile_backend == "json":
+        __queue_ensure(pipe, profile_backend, pid)
+        pipe.execute_command("JSON.ARRINSERT", name, f"$.{window}", 0, json.dumps(entry))
+        pipe.execute_command("JSON.ARRTRIM", name, f"$.{window}", 0, config.PROFILE_WINDOW - 1)
+        pipe.execute()
+        return
+
+    # the slot is claimed with HINCRBY, so that concurrent writers never overwrite each other's entries
+    pipe.hincrby(name, f"{window}:count", 1)
+    count = pipe.execute()[-1]
+    redis_client.hset(name, f"{window}:{(count - 1) % config.PROFILE_WINDOW}", json.dumps(entry))
+
+
+def get_profile(r: Redis, pid: str) -> Optional[ProfileTypedDict]:
+    """Returns the materialized profile of the player `pid`, or None if the player has no profile"""
+    name = keys.PLAYER_PROFILE.format(pid=pid)
+    if backend(r) == "json":
+        document = r.execute_command("JSON.GET", name, "$")
+        return json.loads(document)[0] if document is not None else None
+
+    fields = r.hgetall(name)
+    if not fields:
+        return None
+    profile = empty_profile(pid, fields.get("email"))
+    for field in ("wins", "losses", "draws"):
+        profile[field] = int(fields.get(field, 0))
+    for field in ("most_freq_opening", "friend_group"):
+        profile[field] = fields.get(field)
+    for window in WINDOWS:
+        count = int(fields.get(f"{window}:count", 0))
+        slots = (i % config.PROFILE_WINDOW for i in range(count - 1, max(count - config.PROFILE_WINDOW, 0) - 1, -1))
+        profile[window] = [json.loads(fields[f"{window}:{slot}"]) for slot in slots if f"{window}:{slot}" in fields]
+    return profile
@@ -0,0 +1,71 @@
+"""rankings.py
+This file provides the read helpers shared by every query over a sorted set used as a ranking (member -> count/score),
+such as the per-player and global opening rankings.
+
+Ties are handled deterministically: members with equal scores are ordered by ascending member (e.g., "A00" before
+"B21"), and ranks are competition ranks (1 + the number of members with a strictly greater score), so tied members share
+a rank.
+"""
+
+from typing import List, Optional, Tuple
+from typing_extensions import TypedDict
+
+from redis import Redis
+
+
+class RankTypedDict(TypedDict):
+    """Python typed dictionary representing the position of one member in a ranking"""
+    member: str
+    score: float
+    rank: int
+    percentile: float
+
+
+def top_k(r: Redis, key: str, k: int) -> List[Tuple[str, float]]:
+    """Returns the `k` highest-scored `(member, score)` pairs of the ranking at `key`, in descending score order"""
+    if k <= 0:
+        return []
+    top = r.zrevrange(key, 0, k - 1, withscores=True)
+    if not top:
+        return []
+
+    # ZREVRANGE orders equal scores by descending member: the members scored above the lowest returned score are all
+    # returned, so they are re-sorted, while the remaining places are re-fetched among the members tied with the lowest
+    # returned score, which ZRANGEBYSCORE orders by ascending member (at most `k` of them)
+    cutoff = top[-1][1]
+    higher = sorted(((member, score) for member, score in top if score > cutoff), key=lambda pair: (-pair[1], pair[0]))
+    return higher + r.zrangebyscore(key, cutoff, cutoff, start=0, num=k - len(higher), withscores=True)
+
+
+def bottom_k(r: Redis, key: str, k: int) -> List[Tuple[str, float]]:
+    """Returns the `k` lowest-scored `(member, score)` pairs of the ranking at `key`, in ascending score order"""
+    if k <= 0:
+        return []
+    # ZRANGE already orders equal scores by ascending member
+    return r.zrange(key, 0, k - 1, withscores=True)
+
+
+def leader(r: Redis, key: str) -> Optional[Tuple[str, float]]:
+    """Returns the highest-scored `(member, score)` pair of the ranking at `key`, or None if the ranking is empty"""
+    top = top_k(r, key, 1)
+    return top[0] if top else None
+
+
+def rank(r: Redis, key: str, member: str) -> Optional[RankTypedDict]:
+    """Returns the rank of `member` in the ranking at `key`, or None if `member` is not ranked. `percentile` is the
+    percentage of ranked members whose score is lower than or equal to `member`'s score.
+    """
+    score = r.zscore(key, member)
+    if score is None:
+        return None
+    pipe = r.pipeline(transaction=False)
+    pipe.zcount(key, f"({score}", "+inf")
+    pipe.zcount(key, "-inf", score)
+    pipe.zcard(key)
+    higher, lower_or_equal, total = pipe.execute()
+    return {
+        "member": member,
+        "score": score,
+        "rank": higher + 1,
+        "percentile": 100.0 * lower_or_equal / total,
+    }
@@ -0,0 +1,139 @@
+"""ratings.py
+This file provides the Elo ratings of the players, kept in the sorted set keys.ANALYTICS_RATINGS (pid -> rating) so that
+the rating leaderboards and rank queries of leaderboard_funcs.py are O(log N). A player is rated from their first
+recorded game, starting at `config.RATING_INITIAL`; after each game, the white player's rating changes by
+`config.RATING_K` x (score - expected score), where the score is 1, 0.5, or 0, and the black player's by the opposite.
+
+`update_ratings` applies one game at ingest. `recompute_ratings` replays every game of keys.GLOBAL_GAMES_LOG (e.g.,
+after changing `config.RATING_K`): the players are interned to integers, and the games are grouped into rounds in which
+every player plays at most once, keeping each player's games in ingest order. Each round is then applied with vectorized
+NumPy operations, which gives the same ratings as replaying the games one at a time.
+
+Usage:
+    python ratings.py                        # recompute every rating from the ingest log
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+from redis import Redis
+
+import config
+import keys
+from connection import get_redis_client
+from instrumentation import traced
+from models import GameRecordTypedDict
+
+# rating difference at which the stronger player is expected to score 10 times as much as the weaker one
+ELO_SCALE = 400.0
+
+
+def white_score(winner: str) -> float:
+    """Returns the score of the white player of a game won by `winner` ("white", "black", or a draw)"""
+    if winner == "white":
+        return 1.0
+    if winner == "black":
+        return 0.0
+    return 0.5
+
+
+def rating_change(white_rating: float, black_rating: float, score: float) -> float:
+    """Returns the change of the white player's rating (the black player's changes by the opposite) after a game in
+    which the white player scored `score`
+    """
+    expected = 1.0 / (1.0 + 10.0 ** ((black_rating - white_rating) / ELO_SCALE))
+    return config.RATING_K * (score - expected)
+
+
+@traced
+def update_ratings(redis_client: Redis, game_record: GameRecordTypedDict) -> Tuple[float, float]:
+    """Applies a new game record to the ratings of its players and returns their new `(white, black)` ratings
+    NOTE: the changes are applied with ZINCRBY, so concurrent updates of the same player are never lost, but may be
+    computed from a rating that does not include the other update yet
+    """
+    white, black = game_record["white_player_id"], game_record["black_player_id"]
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zadd(keys.ANALYTICS_RATINGS, {white: config.RATING_INITIAL, black: config.RATING_INITIAL}, nx=True)
+    pipe.zmscore(keys.ANALYTICS_RATINGS, [white, black])
+    _, (white_rating, black_rating) = pipe.execute()
+
+    change = rating_change(white_rating, black_rating, white_score(game_record["winner"]))
+    pipe.zincrby(keys.ANALYTICS_RATINGS, change, white)
+    pipe.zincrby(keys.ANALYTICS_RATINGS, -change, black)
+    white_rating, black_rating = pipe.execute()
+    return white_rating, black_rating
+
+
+def __rounds(white: np.ndarray, black: np.ndarray, player_count: int) -> List[np.ndarray]:
+    """Splits the games (given by the player indexes of each side) into rounds in which every player plays at most once,
+    and returns the game positions of each round; each player's games keep their order across the rounds
+    """
+    # a game goes in the round after the latest round of either of its players
+    latest = [-1] * player_count
+    game_rounds = np.empty(len(white), dtype=np.int64)
+    for i, (w, b) in enumerate(zip(white.tolist(), black.tolist())):
+        game_round = max(latest[w], latest[b]) + 1
+        latest[w] = latest[b] = game_round
+        game_rounds[i] = game_round
+
+    order = np.argsort(game_rounds, kind="stable")
+    return np.split(order, np.flatnonzero(np.diff(game_rounds[order])) + 1)
+
+
+def replay(white: np.ndarray, black: np.ndarray, scores: np.ndarray, player_count: int) -> np.ndarray:
+    """Returns the rating of each of the `player_count` players after the games, in order, where `white` and `black`
+    are the player indexes of each game and `scores` the white player's scores
+    """
+    ratings = np.full(player_count, config.RATING_INITIAL, dtype=np.float64)
+    for games in __rounds(white, black, player_count):
+        w, b = white[games], black[games]
+        expected = 1.0 / (1.0 + 10.0 ** ((ratings[b] - ratings[w]) / ELO_SCALE))
+        change = config.RATING_K * (scores[games] - expected)
+        ratings[w] += change
+        ratings[b] -= change
+    return ratings
+
+
+@traced
+def recompute_ratings(redis_client: Redis, batch_size: int = 10000) -> int:
+    """Recomputes every rating from the games of keys.GLOBAL_GAMES_LOG, in ingest order, and returns the number of
+    players rated. The new ratings replace the previous ones atomically.
+    NOTE: pause ingest while the ratings are recomputed; games ingested before the log was kept must be appended to it
+    first (see `python backfill_funcs.py games-log`)
+    """
+    whites: List[str] = []
+    blacks: List[str] = []
+    scores: List[float] = []
+    for start in range(0, redis_client.llen(keys.GLOBAL_GAMES_LOG), batch_size):
+        gids = redis_client.lrange(keys.GLOBAL_GAMES_LOG, start, start + batch_size - 1)
+        pipe = redis_client.pipeline(transaction=False)
+        for gid in gids:
+            pipe.get(keys.GAME_WHITE_PLAYER.format(gid=gid))
+            pipe.get(keys.GAME_BLACK_PLAYER.format(gid=gid))
+            pipe.get(keys.GAME_WINNER.format(gid=gid))
+        values = pipe.execute()
+        for i in range(len(gids)):
+            white, black, winner = values[3 * i:3 * i + 3]
+            if white is not None and black is not None:
+                whites.append(white)
+                blacks.append(black)
+                scores.append(white_score(winner))
+
+    if not scores:
+        redis_client.delete(keys.ANALYTICS_RATINGS)
+        return 0
+
+    # intern the players: `players[index]` is the pid of each player index
+    players, indexes = np.unique(np.array(whites + blacks), return_inverse=True)
+    ratings = replay(indexes[:len(whites)], indexes[len(whites):], np.array(scores), len(players))
+
+    redis_client.delete(keys.ANALYTICS_RATINGS_REBUILD)
+    for start in range(0, len(players), batch_size):
+        redis_client.zadd(keys.ANALYTICS_RATINGS_REBUILD, dict(zip(
+            players[start:start + batch_size].tolist(), ratings[start:start + batch_size].tolist())))
+    redis_client.rename(keys.ANALYTICS_RATINGS_REBUILD, keys.ANALYTICS_RATINGS)
+    return len(players)
+
+
+if __name__ == "__main__":
+    print(f"recomputed the ratings of {recompute_ratings(get_redis_client())} player(s)")
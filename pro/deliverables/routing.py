@@ -0,0 +1,170 @@
+"""routing.py
+This file provides primary/replica read routing for standalone deployments with replicas (`config.REDIS_REPLICAS`).
+`RoutedRedis` is a drop-in client: read-only commands (and pipelines made only of read-only commands) are sent to a
+replica, and every other command goes to the primary, so query functions can share one client with write functions.
+
+Replicas are selected by `ReplicaRouter` using the replication offsets reported by INFO replication, refreshed at most
+every `config.REPLICA_REFRESH_MS` milliseconds: a replica is eligible if its link to the primary is up and it lags the
+primary by at most `config.REPLICA_MAX_LAG_BYTES` bytes of replication stream. The least lagging eligible replica is
+used (ties are rotated); reads fall back to the primary when no replica is eligible.
+
+Read-your-writes: replicas apply writes asynchronously, so a caller that just wrote should read through
+`RoutedRedis.after_writes()`, which only uses replicas that have replicated every write acknowledged so far.
+
+NOTE: each replica client has its own connection pool
+"""
+
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+from redis import Redis
+from redis.client import Pipeline
+from redis.commands.cluster import READ_COMMANDS
+from redis.exceptions import ConnectionError, TimeoutError
+
+import config
+
+# commands that never write, including the ones used by the query functions that redis-py does not list
+ROUTED_READ_COMMANDS = READ_COMMANDS | frozenset([
+    "BITFIELD_RO", "CMS.QUERY", "DUMP", "HSCAN", "JSON.GET", "LPOS", "OBJECT", "PFCOUNT", "SCAN", "SMISMEMBER", "SSCAN",
+    "TOPK.LIST", "TYPE", "XINFO", "XLEN", "XPENDING", "XRANGE", "XREVRANGE", "ZMSCORE", "ZRANGEBYLEX", "ZRANGEBYSCORE",
+    "ZRANK", "ZREVRANGE", "ZREVRANGEBYLEX", "ZREVRANGEBYSCORE", "ZREVRANK", "ZSCAN",
+])
+
+
+def is_read_only(command_name: str) -> bool:
+    """Returns True if the command `command_name` (e.g., "GET" or "XINFO GROUPS") never writes"""
+    return command_name.split(" ")[0].upper() in ROUTED_READ_COMMANDS
+
+
+class ReplicaRouter:
+    """Selects the client serving each read, based on the replication offsets of the primary and its replicas"""
+
+    def __init__(
+            self,
+            primary: Redis,
+            replicas: List[Redis],
+            max_lag_bytes: int = config.REPLICA_MAX_LAG_BYTES,
+            refresh_ms: int = config.REPLICA_REFRESH_MS) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag_bytes = max_lag_bytes
+        self.refresh_ms = refresh_ms
+        self.__lock = threading.Lock()
+        self.__rotation = itertools.count()
+        self.__primary_offset = 0
+        self.__replica_offsets: Dict[int, int] = {}  # replica position -> offset, for the replicas whose link is up
+        self.__refreshed_at = float("-inf")
+
+    def write_offset(self) -> int:
+        """Returns the current replication offset of the primary, which covers every write it acknowledged so far"""
+        return self.primary.info("replication")["master_repl_offset"]
+
+    def refresh(self) -> None:
+        """Reads the replication offsets of the primary and of every replica"""
+        primary_offset = self.write_offset()
+        replica_offsets = {}
+        for i, replica in enumerate(self.replicas):
+            try:
+                info = replica.info("replication")
+            except (ConnectionError, TimeoutError):
+                continue
+            if info.get("master_link_status") == "up":
+                replica_offsets[i] = info["slave_repl_offset"]
+        with self.__lock:
+            self.__primary_offset = primary_offset
+            self.__replica_offsets = replica_offsets
+            self.__refreshed_at = time.monotonic()
+
+    def mark_down(self, replica: Redis) -> None:
+        """Stops routing reads to `replica` until the next refresh (e.g., after a connection error)"""
+        with self.__lock:
+            self.__replica_offsets.pop(self.replicas.index(replica), None)
+
+    def __eligible(self, min_offset: Optional[int]) -> List[Redis]:
+        """Returns the eligible replicas, least lagging first"""
+        with self.__lock:
+            offsets = [
+                (self.__primary_offset - offset, i)
+                for i, offset in self.__replica_offsets.items()
+                if self.__primary_offset - offset <= self.max_lag_bytes and (min_offset is None or offset >= min_offset)
+            ]
+        if not offsets:
+            return []
+        min_lag = min(offsets)[0]
+        return [self.replicas[i] for lag, i in sorted(offsets) if lag == min_lag]
+
+    def read_client(self, min_offset: Optional[int] = None) -> Redis:
+        """Returns the client that should serve a read; if `min_offset` is set, only replicas that have replicated the
+        writes up to that offset are used
+        """
+        if time.monotonic() - self.__refreshed_at > self.refresh_ms / 1000:
+            self.refresh()
+        eligible = self.__eligible(min_offset)
+        if not eligible and min_offset is not None:
+            # the cached offsets may predate the writes to read
+            self.refresh()
+            eligible = self.__eligible(min_offset)
+        if not eligible:
+            return self.primary
+        return eligible[next(self.__rotation) % len(eligible)]
+
+
+class RoutedPipeline(Pipeline):
+    """Pipeline sent to a replica if all of its commands are read-only, and to the primary otherwise"""
+
+    def __init__(self, client: "RoutedRedis", transaction: bool, shard_hint: Optional[str]) -> None:
+        super().__init__(client.connection_pool, client.response_callbacks, transaction, shard_hint)
+        self.__client = client
+
+    def execute(self, raise_on_error: bool = True) -> List:
+        if not self.command_stack:
+            return []
+        read_only = all(is_read_only(args[0]) for args, _ in self.command_stack)
+        target = self.__client.router.read_client(self.__client.min_offset) if read_only else self.__client.primary
+        pipe = target.pipeline(transaction=self.transaction, shard_hint=self.shard_hint)
+        pipe.command_stack = self.command_stack
+        try:
+            return pipe.execute(raise_on_error)
+        except (ConnectionError, TimeoutError):
+            if target is self.__client.primary:
+                raise
+            self.__client.router.mark_down(target)
+            pipe = self.__client.primary.pipeline(transaction=self.transaction, shard_hint=self.shard_hint)
+            pipe.command_stack = self.command_stack
+            return pipe.execute(raise_on_error)
+        finally:
+            self.reset()
+
+
+class RoutedRedis(Redis):
+    """Redis client sending read-only commands to a replica selected by `router`, and every other command to the
+    primary; see the module docstring
+    """
+
+    def __init__(self, router: ReplicaRouter, min_offset: Optional[int] = None) -> None:
+        super().__init__(connection_pool=router.primary.connection_pool)
+        self.router = router
+        self.primary = router.primary
+        self.min_offset = min_offset
+
+    def after_writes(self) -> "RoutedRedis":
+        """Returns a client whose reads reflect every write acknowledged by the primary so far (read-your-writes)"""
+        return RoutedRedis(self.router, self.router.write_offset())
+
+    def execute_command(self, *args, **options):
+        if not is_read_only(args[0]):
+            return self.primary.execute_command(*args, **options)
+        target = self.router.read_client(self.min_offset)
+        try:
+            return target.execute_command(*args, **options)
+        except (ConnectionError, TimeoutError):
+            if target is self.primary:
+                raise
+            self.router.mark_down(target)
+            return self.primary.execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> RoutedPipeline:
+        return RoutedPipeline(self, transaction, shard_hint)
@@ -0,0 +1,150 @@
+"""seq_sketch.py
+This file provides the bounded-memory, approximate three-move sequence statistics used when `config.SEQ_STATS_MODE` is
+"approx". Every recorded sequence is fed into a Count-Min Sketch (frequency estimates) and a Top-K structure (most
+common sequences), so memory stays fixed no matter how many distinct sequences are played.
+
+Two backends are available (`config.SEQ_SKETCH_BACKEND`):
+
+- "redisbloom": the CMS.* and TOPK.* commands of the RedisBloom module (included in the redis-stack images)
+- "python": equivalents for plain Redis; the sketch is a BITFIELD of saturating 32-bit counters and the Top-K is a
+  sorted set trimmed to the `config.SEQ_TOPK` best estimates
+
+Error bounds: an estimate never undercounts, and overcounts by more than `config.SEQ_SKETCH_ERROR` x (total sequences
+recorded) with probability at most `config.SEQ_SKETCH_PROBABILITY`.
+
+NOTE: the sketch dimensions are derived from these settings; changing them requires deleting the sketch keys and
+reloading the game records
+"""
+
+import hashlib
+import math
+from typing import List, Tuple
+
+from redis import Redis
+from redis.exceptions import ResponseError
+
+import config
+import keys
+from models import BoardGameClubConfigError
+
+CMS_WIDTH = math.ceil(math.e / config.SEQ_SKETCH_ERROR)
+CMS_DEPTH = math.ceil(math.log(1 / config.SEQ_SKETCH_PROBABILITY))
+
+
+def add_sequences(redis_client: Redis, three_move_sequences: List[str]) -> List[int]:
+    """Records one occurrence of each sequence (repeats are recorded once per repeat) and returns the estimated count of
+    each sequence, including this occurrence
+    """
+    if not three_move_sequences:
+        return []
+    if config.SEQ_SKETCH_BACKEND == "python":
+        return __python_add(redis_client, three_move_sequences)
+    try:
+        return __redisbloom_add(redis_client, three_move_sequences)
+    except ResponseError as e:
+        if "unknown command" in str(e):
+            raise __missing_module_error("CMS.INCRBY") from e
+        if "does not exist" not in str(e):
+            raise
+        __redisbloom_reserve(redis_client)
+        return __redisbloom_add(redis_client, three_move_sequences)
+
+
+def query_sequences(redis_client: Redis, three_move_sequences: List[str]) -> List[int]:
+    """Returns the estimated count of each sequence"""
+    if not three_move_sequences:
+        return []
+    if config.SEQ_SKETCH_BACKEND == "python":
+        counters = redis_client.execute_command(
+            "BITFIELD", keys.GLOBAL_SEQS_SKETCH, *__python_bitfield_args("GET", three_move_sequences))
+        return __python_estimates(counters, len(three_move_sequences))
+    if not redis_client.exists(keys.GLOBAL_SEQS_SKETCH):
+        return [0] * len(three_move_sequences)
+    return [int(count) for count in redis_client.execute_command(
+        "CMS.QUERY", keys.GLOBAL_SEQS_SKETCH, *three_move_sequences)]
+
+
+def top_sequences(redis_client: Redis) -> List[Tuple[str, int]]:
+    """Returns the (at most `config.SEQ_TOPK`) most common sequences as `(sequence, estimated count)` pairs, in
+    descending count order
+    """
+    if config.SEQ_SKETCH_BACKEND == "python":
+        top = redis_client.zrevrange(keys.GLOBAL_SEQS_TOPK, 0, -1, withscores=True)
+        return [(seq, int(count)) for seq, count in top]
+    if not redis_client.exists(keys.GLOBAL_SEQS_TOPK):
+        return []
+    flat = redis_client.execute_command("TOPK.LIST", keys.GLOBAL_SEQS_TOPK, "WITHCOUNT")
+    top = [(flat[i], int(flat[i + 1])) for i in range(0, len(flat), 2)]
+    return sorted(top, key=lambda pair: (-pair[1], pair[0]))
+
+
+def __missing_module_error(command: str) -> BoardGameClubConfigError:
+    """Returns the error raised when the RedisBloom command `command` fails for lack of the module"""
+    return BoardGameClubConfigError(
+        f"{command} failed; is the RedisBloom module loaded? (BGC_SEQ_SKETCH_BACKEND=python does not need it)")
+
+
+def __redisbloom_reserve(redis_client: Redis) -> None:
+    """Creates the RedisBloom sketch and Top-K keys; creation races between concurrent writers are ignored"""
+    for command in (
+            ("CMS.INITBYDIM", keys.GLOBAL_SEQS_SKETCH, CMS_WIDTH, CMS_DEPTH),
+            ("TOPK.RESERVE", keys.GLOBAL_SEQS_TOPK, config.SEQ_TOPK)):
+        try:
+            redis_client.execute_command(*command)
+        except ResponseError as e:
+            if "exists" not in str(e):
+                raise __missing_module_error(command[0]) from e
+
+
+def __redisbloom_add(redis_client: Redis, three_move_sequences: List[str]) -> List[int]:
+    """`add_sequences` using the RedisBloom module"""
+    increments = []
+    for seq in three_move_sequences:
+        increments.extend((seq, 1))
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.execute_command("CMS.INCRBY", keys.GLOBAL_SEQS_SKETCH, *increments)
+    pipe.execute_command("TOPK.ADD", keys.GLOBAL_SEQS_TOPK, *three_move_sequences)
+    counts, _ = pipe.execute()
+    return [int(count) for count in counts]
+
+
+def __python_positions(seq: str) -> List[int]:
+    """Returns the counter index of `seq` in each row of the sketch (double hashing over a 128-bit digest)"""
+    digest = hashlib.blake2b(seq.encode("utf-8"), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [row * CMS_WIDTH + (h1 + row * h2) % CMS_WIDTH for row in range(CMS_DEPTH)]
+
+
+def __python_bitfield_args(operation: str, three_move_sequences: List[str]) -> List[object]:
+    """Builds the BITFIELD arguments applying `operation` ("INCRBY" or "GET") to every counter of every sequence"""
+    args: List[object] = ["OVERFLOW", "SAT"] if operation == "INCRBY" else []
+    for seq in three_move_sequences:
+        for position in __python_positions(seq):
+            args.extend((operation, "u32", f"#{position}"))
+            if operation == "INCRBY":
+                args.append(1)
+    return args
+
+
+def __python_estimates(counters: List[int], number_of_sequences: int) -> List[int]:
+    """Reduces the BITFIELD replies (CMS_DEPTH counters per sequence) to one estimate (the minimum) per sequence"""
+    return [
+        min(counters[i * CMS_DEPTH:(i + 1) * CMS_DEPTH])
+        for i in range(number_of_sequences)
+    ]
+
+
+def __python_add(redis_client: Redis, three_move_sequences: List[str]) -> List[int]:
+    """`add_sequences` using plain Redis commands"""
+    counters = redis_client.execute_command(
+        "BITFIELD", keys.GLOBAL_SEQS_SKETCH, *__python_bitfield_args("INCRBY", three_move_sequences))
+    estimates = __python_estimates(counters, len(three_move_sequences))
+
+    # a sequence repeated within the batch keeps the estimate of its last occurrence
+    latest = dict(zip(three_move_sequences, estimates))
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zadd(keys.GLOBAL_SEQS_TOPK, latest)
+    pipe.zremrangebyrank(keys.GLOBAL_SEQS_TOPK, 0, -(config.SEQ_TOPK + 1))
+    pipe.execute()
+    return estimates
@@ -0,0 +1,147 @@
+"""write_buffer.py
+This file provides an in-process write-behind buffer for the commutative writes that hit the same few keys on nearly
+every game (e.g., the global opening ranking and the counts of common three-move sequences). Instead of one round trip
+per write, `WriteBuffer` coalesces increments (INCRBY/ZINCRBY) and set additions (SADD) in memory and flushes them as a
+single pipeline of aggregated commands once `max_pending` writes are buffered or `max_delay_ms` milliseconds have passed
+since the oldest buffered write, and when the process exits.
+
+After each flush, the `on_flush` callback receives the new value of every flushed counter, so that values derived from
+the counters (e.g., the analytics leader keys) are recomputed once per flush rather than once per write.
+
+A flush that fails (e.g., on a lost connection) keeps every buffered write, to be retried by the next flush. The writes
+are sent in a MULTI/EXEC transaction, so a failed flush applies none of them, unless the connection is lost after EXEC
+was sent or in cluster mode (where the keys span several nodes). A failure on the timer thread is reported on stderr; as
+the buffered writes are then overdue, the next buffered write flushes them again in the writing thread, where a
+persistent failure raises.
+
+NOTE: buffered writes are only visible to readers once flushed, and are lost if the process crashes before the flush
+"""
+
+import atexit
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional, Set, Tuple
+from typing_extensions import TypedDict
+
+from redis import Redis
+
+import cluster
+import config
+
+
+class FlushResultTypedDict(TypedDict):
+    """Python typed dictionary representing the new values of the counters written by one flush"""
+    counters: Dict[str, int]  # key -> value after INCRBY
+    scores: Dict[Tuple[str, str], float]  # (key, member) -> score after ZINCRBY
+
+
+class WriteBuffer:
+    """Coalesces INCRBY, ZINCRBY, and SADD writes in memory and flushes them to redis; see the module docstring"""
+
+    def __init__(
+            self,
+            redis_client: Redis,
+            max_pending: int = config.WRITE_BUFFER_MAX_PENDING,
+            max_delay_ms: int = config.WRITE_BUFFER_MAX_DELAY_MS,
+            on_flush: Optional[Callable[[FlushResultTypedDict], None]] = None) -> None:
+        self.redis_client = redis_client
+        self.max_pending = max_pending
+        self.max_delay_ms = max_delay_ms
+        self.on_flush = on_flush
+        self.__lock = threading.RLock()
+        self.__increments: Dict[str, int] = {}
+        self.__score_increments: Dict[Tuple[str, str], float] = {}
+        self.__members: Dict[str, Set[str]] = {}
+        self.__pending = 0
+        self.__oldest: Optional[float] = None
+        self.__closed = threading.Event()
+        # the timer flushes writes that are buffered while no new write arrives
+        self.__timer = threading.Thread(target=self.__flush_periodically, daemon=True)
+        self.__timer.start()
+        atexit.register(self.close)
+
+    def incrby(self, name: str, amount: int = 1) -> None:
+        """Buffers `INCRBY name amount`"""
+        with self.__lock:
+            self.__increments[name] = self.__increments.get(name, 0) + amount
+            self.__added()
+
+    def zincrby(self, name: str, amount: float, value: str) -> None:
+        """Buffers `ZINCRBY name amount value`"""
+        with self.__lock:
+            self.__score_increments[(name, value)] = self.__score_increments.get((name, value), 0) + amount
+            self.__added()
+
+    def sadd(self, name: str, *values: str) -> None:
+        """Buffers `SADD name *values`"""
+        with self.__lock:
+            self.__members.setdefault(name, set()).update(values)
+            self.__added()
+
+    def pending(self) -> int:
+        """Returns the number of writes buffered since the last flush (waiting for a flush in progress to complete)"""
+        with self.__lock:
+            return self.__pending
+
+    def __added(self) -> None:
+        """Counts a buffered write, and flushes once a threshold is reached (the caller holds the lock)"""
+        self.__pending += 1
+        if self.__oldest is None:
+            self.__oldest = time.monotonic()
+        if self.__pending >= self.max_pending or self.__overdue():
+            self.flush()
+
+    def __overdue(self) -> bool:
+        """Returns True if the oldest buffered write has waited at least `max_delay_ms`"""
+        return self.__oldest is not None and (time.monotonic() - self.__oldest) * 1000 >= self.max_delay_ms
+
+    def __flush_periodically(self) -> None:
+        """Body of the timer thread"""
+        while not self.__closed.wait(self.max_delay_ms / 1000):
+            with self.__lock:
+                if self.__overdue():
+                    try:
+                        self.flush()
+                    except Exception:  # NOTE: the writes stay buffered; keep the timer alive to retry them
+                        traceback.print_exc()
+
+    def flush(self) -> None:
+        """Sends the buffered writes as one pipeline of aggregated commands, then calls `on_flush`; if the pipeline
+        cannot be sent, the writes stay buffered and the error is raised
+        """
+        with self.__lock:
+            if not self.__pending:
+                return
+            increments, score_increments, members = self.__increments, self.__score_increments, self.__members
+
+            # NOTE: redis-py does not support transactions on cluster pipelines
+            pipe = self.redis_client.pipeline(transaction=not cluster.is_cluster(self.redis_client))
+            for name, amount in increments.items():
+                pipe.incrby(name, amount)
+            for (name, value), amount in score_increments.items():
+                pipe.zincrby(name, amount, value)
+            for name, values in members.items():
+                pipe.sadd(name, *values)
+            # NOTE: a command error (e.g., WRONGTYPE) does not undo the other commands, so the buffers are cleared
+            # before it is raised, while a connection error (raised by `execute`) leaves them as they are
+            replies = pipe.execute(raise_on_error=False)
+            self.__increments, self.__score_increments, self.__members = {}, {}, {}
+            self.__pending = 0
+            self.__oldest = None
+            errors = [reply for reply in replies if isinstance(reply, Exception)]
+            if errors:
+                raise errors[0]
+
+            result: FlushResultTypedDict = {
+                "counters": dict(zip(increments, replies)),
+                "scores": dict(zip(score_increments, replies[len(increments):])),
+            }
+            if self.on_flush is not None:
+                self.on_flush(result)
+
+    def close(self) -> None:
+        """Flushes the buffered writes and stops the timer; the buffer must not be used afterwards"""
+        self.__closed.set()
+        self.flush()
+        atexit.unregister(self.close)
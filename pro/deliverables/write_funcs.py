@@ -7,31 +7,108 @@ Please only import the following in your scripts:
 - `add_player`
 - `add_schedule`
 - `add_game_record`
+- `add_game_records`
+- `validate_game_record`
+- `enable_write_buffer` and `disable_write_buffer`
 
 Every function starting with a double underscore "__" is considered a helper/internal function and is only used to
-compose `add_player`, `add_schedule`, and `add_game_record` into smaller, well-defined functions.
+compose `add_player`, `add_schedule`, `add_game_record`, and `add_game_records` into smaller, well-defined functions.
+
+Write-Behind Buffer
+After `enable_write_buffer`, the writes to the hottest global keys (the global opening ranking, and the counts and game
+sets of the three-move sequences) are coalesced in memory and flushed in aggregate (see write_buffer.py), and the
+analytics leader keys derived from them are recomputed once per flush instead of once per game.
 """
 
 import json
 import uuid
-from typing import List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 from typing_extensions import Literal
 
 from redis import Redis
+from redis.client import Pipeline
 
+import cluster
+import config
+import game_bitmaps
 import keys
-from models import BoardGameClubNotUniqueError, GameRecordTypedDict, PlayerTypedDict, ScheduleTypedDict
+import profiles
+import ratings
+import seq_sketch
+from instrumentation import traced
+from models import (
+    BoardGameClubInvalidRecordError,
+    BoardGameClubNotUniqueError,
+    GameRecordTypedDict,
+    PlayerTypedDict,
+    ScheduleTypedDict,
+)
+from write_buffer import FlushResultTypedDict, WriteBuffer
+
+# buffer of the hot global writes, or None to write them immediately (see `enable_write_buffer`)
+__write_buffer: Optional[WriteBuffer] = None
+
+
+def enable_write_buffer(
+        redis_client: Redis,
+        max_pending: int = config.WRITE_BUFFER_MAX_PENDING,
+        max_delay_ms: int = config.WRITE_BUFFER_MAX_DELAY_MS) -> None:
+    """Buffers the hot global writes of the following game records (see the module docstring) until `max_pending`
+    writes are buffered, `max_delay_ms` milliseconds have passed, `disable_write_buffer` is called, or the process exits
+    """
+    global __write_buffer
+    disable_write_buffer()
+    __write_buffer = WriteBuffer(
+        redis_client,
+        max_pending,
+        max_delay_ms,
+        on_flush=lambda result: __update_buffered_leaders(redis_client, result))
+
 
+def disable_write_buffer() -> None:
+    """Flushes the buffered writes, if any, and writes the following game records immediately"""
+    global __write_buffer
+    if __write_buffer is not None:
+        __write_buffer.close()
+        __write_buffer = None
 
+
+@traced
 def add_player(redis_client: Redis, player: PlayerTypedDict) -> None:
     """Handles all redis reads/writes when adding a new player to the database
     In kva2_design.pdf, this function will be used for handling the "E2: when a new player is added" write event
     """
     __assert_player_is_new(redis_client, player["user_id"])
 
+    pipe = redis_client.pipeline(transaction=False)
+    __queue_player_writes(pipe, profiles.backend(redis_client), player)
+    pipe.execute()
+
+
+@traced
+def add_players(redis_client: Redis, players: List[PlayerTypedDict]) -> List[str]:
+    """Batched variant of `add_player`: the uniqueness checks and the writes are sent in one pipeline each
+
+    Returns the `user_id`s that were added. Unlike `add_player`, players whose `user_id` is already taken (including
+    repeats within the batch) are skipped instead of raising `BoardGameClubNotUniqueError`.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for player in players:
+        pipe.sadd(keys.GLOBAL_PLAYERS_IDS, player["user_id"])
+    new_players = [player for player, added in zip(players, pipe.execute()) if added]
+
+    profile_backend = profiles.backend(redis_client)
+    for player in new_players:
+        __queue_player_writes(pipe, profile_backend, player)
+    pipe.execute()
+    return [player["user_id"] for player in new_players]
+
+
+def __queue_player_writes(pipe: Pipeline, profile_backend: str, player: PlayerTypedDict) -> None:
+    """Queues every write of a new player onto `pipe`; the caller is responsible for executing the pipeline"""
     ### init player keys
     pid = player["user_id"]
-    redis_client.mset({
+    cluster.mset(pipe, {
         keys.PLAYER_EMAIL.format(pid=pid): player["email"],
         keys.PLAYER_WINS.format(pid=pid): 0,
         keys.PLAYER_LOSSES.format(pid=pid): 0,
@@ -40,9 +117,17 @@ def add_player(redis_client: Redis, player: PlayerTypedDict) -> None:
     })
 
     ### update global keys
-    redis_client.sadd(keys.GLOBAL_PLAYERS_EMAILS, player["email"])
+    pipe.sadd(keys.GLOBAL_PLAYERS_EMAILS, player["email"])
+
+    # player directory; an email shared by several players resolves to the first of them
+    pipe.hsetnx(keys.GLOBAL_PLAYERS_BY_EMAIL, player["email"], pid)
+    pipe.zadd(keys.GLOBAL_PIDS_LEX, {pid: 0})
+    pipe.zadd(keys.GLOBAL_EMAILS_LEX, {player["email"]: 0})
+
+    profiles.queue_replace(pipe, profile_backend, profiles.empty_profile(pid, player["email"]))
 
 
+@traced
 def __assert_player_is_new(redis_client: Redis, pid: str) -> None:
     """Enforces `pid` uniqueness by checking `pid` against the global `pid` set
     NOTE: only use when adding a new player
@@ -52,6 +137,7 @@ def __assert_player_is_new(redis_client: Redis, pid: str) -> None:
         raise BoardGameClubNotUniqueError(f"user_id {pid} is already taken")
 
 
+@traced
 def add_schedule(redis_client: Redis, schedule: ScheduleTypedDict) -> None:
     """Handles all redis reads/writes when adding a new scheduled game to the database
     In kva2_design.pdf, this function will be used for handling the "E3: when a new game is scheduled" write event
@@ -61,7 +147,7 @@ def add_schedule(redis_client: Redis, schedule: ScheduleTypedDict) -> None:
     ### player-specific keys
     player_1_key = keys.PLAYER_SCHEDULED_GAME_OPPONENT.format(pid=schedule['player_1'], gid=schedule['game_id'])
     player_2_key = keys.PLAYER_SCHEDULED_GAME_OPPONENT.format(pid=schedule['player_2'], gid=schedule['game_id'])
-    redis_client.mset({
+    cluster.mset(redis_client, {
         player_1_key: schedule["player_2"],
         player_2_key: schedule["player_1"],
     })
@@ -80,7 +166,15 @@ def add_schedule(redis_client: Redis, schedule: ScheduleTypedDict) -> None:
     redis_client.lpush(p2_list, schedule["game_id"])
     redis_client.ltrim(p2_list, 0, 199)
 
+    ### materialized profiles
+    for pid, opponent_id in (
+            (schedule["player_1"], schedule["player_2"]),
+            (schedule["player_2"], schedule["player_1"])):
+        scheduled_game = {"game_id": schedule["game_id"], "opponent": opponent_id}
+        profiles.push(redis_client, pid, "scheduled_games", scheduled_game, {})
 
+
+@traced
 def __new_fid(redis_client: Redis) -> str:
     """Returns a UUID that is not already a friend group (i.e., `fid`) key"""
     while True:
@@ -89,20 +183,24 @@ def __new_fid(redis_client: Redis) -> str:
             return fid
 
 
+@traced
 def __update_friend_groups(redis_client: Redis, pid1: str, pid2: str) -> None:
     """Updates the friend group data structures when a new game record is added to the database"""
     fid1 = redis_client.get(keys.PLAYER_FRIEND_GROUP.format(pid=pid1))
     fid2 = redis_client.get(keys.PLAYER_FRIEND_GROUP.format(pid=pid2))
+    profile_backend = profiles.backend(redis_client)
 
     # Case 1: neither in a group -> create new
     if fid1 is None and fid2 is None:
         gid = __new_fid(redis_client)
         pipe = redis_client.pipeline()
         pipe.sadd(keys.GLOBAL_FRIEND_GROUP.format(fid=gid), pid1, pid2)
-        pipe.mset({
+        cluster.mset(pipe, {
             keys.PLAYER_FRIEND_GROUP.format(pid=pid1): gid,
             keys.PLAYER_FRIEND_GROUP.format(pid=pid2): gid,
         })
+        for pid in (pid1, pid2):
+            profiles.queue_fields(pipe, profile_backend, pid, {"friend_group": gid})
         pipe.execute()
         return
 
@@ -113,6 +211,7 @@ def __update_friend_groups(redis_client: Redis, pid1: str, pid2: str) -> None:
         pipe = redis_client.pipeline()
         pipe.sadd(keys.GLOBAL_FRIEND_GROUP.format(fid=gid), newcomer)
         pipe.set(keys.PLAYER_FRIEND_GROUP.format(pid=newcomer), gid)
+        profiles.queue_fields(pipe, profile_backend, newcomer, {"friend_group": gid})
         pipe.execute()
         return
 
@@ -131,6 +230,7 @@ def __update_friend_groups(redis_client: Redis, pid1: str, pid2: str) -> None:
         pipe.sadd(keys.GLOBAL_FRIEND_GROUP.format(fid=big), *members)
         for m in members:
             pipe.set(keys.PLAYER_FRIEND_GROUP.format(pid=m), big)
+            profiles.queue_fields(pipe, profile_backend, m, {"friend_group": big})
         pipe.delete(keys.GLOBAL_FRIEND_GROUP.format(fid=small))
         pipe.execute()
 
@@ -154,6 +254,32 @@ def __parse_moveset(moveset: Union[str, List[str]]) -> List[str]:
         return json.loads(moveset.replace("'", '"'))
 
 
+def __parse_game_record(game_record: GameRecordTypedDict) -> List[str]:
+    """Checks every field of `game_record` that the writes parse, and returns its moves
+    NOTE: called before the `game_id` is claimed, so that an invalid record leaves no trace in the database
+    """
+    gid = game_record.get("game_id")
+    missing = [field for field in GameRecordTypedDict.__annotations__ if field not in game_record]
+    if missing:
+        raise BoardGameClubInvalidRecordError(f"game record {gid} is invalid: missing {', '.join(missing)}")
+    try:
+        moves = __parse_moveset(game_record["moveset"])
+        int(game_record["number_of_turns"])
+    except (TypeError, ValueError) as e:  # NOTE: json.JSONDecodeError is a ValueError
+        raise BoardGameClubInvalidRecordError(f"game record {gid} is invalid: {e}") from e
+    # NOTE: an empty moveset is rejected too, as RPUSH needs at least one move
+    if not isinstance(moves, list) or not moves or not all(isinstance(move, str) for move in moves):
+        raise BoardGameClubInvalidRecordError(f"game record {gid} is invalid: the moveset is not a list of moves")
+    return moves
+
+
+def validate_game_record(game_record: GameRecordTypedDict) -> None:
+    """Raises `BoardGameClubInvalidRecordError` if `game_record` cannot be written (e.g., its moveset cannot be parsed);
+    `add_game_record` and `add_game_records` perform the same checks before writing anything
+    """
+    __parse_game_record(game_record)
+
+
 def __find_all_three_move_sequences(moves: List[str]) -> List[str]:
     """Identifies all three-move sequences made in the given moveset, where each sequence is represented as a
     comma-separated string (e.g., "d4,d5,c4")
@@ -168,6 +294,7 @@ def __find_all_three_move_sequences(moves: List[str]) -> List[str]:
     ]
 
 
+@traced
 def __update_player_keys(
         redis_client: Redis,
         game_record: GameRecordTypedDict,
@@ -180,40 +307,204 @@ def __update_player_keys(
     if game_record["winner"] == player_color:
         wins = redis_client.incr(keys.PLAYER_WINS.format(pid=player_id), 1)
         __update_top_list(redis_client, keys.ANALYTICS_TOP_WINS, player_id, wins)
+        result, profile_fields = "win", {"wins": wins}
     elif game_record["winner"] == opponent_color:
         losses = redis_client.incr(keys.PLAYER_LOSSES.format(pid=player_id), 1)
         __update_top_list(redis_client, keys.ANALYTICS_TOP_LOSSES, player_id, losses)
+        result, profile_fields = "loss", {"losses": losses}
     else:
-        redis_client.incr(keys.PLAYER_DRAWS.format(pid=player_id), 1)
-    redis_client.rpush(keys.PLAYER_GAMES_LIST.format(pid=player_id), game_record["game_id"])
-    redis_client.sadd(keys.PLAYER_GAMES_SET.format(pid=player_id), game_record["game_id"])
-    redis_client.sadd(keys.PLAYER_OPPONENTS.format(pid=player_id), opponent_id)
+        draws = redis_client.incr(keys.PLAYER_DRAWS.format(pid=player_id), 1)
+        result, profile_fields = "draw", {"draws": draws}
     # NOTE: based on the 365Chess dataset (https://www.365chess.com/eco.php), it seems that openings are counted for
     # both the White and Black players, regardless of whether the opening is a single-move opening (involving only
     # the White player) or a multi-move opening (involving both players)
-    this_game_eco_count = redis_client.incr(keys.PLAYER_OPENING_COUNT.format(pid=player_id, eco=game_record['opening_eco']), 1)
+    this_game_eco_count = int(redis_client.zincrby(
+        keys.PLAYER_OPENINGS_RANKING.format(pid=player_id), 1, game_record["opening_eco"]))
     # determine if this game's opening is now the player's most frequently used opening
-    most_used_eco_count = redis_client.get(keys.PLAYER_MOST_FREQ_OPENING_COUNT.format(pid=player_id))
-    if most_used_eco_count is None or this_game_eco_count > int(most_used_eco_count):
+    most_used_eco, most_used_eco_count = redis_client.mget(
+        keys.PLAYER_MOST_FREQ_OPENING.format(pid=player_id), keys.PLAYER_MOST_FREQ_OPENING_COUNT.format(pid=player_id))
+    if __is_new_most_freq_opening(game_record["opening_eco"], this_game_eco_count, most_used_eco, most_used_eco_count):
         redis_client.mset({
             keys.PLAYER_MOST_FREQ_OPENING.format(pid=player_id): game_record["opening_eco"],
             keys.PLAYER_MOST_FREQ_OPENING_COUNT.format(pid=player_id): this_game_eco_count,
         })
+        profile_fields["most_freq_opening"] = game_record["opening_eco"]
 
+    # the counters are copied from the keys above (rather than incremented) so the profile converges to them
+    profiles.push(redis_client, player_id, "recent_games", {
+        "game_id": game_record["game_id"],
+        "color": player_color,
+        "opponent": opponent_id,
+        "result": result,
+        "opening_eco": game_record["opening_eco"],
+        "number_of_turns": int(game_record["number_of_turns"]),
+    }, profile_fields)
 
+
+@traced
 def add_game_record(redis_client: Redis, game_record: GameRecordTypedDict) -> None:
     """Handles all redis reads/writes when adding a new game record to the database
     In kva2_design.pdf, this function will be used for handling the "E4: when a game record is inserted" write event
     """
+    moves = __parse_game_record(game_record)
     __assert_game_is_new(redis_client, game_record["game_id"])
 
-    moves = __parse_moveset(game_record["moveset"])
     three_move_sequences = __find_all_three_move_sequences(moves)
+    indexed_sequences = __record_sequence_sketches(redis_client, [three_move_sequences])[0]
+    game_index = __reserve_game_indexes(redis_client, 1)[0]
+
+    pipe = redis_client.pipeline(transaction=False)
+    __queue_game_index_writes(pipe, game_record, moves, three_move_sequences, indexed_sequences, game_index)
+    pipe.execute()
+
+    __update_game_counters(redis_client, game_record, three_move_sequences)
+
+
+@traced
+def add_game_records(redis_client: Redis, game_records: List[GameRecordTypedDict]) -> List[str]:
+    """Batched variant of `add_game_record` that leaves the database in the same state as adding `game_records` one at
+    a time, in order. The uniqueness checks and every write that does not depend on a prior read are sent in two
+    pipelines for the whole batch; the counter and analytics updates are then applied record by record.
 
-    # add all 3-seq to the global set
-    for seq in three_move_sequences:
-        redis_client.sadd(keys.GLOBAL_SEQ_GAMES.format(seq=seq), game_record["game_id"])
+    Returns the `game_id`s that were added. Unlike `add_game_record`, records whose `game_id` is already taken
+    (including repeats within the batch) are skipped instead of raising `BoardGameClubNotUniqueError`. If any record is
+    invalid (see `validate_game_record`), `BoardGameClubInvalidRecordError` is raised before any `game_id` is claimed.
+    """
+    all_moves = [__parse_game_record(game_record) for game_record in game_records]
+
+    pipe = redis_client.pipeline(transaction=False)
+    for game_record in game_records:
+        pipe.sadd(keys.GLOBAL_GAMES_IDS, game_record["game_id"])
+    new_games = [
+        (game_record, moves)
+        for game_record, moves, added in zip(game_records, all_moves, pipe.execute())
+        if added
+    ]
+    new_game_records = [game_record for game_record, _ in new_games]
+    moves_per_game = [moves for _, moves in new_games]
+    three_move_sequences_per_game = [__find_all_three_move_sequences(moves) for moves in moves_per_game]
+    indexed_sequences_per_game = __record_sequence_sketches(redis_client, three_move_sequences_per_game)
+    game_indexes = __reserve_game_indexes(redis_client, len(new_game_records))
+
+    for game_record, moves, three_move_sequences, indexed_sequences, game_index in zip(
+            new_game_records, moves_per_game, three_move_sequences_per_game, indexed_sequences_per_game, game_indexes):
+        __queue_game_index_writes(pipe, game_record, moves, three_move_sequences, indexed_sequences, game_index)
+    pipe.execute()
+
+    for game_record, three_move_sequences in zip(new_game_records, three_move_sequences_per_game):
+        __update_game_counters(redis_client, game_record, three_move_sequences)
+    return [game_record["game_id"] for game_record in new_game_records]
+
+
+@traced
+def __reserve_game_indexes(redis_client: Redis, count: int) -> List[Optional[int]]:
+    """Reserves the game indexes of `count` new games when the game sets are bitmaps; otherwise, returns None for each
+    game
+    """
+    if config.GAME_SETS_ENCODING != "bitmap" or count <= 0:
+        return [None] * count
+    game_bitmaps.load_scripts(redis_client)
+    return game_bitmaps.reserve_indexes(redis_client, count)
 
+
+@traced
+def __record_sequence_sketches(
+        redis_client: Redis,
+        three_move_sequences_per_game: List[List[str]]) -> List[List[str]]:
+    """In approximate mode (see seq_sketch.py), feeds every sequence into the sequence sketches and returns, per game,
+    only the sequences whose game sets are maintained, i.e., whose estimated count has reached
+    `config.SEQ_GAMES_MIN_COUNT`. In exact mode, the sequences are returned unchanged.
+    """
+    if config.SEQ_STATS_MODE != "approx":
+        return three_move_sequences_per_game
+    all_sequences = [seq for three_move_sequences in three_move_sequences_per_game for seq in three_move_sequences]
+    estimates = iter(seq_sketch.add_sequences(redis_client, all_sequences))
+    return [
+        [seq for seq in three_move_sequences if next(estimates) >= config.SEQ_GAMES_MIN_COUNT]
+        for three_move_sequences in three_move_sequences_per_game
+    ]
+
+
+def __queue_game_index_writes(
+        pipe: Pipeline,
+        game_record: GameRecordTypedDict,
+        moves: List[str],
+        three_move_sequences: List[str],
+        indexed_sequences: List[str],
+        game_index: Optional[int]) -> None:
+    """Queues every write of a new game record that does not depend on a prior read (set/list membership, distinct
+    counts, and the game-specific keys) onto `pipe`; the caller is responsible for executing the pipeline
+    NOTE: `game_index` is the game's index in the game set bitmaps, or None if the game sets are Redis sets
+    """
+    gid = game_record["game_id"]
+    pipe.rpush(keys.GLOBAL_GAMES_LOG, gid)
+    if game_index is not None:
+        game_bitmaps.queue_index_mapping(pipe, gid, game_index)
+
+    # add all (indexed) 3-seq to the global set
+    for seq in indexed_sequences:
+        if game_index is None and __write_buffer is not None:
+            __write_buffer.sadd(keys.GLOBAL_SEQ_GAMES.format(seq=seq), gid)
+        elif game_index is None:
+            pipe.sadd(keys.GLOBAL_SEQ_GAMES.format(seq=seq), gid)
+        else:
+            game_bitmaps.queue_add(pipe, game_bitmaps.seq_game_set(seq), [game_index], game_index + 1)
+    if three_move_sequences:
+        pipe.pfadd(keys.GLOBAL_SEQS_HLL, *three_move_sequences)
+        if config.LOAD_ID:
+            pipe.pfadd(keys.GLOBAL_LOAD_SEQS_HLL.format(load_id=config.LOAD_ID), *three_move_sequences)
+
+    for player_id, opponent_id in (
+            (game_record["white_player_id"], game_record["black_player_id"]),
+            (game_record["black_player_id"], game_record["white_player_id"])):
+        pipe.rpush(keys.PLAYER_GAMES_LIST.format(pid=player_id), gid)
+        if game_index is None:
+            pipe.sadd(keys.PLAYER_GAMES_SET.format(pid=player_id), gid)
+        else:
+            game_bitmaps.queue_add(pipe, game_bitmaps.player_game_set(player_id), [game_index], game_index + 1)
+        pipe.sadd(keys.PLAYER_OPPONENTS.format(pid=player_id), opponent_id)
+        pipe.pfadd(keys.PLAYER_OPPONENTS_HLL.format(pid=player_id), opponent_id)
+        pipe.pfadd(keys.PLAYER_OPENINGS_HLL.format(pid=player_id), game_record["opening_eco"])
+
+    __queue_head_to_head_writes(pipe, game_record)
+    __queue_opening_tree_writes(pipe, game_record, moves)
+
+    ### game-specific keys
+    __update_game_keys(pipe, game_record, moves)
+
+
+def __head_to_head_field(game_record: GameRecordTypedDict, pid_a: str) -> str:
+    """Returns the head-to-head record field ("a_wins", "b_wins", or "draws") incremented by `game_record`"""
+    if game_record["winner"] not in ("white", "black"):
+        return "draws"
+    winner_id = game_record["white_player_id"] if game_record["winner"] == "white" else game_record["black_player_id"]
+    return "a_wins" if winner_id == pid_a else "b_wins"
+
+
+def __queue_head_to_head_writes(pipe: Pipeline, game_record: GameRecordTypedDict) -> None:
+    """Queues the head-to-head index updates of a new game record onto `pipe`"""
+    pid_a, pid_b = keys.canonical_pair(game_record["white_player_id"], game_record["black_player_id"])
+    pipe.sadd(keys.H2H_GAMES.format(pid_a=pid_a, pid_b=pid_b), game_record["game_id"])
+    pipe.hincrby(keys.H2H_RECORD.format(pid_a=pid_a, pid_b=pid_b), __head_to_head_field(game_record, pid_a), 1)
+
+
+def __queue_opening_tree_writes(pipe: Pipeline, game_record: GameRecordTypedDict, moves: List[str]) -> None:
+    """Queues the opening tree updates of a new game record (one node per ply, up to `config.OPENING_TREE_DEPTH`) onto
+    `pipe`
+    """
+    outcome = game_record["winner"] if game_record["winner"] in ("white", "black") else "draw"
+    for ply, move in enumerate(moves[:config.OPENING_TREE_DEPTH]):
+        node = keys.OPENING_TREE_NODE.format(path=",".join(moves[:ply]))
+        pipe.hincrby(node, f"{move}:games", 1)
+        pipe.hincrby(node, f"{move}:{outcome}", 1)
+
+
+@traced
+def __update_game_counters(
+        redis_client: Redis,
+        game_record: GameRecordTypedDict,
+        three_move_sequences: List[str]) -> None:
+    """Handles the read-dependent updates of a new game record: counters and the analytics keys derived from them"""
     __update_player_keys(
         redis_client,
         game_record,
@@ -229,19 +520,26 @@ def add_game_record(redis_client: Redis, game_record: GameRecordTypedDict) -> No
         opponent_color="white",
         opponent_id=game_record["white_player_id"])
 
-    ### game-specific keys
-    __update_game_keys(redis_client, game_record, moves)
-
-    ### global keys
-    __update_common_seqs(redis_client, three_move_sequences)
-    this_game_eco_count = redis_client.incr(keys.GLOBAL_OPENING_COUNT.format(eco=game_record['opening_eco']), 1)
+    ### global keys (and the analytics keys derived from them, which are updated by each flush when buffered)
+    # NOTE: in approximate mode, sequence counts are kept in the sequence sketches instead (see seq_sketch.py)
+    if __write_buffer is not None:
+        if config.SEQ_STATS_MODE != "approx":
+            for three_move_sequence in three_move_sequences:
+                __write_buffer.incrby(keys.GLOBAL_SEQ_COUNT.format(seq=three_move_sequence))
+        __write_buffer.zincrby(keys.GLOBAL_OPENINGS_RANKING, 1, game_record["opening_eco"])
+    else:
+        if config.SEQ_STATS_MODE != "approx":
+            __update_common_seqs(redis_client, three_move_sequences)
+        this_game_eco_count = int(redis_client.zincrby(keys.GLOBAL_OPENINGS_RANKING, 1, game_record["opening_eco"]))
+        __update_most_freq_opening(redis_client, game_record["opening_eco"], this_game_eco_count)
 
     ### analytics keys
     __update_shortest_game(redis_client, game_record)
-    __update_most_freq_opening(redis_client, game_record, this_game_eco_count)
     __update_friend_groups(redis_client, game_record["white_player_id"], game_record["black_player_id"])
+    ratings.update_ratings(redis_client, game_record)
 
 
+@traced
 def __update_top_list(redis_client: Redis, list_key: str, pid: str, new_score: int) -> None:
     """Keeps `list_key` (descending tuples of 'pid:score') in sync with a max length of 10
     NOTE: must be called right **AFTER** you increment the underlying counter
@@ -274,6 +572,7 @@ def __update_top_list(redis_client: Redis, list_key: str, pid: str, new_score: i
         pipe.execute()
 
 
+@traced
 def __assert_game_is_new(redis_client: Redis, gid: str) -> None:
     """Enforces `gid` uniqueness by checking `gid` against the global `gid` set
     NOTE: only use when adding a new game
@@ -283,21 +582,36 @@ def __assert_game_is_new(redis_client: Redis, gid: str) -> None:
         raise BoardGameClubNotUniqueError(f"game_id {gid} is already taken")
 
 
-def __update_game_keys(redis_client: Redis, game_record: GameRecordTypedDict, moves: List[str]) -> None:
-    """Handles updating game-specific keys when adding a new game record"""
+def __update_game_keys(pipe: Pipeline, game_record: GameRecordTypedDict, moves: List[str]) -> None:
+    """Queues the updates of the game-specific keys, and of the game distributions derived from them, of a new game
+    record onto `pipe`
+    """
     gid = game_record['game_id']
-    redis_client.mset({
+    number_of_turns = int(game_record["number_of_turns"])
+    number_of_checks = __find_number_of_checks(moves)
+    cluster.mset(pipe, {
         keys.GAME_WINNER.format(gid=gid): game_record["winner"],
         keys.GAME_VICTORY_STATUS.format(gid=gid): game_record["victory_status"],
         keys.GAME_TURNS.format(gid=gid): game_record["number_of_turns"],
-        keys.GAME_CHECKS.format(gid=gid): __find_number_of_checks(moves),
+        keys.GAME_CHECKS.format(gid=gid): number_of_checks,
         keys.GAME_WHITE_PLAYER.format(gid=gid): game_record["white_player_id"],
         keys.GAME_BLACK_PLAYER.format(gid=gid): game_record["black_player_id"],
         keys.GAME_OPENING_ECO.format(gid=gid): game_record["opening_eco"],
     })
-    redis_client.rpush(keys.GAME_MOVES.format(gid=gid), *moves)
+    pipe.rpush(keys.GAME_MOVES.format(gid=gid), *moves)
+
+    ### game distributions
+    turns_bucket = keys.histogram_bucket(number_of_turns, config.HISTOGRAM_TURNS_BUCKET)
+    checks_bucket = keys.histogram_bucket(number_of_checks, config.HISTOGRAM_CHECKS_BUCKET)
+    pipe.hincrby(keys.ANALYTICS_TURNS_HISTOGRAM, turns_bucket, 1)
+    pipe.hincrby(keys.ANALYTICS_CHECKS_HISTOGRAM, checks_bucket, 1)
+    pipe.hincrby(
+        keys.ANALYTICS_VICTORY_STATUS_OUTCOMES, f"{game_record['victory_status']}:{game_record['winner']}", 1)
+    pipe.hincrby(keys.ANALYTICS_OPENING_OUTCOMES, f"{game_record['opening_eco']}:{game_record['winner']}", 1)
+    pipe.zadd(keys.ANALYTICS_GAMES_BY_TURNS, {gid: number_of_turns})
 
 
+@traced
 def __update_common_seqs(redis_client: Redis, three_move_sequences: List[str]) -> None:
     """Updates the keys for determining the least/most common three-move sequences"""
     for three_move_sequence in three_move_sequences:
@@ -306,18 +620,97 @@ def __update_common_seqs(redis_client: Redis, three_move_sequences: List[str]) -
         __update_least_common_seqs(redis_client, three_move_sequence, new_count)
 
 
-def __update_most_freq_opening(redis_client: Redis, game_record: GameRecordTypedDict, this_game_eco_count: str) -> None:
-    """Determines if the opening in the given `game_record` now beats the current most frequently used opening across
-    all games; if so, the appropriate keys are updated
+@traced
+def __update_buffered_leaders(redis_client: Redis, result: FlushResultTypedDict) -> None:
+    """Updates the analytics leader keys once per flush of the write buffer, from the new values of the flushed
+    counters (see `enable_write_buffer`)
+    """
+    seq_counts = {
+        keys.unwrap_hash_tag(key[len(keys.GLOBAL_SEQ_PREFIX):-len(":count")]): count
+        for key, count in result["counters"].items()
+        if key.startswith(keys.GLOBAL_SEQ_PREFIX) and key.endswith(":count")
+    }
+    if seq_counts:
+        most_count = max(seq_counts.values())
+        for three_move_sequence in sorted(seq for seq, count in seq_counts.items() if count == most_count):
+            __update_most_common_seqs(redis_client, three_move_sequence, most_count)
+        __update_least_common_seqs_after_flush(redis_client, seq_counts)
+
+    eco_counts = [
+        (int(score), eco)
+        for (key, eco), score in result["scores"].items()
+        if key == keys.GLOBAL_OPENINGS_RANKING
+    ]
+    if eco_counts:
+        # ties are broken by ascending ECO code, as in the opening rankings
+        this_flush_eco_count, eco = min(eco_counts, key=lambda pair: (-pair[0], pair[1]))
+        __update_most_freq_opening(redis_client, eco, this_flush_eco_count)
+
+
+@traced
+def __update_least_common_seqs_after_flush(redis_client: Redis, seq_counts: Dict[str, int]) -> None:
+    """Batched variant of `__update_least_common_seqs` for the new counts of the sequences of one flush"""
+    least_count = redis_client.get(keys.ANALYTICS_LEAST_COMMON_SEQ_COUNT)
+    least_count = int(least_count) if least_count is not None else None
+    least_seqs = redis_client.smembers(keys.ANALYTICS_LEAST_COMMON_SEQS)
+    stale = least_seqs & set(seq_counts)  # counts only grow, so these are no longer at the minimum
+    remaining = least_seqs - stale
+    new_min_count = min(seq_counts.values())
+
+    if least_count is None or new_min_count < least_count or (new_min_count == least_count and not remaining):
+        # the flushed sequences hold the new minimum (any other sequence has a count of at least `least_count`)
+        new_min_seqs = [seq for seq, count in seq_counts.items() if count == new_min_count]
+    elif remaining:
+        pipe = redis_client.pipeline()
+        if new_min_count == least_count:
+            pipe.sadd(keys.ANALYTICS_LEAST_COMMON_SEQS, *[
+                seq for seq, count in seq_counts.items() if count == least_count])
+        if stale:
+            pipe.srem(keys.ANALYTICS_LEAST_COMMON_SEQS, *stale)
+        pipe.execute()
+        return
+    else:
+        # every least common sequence was incremented -> find the new minimum
+        new_min_count, new_min_seqs = __find_least_common_seqs(redis_client)
+
+    if new_min_seqs:
+        pipe = redis_client.pipeline()
+        pipe.delete(keys.ANALYTICS_LEAST_COMMON_SEQS)
+        pipe.sadd(keys.ANALYTICS_LEAST_COMMON_SEQS, *new_min_seqs)
+        pipe.set(keys.ANALYTICS_LEAST_COMMON_SEQ_COUNT, new_min_count)
+        pipe.execute()
+
+
+def __is_new_most_freq_opening(
+        eco: str,
+        eco_count: int,
+        most_used_eco: Optional[str],
+        most_used_eco_count: Optional[str]) -> bool:
+    """Returns True if the opening `eco`, now used `eco_count` times, replaces `most_used_eco` (used
+    `most_used_eco_count` times) as the most frequently used opening. Ties are broken by ascending ECO code, so that the
+    most_freq_opening keys name the leader of the opening ranking they are derived from (see `rankings.leader`).
+    NOTE: only valid if no other opening's count changed since `most_used_eco` was determined
+    """
+    if most_used_eco is None or most_used_eco_count is None:
+        return True
+    return eco_count > int(most_used_eco_count) or (eco_count == int(most_used_eco_count) and eco < most_used_eco)
+
+
+@traced
+def __update_most_freq_opening(redis_client: Redis, eco: str, this_game_eco_count: int) -> None:
+    """Determines if the opening `eco`, now used `this_game_eco_count` times, beats the current most frequently used
+    opening across all games; if so, the appropriate keys are updated
     """
-    most_used_eco_count = redis_client.get(keys.ANALYTICS_MOST_FREQ_OPENING_COUNT)
-    if most_used_eco_count is None or this_game_eco_count > int(most_used_eco_count):
+    most_used_eco, most_used_eco_count = redis_client.mget(
+        keys.ANALYTICS_MOST_FREQ_OPENING, keys.ANALYTICS_MOST_FREQ_OPENING_COUNT)
+    if __is_new_most_freq_opening(eco, this_game_eco_count, most_used_eco, most_used_eco_count):
         redis_client.mset({
-            keys.ANALYTICS_MOST_FREQ_OPENING: game_record["opening_eco"],
+            keys.ANALYTICS_MOST_FREQ_OPENING: eco,
             keys.ANALYTICS_MOST_FREQ_OPENING_COUNT: this_game_eco_count,
         })
 
 
+@traced
 def __update_shortest_game(redis_client: Redis, game_record: GameRecordTypedDict) -> None:
     """Determines if the turns in the given `game_record` now beats the current shortest game; if so, the appropriate
     keys are updated
@@ -330,6 +723,7 @@ def __update_shortest_game(redis_client: Redis, game_record: GameRecordTypedDict
         })
 
 
+@traced
 def __update_least_common_seqs(redis_client: Redis, three_move_sequence: str, new_count: int) -> None:
     """Determines if the given `three_move_sequence` now beats the current least common sequence; if so, the appropriate
     keys are updated
@@ -367,6 +761,7 @@ def __update_least_common_seqs(redis_client: Redis, three_move_sequence: str, ne
                 pipe.execute()
 
 
+@traced
 def __find_least_common_seqs(redis_client: Redis) -> Tuple[int, List[str]]:
     """If __update_least_common_seqs determines that the current least common sequence has lost its position, this
     helper function determines the next least common sequence
@@ -378,14 +773,15 @@ def __find_least_common_seqs(redis_client: Redis) -> Tuple[int, List[str]]:
         if cnt and (min_count is None or cnt < min_count):
             min_count = cnt
             # Extract the sequence from the key
-            seq = key[len(keys.GLOBAL_SEQ_PREFIX):-6]
+            seq = keys.unwrap_hash_tag(key[len(keys.GLOBAL_SEQ_PREFIX):-6])
             min_seqs = [seq]
         elif cnt == min_count:
-            seq = key[len(keys.GLOBAL_SEQ_PREFIX):-6]
+            seq = keys.unwrap_hash_tag(key[len(keys.GLOBAL_SEQ_PREFIX):-6])
             min_seqs.append(seq)
     return min_count, min_seqs
 
 
+@traced
 def __update_most_common_seqs(redis_client: Redis, three_move_sequence: str, new_count: int) -> None:
     """Determines if the given `three_move_sequence` now beats the current most common sequence; if so, the appropriate
     keys are updated
@@ -0,0 +1,74 @@
+"""conftest.py
+Shared fixtures of the behavior tests of the deliverables. The tests run against a live, standalone Redis server
+(BGC_REDIS_HOST/BGC_REDIS_PORT, see config.py), in the database BGC_TEST_REDIS_DB (15 by default), which is flushed
+around every test; they are skipped if the server cannot be reached.
+
+    Example: `python -m pytest -q tests`
+
+NOTE: test_queries.py is not part of this suite; it is a standalone script checking a database loaded with the full
+dataset (`python tests/test_queries.py`)
+"""
+
+import os
+import sys
+from typing import Callable, Iterator
+
+import pytest
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+# NOTE: set before the deliverables are imported, as config.py reads its settings once, at import time
+os.environ["BGC_REDIS_DB"] = os.environ.get("BGC_TEST_REDIS_DB", "15")
+os.environ["BGC_REDIS_CLUSTER"] = "0"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "deliverables"))
+
+from connection import get_redis_client  # noqa: E402
+from models import GameRecordTypedDict, PlayerTypedDict  # noqa: E402
+
+collect_ignore = ["test_queries.py"]
+
+
+@pytest.fixture
+def redis_client() -> Iterator[Redis]:
+    """A client of the (flushed) test database"""
+    client = get_redis_client()
+    try:
+        client.ping()
+    except ConnectionError as e:
+        pytest.skip(f"Redis is not reachable: {e}")
+    client.flushdb()
+    yield client
+    client.flushdb()
+
+
+@pytest.fixture
+def make_player() -> Callable[..., PlayerTypedDict]:
+    """Factory of player rows"""
+    def make(user_id: str) -> PlayerTypedDict:
+        return {"user_id": user_id, "email": f"{user_id}@example.com"}
+    return make
+
+
+@pytest.fixture
+def make_game_record() -> Callable[..., GameRecordTypedDict]:
+    """Factory of game record rows, as read from the CSV file (the moveset is a string)"""
+    def make(
+            game_id: str,
+            white: str = "alice",
+            black: str = "bob",
+            winner: str = "white",
+            moveset: str = "['e4', 'e5', 'Nf3', 'Nc6', 'Bb5+']",
+            number_of_turns: int = 5,
+            victory_status: str = "mate",
+            opening_eco: str = "C60") -> GameRecordTypedDict:
+        return {
+            "game_id": game_id,
+            "moveset": moveset,
+            "winner": winner,
+            "victory_status": victory_status,
+            "number_of_turns": str(number_of_turns),
+            "white_player_id": white,
+            "black_player_id": black,
+            "opening_eco": opening_eco,
+        }
+    return make
@@ -0,0 +1,122 @@
+"""Behavior tests of the game distributions and distinct counts of analytics_funcs.py, maintained by write_funcs.py"""
+
+import math
+
+import pytest
+
+import analytics_funcs
+import config
+import keys
+from write_funcs import add_game_records
+
+
+@pytest.fixture
+def analytics(redis_client, monkeypatch):
+    """Points the module-level read client of analytics_funcs at the test database"""
+    monkeypatch.setattr(analytics_funcs, "r", redis_client)
+    return redis_client
+
+
+@pytest.fixture
+def games(analytics, make_game_record):
+    """Records 20 games of 1, 2, ..., 20 turns, "g01" to "g20", plus "h05", a second game of 5 turns"""
+    game_records = [make_game_record(f"g{turns:02d}", number_of_turns=turns) for turns in range(1, 21)]
+    game_records.append(make_game_record("h05", number_of_turns=5, winner="draw", victory_status="resign"))
+    add_game_records(analytics, game_records)
+    return analytics
+
+
+def test_turns_percentiles_are_exact(games, monkeypatch):
+    monkeypatch.setattr(config, "HISTOGRAM_TURNS_BUCKET", 10)
+    turns = sorted(list(range(1, 21)) + [5])
+    expected = {p: turns[max(1, math.ceil(p / 100 * len(turns))) - 1] for p in analytics_funcs.PERCENTILES}
+    assert analytics_funcs.get_turns_distribution()["percentiles"] == expected
+    assert analytics_funcs.get_game_distributions()["number_of_turns"]["percentiles"] == expected
+    assert analytics_funcs.get_turns_distribution(percentiles=(0, 100))["percentiles"] == {0: 1, 100: 20}
+
+
+def test_game_distributions_are_read_in_one_round_trip(games, monkeypatch):
+    executed = []
+    pipeline = games.pipeline
+
+    def spy(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def spy_execute(*args, **kwargs):
+            executed.append([command[0][0] for command in pipe.command_stack])
+            return execute(*args, **kwargs)
+        pipe.execute = spy_execute
+        return pipe
+    monkeypatch.setattr(games, "pipeline", spy)
+
+    distributions = analytics_funcs.get_game_distributions(n=3)
+    assert executed == [["HGETALL"] * 4 + ["EVAL", "ZRANGE", "ZREVRANGE"]]
+    assert distributions["shortest_games"] == [
+        {"game_id": "g01", "number_of_turns": 1},
+        {"game_id": "g02", "number_of_turns": 2},
+        {"game_id": "g03", "number_of_turns": 3},
+    ]
+    assert distributions["longest_games"] == [
+        {"game_id": "g20", "number_of_turns": 20},
+        {"game_id": "g19", "number_of_turns": 19},
+        {"game_id": "g18", "number_of_turns": 18},
+    ]
+    assert distributions["shortest_games"] == analytics_funcs.get_shortest_games(3)
+    assert distributions["longest_games"] == analytics_funcs.get_longest_games(3)
+    assert distributions["number_of_turns"]["games"] == 21
+    assert distributions["victory_status_outcomes"] == analytics_funcs.get_victory_status_outcomes()
+
+
+def test_longest_games_break_ties_by_descending_game_id(games):
+    assert analytics_funcs.get_shortest_games(6)[-2:] == [
+        {"game_id": "g05", "number_of_turns": 5},
+        {"game_id": "h05", "number_of_turns": 5},
+    ]
+    assert analytics_funcs.get_longest_games(17)[-2:] == [
+        {"game_id": "h05", "number_of_turns": 5},
+        {"game_id": "g05", "number_of_turns": 5},
+    ]
+
+
+def test_game_distributions_without_games(analytics):
+    distributions = analytics_funcs.get_game_distributions()
+    assert distributions["number_of_turns"]["percentiles"] == {}
+    assert distributions["shortest_games"] == distributions["longest_games"] == []
+    assert not analytics.exists(keys.ANALYTICS_GAMES_BY_TURNS)
+
+
+@pytest.mark.parametrize("value, bucket_width, bucket", [(0, 10, 0), (9, 10, 0), (10, 10, 10), (57, 10, 50), (3, 1, 3)])
+def test_histogram_bucket(value, bucket_width, bucket):
+    assert keys.histogram_bucket(value, bucket_width) == bucket
+
+
+def test_distinct_counts(analytics, make_game_record, monkeypatch):
+    monkeypatch.setattr(config, "LOAD_ID", "load-1")
+    add_game_records(analytics, [
+        make_game_record("g1", "alice", "bob", moveset="['e4', 'e5', 'Nf3', 'Nc6']"),
+        make_game_record("g2", "carol", "alice", moveset="['e4', 'e5', 'Nf3']", opening_eco="C20"),
+    ])
+    monkeypatch.setattr(config, "LOAD_ID", "load-2")
+    add_game_records(analytics, [
+        make_game_record("g3", "dave", "erin", moveset="['d4', 'd5', 'c4', 'e6']", opening_eco="D30"),
+        make_game_record("g4", "bob", "alice", moveset="['e4', 'e5', 'Nf3']"),
+    ])
+
+    assert analytics_funcs.get_distinct_opponents_count("alice") == 2
+    assert analytics_funcs.get_distinct_openings_count("alice") == 2
+    assert analytics_funcs.get_distinct_opponents_count("nobody") == 0
+    assert analytics_funcs.get_distinct_3move_sequences_count() == 4
+    assert analytics_funcs.get_distinct_3move_sequences_count("load-1") == 2
+    assert analytics_funcs.get_distinct_3move_sequences_count("load-2") == 3
+
+    assert analytics_funcs.get_group_distinct_opponents_count(["alice", "dave"]) == 3  # bob, carol, erin
+    assert analytics_funcs.get_group_distinct_openings_count(["alice", "dave", "nobody"]) == 3
+    assert analytics_funcs.get_group_distinct_openings_count(["nobody"]) == 0
+    assert analytics_funcs.get_group_distinct_openings_count([]) == 0
+    # friend groups join the players of every game: {alice, bob, carol} and {dave, erin}
+    assert analytics_funcs.get_friend_group_distinct_opponents_count("bob") == 3
+    assert analytics_funcs.get_friend_group_distinct_opponents_count("erin") == 2
+    assert analytics_funcs.get_friend_group_distinct_opponents_count("nobody") == 0
+    # the temporary keys of the unions are removed
+    assert not list(analytics.scan_iter(match="tmp:*"))
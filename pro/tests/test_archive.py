@@ -0,0 +1,55 @@
+"""Behavior tests of the cold tier of the game moves (archive.py)"""
+
+import pytest
+
+import archive
+import config
+import keys
+from write_funcs import add_game_records
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    """An empty archive directory, with no segment mapped yet (segment names restart with every flushed database)"""
+    monkeypatch.setattr(config, "ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(archive, "__segments", {})
+    return tmp_path
+
+
+@pytest.fixture
+def games(redis_client, make_game_record):
+    """Records the games "g0" to "g5", whose movesets differ by their last move"""
+    moves = ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6", "Ba4", "Nf6"]
+    add_game_records(redis_client, [
+        make_game_record(f"g{i}", moveset=str(moves[:3 + i]), number_of_turns=3 + i) for i in range(6)
+    ])
+    return {f"g{i}": moves[:3 + i] for i in range(6)}
+
+
+def test_archive_moves_the_older_move_lists(redis_client, archive_dir, games):
+    assert archive.archive_games(redis_client, keep_recent=2) == 4
+    assert [redis_client.exists(keys.GAME_MOVES.format(gid=gid)) for gid in games] == [0, 0, 0, 0, 1, 1]
+    assert archive.get_games_moves(redis_client, list(games) + ["unknown"]) == list(games.values()) + [[]]
+    assert len(list(archive_dir.iterdir())) == 1
+
+    # the next run only archives the games ingested since
+    assert archive.archive_games(redis_client, keep_recent=2) == 0
+    assert archive.archive_games(redis_client, keep_recent=0) == 2
+    assert len(list(archive_dir.iterdir())) == 2
+    assert [archive.get_game_moves(redis_client, gid) for gid in games] == list(games.values())
+
+
+def test_reads_follow_a_segment_growing_during_a_run(redis_client, archive_dir, games, monkeypatch):
+    # a game of the first batch is read (and its segment mapped) while the next batches are still being archived
+    pipeline = redis_client.pipeline
+    reads = []
+
+    def read_between_batches(*args, **kwargs):
+        if redis_client.hlen(keys.ARCHIVE_INDEX) == 2 and not reads:
+            reads.append(archive.read_archived_moves(redis_client.hget(keys.ARCHIVE_INDEX, "g0")))
+        return pipeline(*args, **kwargs)
+    monkeypatch.setattr(redis_client, "pipeline", read_between_batches)
+
+    assert archive.archive_games(redis_client, keep_recent=0, batch_size=2) == 6
+    assert reads == [games["g0"]]
+    assert [archive.get_game_moves(redis_client, gid) for gid in games] == list(games.values())
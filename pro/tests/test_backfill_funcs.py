@@ -0,0 +1,103 @@
+"""Behavior tests of the backfills (backfill_funcs.py): each rebuilds the same state as the one maintained at ingest"""
+
+import pytest
+
+import analytics_funcs
+import backfill_funcs
+import config
+import keys
+import player_funcs
+import profiles
+from game_funcs import opening_explorer
+from write_funcs import add_game_records, add_players, add_schedule
+
+
+@pytest.fixture
+def club(redis_client, make_player, make_game_record):
+    """A club of three players with a few recorded games and a scheduled game (which shares the game id set)"""
+    add_players(redis_client, [make_player(pid) for pid in ("alice", "bob", "carol")])
+    add_game_records(redis_client, [
+        make_game_record("g1", "alice", "bob", "white"),
+        make_game_record("g2", "bob", "alice", "white", number_of_turns=42, opening_eco="B21"),
+        make_game_record("g3", "alice", "bob", "draw", moveset="['d4', 'd5', 'c4', 'e6']", number_of_turns=4),
+        make_game_record("g4", "carol", "alice", "black", victory_status="resign", number_of_turns=17),
+    ])
+    add_schedule(redis_client, {"game_id": "s1", "player_1": "bob", "player_2": "carol"})
+    return redis_client
+
+
+def test_head_to_head_backfill_skips_scheduled_games(club):
+    pairs = [("alice", "bob"), ("carol", "alice"), ("bob", "carol")]
+    maintained = [player_funcs.head_to_head_record(club, *pair) for pair in pairs]
+    assert maintained[0] == {"games": 3, "wins": 1, "losses": 1, "draws": 1}
+    for key in club.scan_iter("h2h:*"):
+        club.delete(key)
+
+    assert backfill_funcs.backfill_head_to_head(club) == 2
+    assert [player_funcs.head_to_head_record(club, *pair) for pair in pairs] == maintained
+    assert player_funcs.games_against_opponent(club, "alice", "bob") == ["g1", "g2", "g3"]
+
+
+def test_opening_tree_backfill_rebuilds_the_maintained_tree(club, monkeypatch):
+    lines = ["", "e4", "e4,e5,Nf3", "d4,d5", "e4,e5,Nf3,Nc6,Bb5+"]
+    maintained = [opening_explorer(club, line) for line in lines]
+    assert maintained[0][0] == {
+        "move": "e4", "games": 3, "white": 2, "black": 1, "draw": 0,
+        "white_rate": pytest.approx(200 / 3), "black_rate": pytest.approx(100 / 3), "draw_rate": 0.0}
+    for key in club.scan_iter("opening_tree:*"):
+        club.delete(key)
+
+    assert backfill_funcs.backfill_opening_tree(club, batch_size=2) == 8
+    assert [opening_explorer(club, line) for line in lines] == maintained
+
+    # a shallower depth only rewrites the nodes it covers
+    monkeypatch.setattr(config, "OPENING_TREE_DEPTH", 1)
+    assert backfill_funcs.backfill_opening_tree(club) == 1
+    assert [opening_explorer(club, line) for line in lines] == maintained
+    monkeypatch.setattr(config, "OPENING_TREE_DEPTH", 0)
+    assert backfill_funcs.backfill_opening_tree(club) == 0
+
+
+def test_profiles_backfill_rebuilds_the_maintained_profiles(club, monkeypatch):
+    monkeypatch.setattr(profiles, "__resolved_backend", "hash")
+    pids = ["alice", "bob", "carol"]
+    maintained = [profiles.get_profile(club, pid) for pid in pids]
+    assert maintained[1]["scheduled_games"] == [{"game_id": "s1", "opponent": "carol"}]
+    for pid in pids:
+        club.delete(keys.PLAYER_PROFILE.format(pid=pid))
+
+    assert backfill_funcs.backfill_profiles(club) == 3
+    assert [profiles.get_profile(club, pid) for pid in pids] == maintained
+
+
+def test_histograms_backfill_rebuilds_the_maintained_distributions(club, monkeypatch):
+    monkeypatch.setattr(analytics_funcs, "r", club)
+    maintained = analytics_funcs.get_game_distributions()
+    assert maintained["number_of_turns"]["games"] == 4
+    club.delete(keys.ANALYTICS_TURNS_HISTOGRAM, keys.ANALYTICS_GAMES_BY_TURNS, keys.ANALYTICS_OPENING_OUTCOMES)
+
+    assert backfill_funcs.backfill_histograms(club) == 4
+    assert analytics_funcs.get_game_distributions() == maintained
+
+
+def test_openings_backfill_migrates_the_per_opening_counters(club, monkeypatch):
+    monkeypatch.setattr(profiles, "__resolved_backend", "hash")
+    monkeypatch.setattr(analytics_funcs, "r", club)
+    pids = ["alice", "bob", "carol"]
+    maintained = [player_funcs.player_top_openings(club, pid, 5) for pid in pids]
+    assert maintained[0] == [("C60", 3), ("B21", 1)]
+    # a database loaded before the opening rankings: one counter per opening, and a stale most frequent opening
+    for pid in pids:
+        club.delete(keys.PLAYER_OPENINGS_RANKING.format(pid=pid))
+        club.set(keys.PLAYER_MOST_FREQ_OPENING.format(pid=pid), "B21")
+    club.delete(keys.GLOBAL_OPENINGS_RANKING)
+    club.set("player:alice:openings:C60:count", 3)
+    club.set("global:openings:C60:count", 4)
+
+    assert backfill_funcs.backfill_openings(club) == 4
+    assert [player_funcs.player_top_openings(club, pid, 5) for pid in pids] == maintained
+    assert analytics_funcs.get_most_frequent_opening() == {"opening_eco": "C60", "count": 3}
+    assert [club.get(keys.PLAYER_MOST_FREQ_OPENING.format(pid=pid)) for pid in pids] == ["C60", "C60", "C60"]
+    assert profiles.get_profile(club, "alice")["most_freq_opening"] == "C60"
+    assert club.get(keys.ANALYTICS_MOST_FREQ_OPENING) == "C60"
+    assert not club.exists("player:alice:openings:C60:count", "global:openings:C60:count")
@@ -0,0 +1,183 @@
+"""Behavior tests of the cluster-mode key shapes (keys.py) and of the multi-key fallbacks of cluster.py
+
+The fallbacks run against the standalone test server with `cluster.is_cluster` forced to True, and against the Redis
+Cluster at BGC_TEST_REDIS_CLUSTER_PORT (7000 by default, see redis/cluster-build-and-run.txt) when it can be reached.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import uuid
+from typing import Iterator, List, Tuple
+
+import pytest
+from redis import Redis
+from redis.cluster import RedisCluster
+from redis.crc import key_slot
+from redis.exceptions import RedisClusterException, RedisError
+
+import cluster
+import keys
+
+DELIVERABLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "deliverables")
+
+
+def __slot(name: str) -> int:
+    return key_slot(name.encode("utf-8"))
+
+
+def __cluster_mode_keys() -> dict:
+    """Formats a sample of the keys in a fresh interpreter, with cluster mode enabled"""
+    script = """
+import json
+import keys
+print(json.dumps({
+    "player": [
+        keys.PLAYER_EMAIL.format(pid="alice"),
+        keys.PLAYER_GAMES_SET.format(pid="alice"),
+        keys.PLAYER_OPENINGS_RANKING.format(pid="alice"),
+        keys.PLAYER_SCHEDULED_GAME_OPPONENT.format(pid="alice", gid="g1"),
+        keys.PLAYER_PROFILE.format(pid="alice"),
+    ],
+    "game": [keys.GAME_WINNER.format(gid="g1"), keys.GAME_MOVES.format(gid="g1")],
+    "h2h": [keys.H2H_GAMES.format(pid_a="alice", pid_b="bob"), keys.H2H_RECORD.format(pid_a="alice", pid_b="bob")],
+    "seq": [keys.GLOBAL_SEQ_GAMES.format(seq="e4,e5,Nf3"), keys.GLOBAL_SEQ_COUNT.format(seq="e4,e5,Nf3")],
+    "analytics": [keys.ANALYTICS_TOP_WINS, keys.ANALYTICS_RATINGS, keys.ANALYTICS_GAMES_BY_TURNS],
+}))
+"""
+    env = dict(os.environ, BGC_REDIS_CLUSTER="1")
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=DELIVERABLES_DIR, env=env, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout)
+
+
+def test_hash_tags_follow_the_cluster_mode(monkeypatch):
+    monkeypatch.setattr(keys, "REDIS_CLUSTER", False)
+    assert keys._hash_tag("pid") == "{pid}"
+    assert ("h2h:" + keys._hash_tag("pid_a", "pid_b")).format(pid_a="alice", pid_b="bob") == "h2h:alice:bob"
+    assert keys._literal_hash_tag("analytics") == "analytics"
+
+    monkeypatch.setattr(keys, "REDIS_CLUSTER", True)
+    assert ("player:" + keys._hash_tag("pid") + ":email").format(pid="alice") == "player:{alice}:email"
+    assert ("h2h:" + keys._hash_tag("pid_a", "pid_b")).format(pid_a="alice", pid_b="bob") == "h2h:{alice:bob}"
+    assert keys._literal_hash_tag("analytics") == "{analytics}"
+
+    assert keys.unwrap_hash_tag("{alice}") == "alice"
+    assert keys.unwrap_hash_tag("alice") == "alice"
+
+
+def test_cluster_mode_keys_of_one_entity_share_a_slot():
+    sample = __cluster_mode_keys()
+    assert sample["player"][0] == "player:{alice}:email"
+    assert sample["analytics"][0] == "{analytics}:top_wins"
+    for names in sample.values():
+        assert len({__slot(name) for name in names}) == 1, names
+    # the keys of different entities are spread over the slots
+    assert __slot(sample["player"][0]) != __slot(sample["game"][0])
+
+
+@pytest.fixture
+def cluster_client() -> Iterator[RedisCluster]:
+    """A client of the Redis Cluster at BGC_TEST_REDIS_CLUSTER_PORT; the tests only touch keys prefixed with "test:" """
+    try:
+        client = RedisCluster(
+            host=os.environ.get("BGC_REDIS_HOST", "localhost"),
+            port=int(os.environ.get("BGC_TEST_REDIS_CLUSTER_PORT", "7000")),
+            decode_responses=True)
+    except (RedisClusterException, RedisError) as e:
+        pytest.skip(f"Redis Cluster is not reachable: {e}")
+    yield client
+    client.close()
+
+
+@pytest.fixture(params=["standalone", "cluster"])
+def scattered_client(request, monkeypatch) -> Iterator[Tuple[Redis, List[str]]]:
+    """A client on which cluster.py takes its scatter/gather paths (for keys of different slots), and the list of the
+    keys to delete afterwards
+    """
+    if request.param == "standalone":
+        monkeypatch.setattr(cluster, "is_cluster", lambda redis_client: True)
+        client = request.getfixturevalue("redis_client")
+    else:
+        client = request.getfixturevalue("cluster_client")
+    # the temporary keys of one call share a slot, as they do in cluster mode
+    monkeypatch.setattr(keys, "TMP_KEY", "tmp:{{{token}}}:{name}")
+    names = []
+    yield client, names
+    # NOTE: deleted one at a time, as the keys live in different slots
+    for name in names:
+        client.delete(name)
+
+
+def __names(names: List[str], *tags: str) -> List[str]:
+    """Returns (and records for cleanup) keys whose hash tags put them in different slots"""
+    token = uuid.uuid4().hex
+    created = [f"test:{token}:{{{tag}}}" for tag in tags]
+    assert len({__slot(name) for name in created}) == len(created)
+    names.extend(created)
+    return created
+
+
+def test_sinter_and_sdiff_across_slots(scattered_client):
+    client, names = scattered_client
+    a, b, c, empty = __names(names, "a", "b", "c", "empty")
+    client.sadd(a, "g1", "g2", "g3", "g4")
+    client.sadd(b, "g2", "g3", "g4", "g5")
+    client.sadd(c, "g3", "g4", "g6")
+
+    assert cluster.sinter(client, a, b, c) == {"g3", "g4"}
+    assert cluster.sinter(client, a, b, empty) == set()
+    assert cluster.sdiff(client, a, b) == {"g1"}
+    assert cluster.sdiff(client, b, a, c) == {"g5"}
+    assert cluster.sdiff(client, a, empty) == {"g1", "g2", "g3", "g4"}
+
+
+def test_pfcount_union_across_slots(scattered_client):
+    client, names = scattered_client
+    a, b, missing = __names(names, "a", "b", "missing")
+    client.pfadd(a, *(f"p{i}" for i in range(0, 60)))
+    client.pfadd(b, *(f"p{i}" for i in range(40, 100)))
+
+    # HyperLogLog estimates have a standard error of 0.81%
+    assert cluster.pfcount_union(client, [a, b, missing]) == pytest.approx(100, abs=3)
+    assert cluster.pfcount_union(client, [missing]) == 0
+    assert cluster.pfcount_union(client, []) == 0
+    # the temporary keys are removed
+    assert not list(client.scan_iter(match=keys.TMP_KEY.format(token="*", name="*")))
+
+
+def test_bitop_and_across_slots(scattered_client):
+    client, names = scattered_client
+    a, b, missing = __names(names, "a", "b", "missing")
+    for offset in (0, 3, 9, 17):
+        client.setbit(a, offset, 1)
+    for offset in (3, 9, 12):
+        client.setbit(b, offset, 1)
+
+    result = cluster.bitop_and(client, a, b)
+    assert [offset for offset in range(8 * len(result)) if result[offset // 8] & (0x80 >> offset % 8)] == [3, 9]
+    assert not any(cluster.bitop_and(client, a, missing))
+
+
+def test_mset_across_slots(cluster_client):
+    names = [f"test:{uuid.uuid4().hex}:{{{tag}}}" for tag in ("a", "b", "c")]
+    try:
+        cluster.mset(cluster_client, {name: i for i, name in enumerate(names)})
+        assert [cluster_client.get(name) for name in names] == ["0", "1", "2"]
+
+        pipe = cluster_client.pipeline()
+        cluster.mset(pipe, {name: f"piped-{i}" for i, name in enumerate(names)})
+        pipe.execute()
+        assert [cluster_client.get(name) for name in names] == ["piped-0", "piped-1", "piped-2"]
+    finally:
+        for name in names:
+            cluster_client.delete(name)
+
+
+def test_mset_in_one_slot(redis_client):
+    cluster.mset(redis_client, {"test:a": 1, "test:b": 2})
+    pipe = redis_client.pipeline()
+    cluster.mset(pipe, {"test:c": 3})
+    pipe.execute()
+    assert redis_client.mget("test:a", "test:b", "test:c") == ["1", "2", "3"]
@@ -0,0 +1,133 @@
+"""Behavior tests of the bitmap encoding of the game sets (game_bitmaps.py), written at ingest and by the backfill"""
+
+import ast
+import random
+
+import pytest
+
+import backfill_funcs
+import config
+import game_bitmaps
+import game_funcs
+import keys
+from write_funcs import add_game_records, add_players
+
+MOVES = ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6", "d4", "d5", "c4"]
+
+
+@pytest.fixture
+def bitmap_encoding(monkeypatch):
+    monkeypatch.setattr(config, "GAME_SETS_ENCODING", "bitmap")
+    monkeypatch.setattr(config, "GAME_SETS_BITMAP_MIN_GAMES", 4)
+
+
+def __games(make_game_record, count):
+    """Returns `count` random game records between 4 players, playing a few common and a long tail of rare sequences"""
+    rnd = random.Random(5)
+    game_records = []
+    for i in range(count):
+        white, black = rnd.sample(["p0", "p1", "p2", "p3"], 2)
+        moves = ["e4", "e5"] + [rnd.choice(MOVES) for _ in range(rnd.randint(1, 4))]
+        game_records.append(make_game_record(f"g{i:03d}", white, black, moveset=str(moves)))
+    return game_records
+
+
+def __queries(redis_client, game_records):
+    """Returns the games of every sequence of `game_records`, and of the players "p0" and "p1", as read by game_funcs"""
+    seqs = set()
+    for game_record in game_records:
+        moves = ast.literal_eval(game_record["moveset"])
+        seqs.update(",".join(moves[i:i + 3]) for i in range(len(moves) - 2))
+    return {
+        seq: (
+            game_funcs.global_seq(redis_client, seq),
+            [game_funcs.player_seq(redis_client, pid, seq) for pid in ("p0", "p1")],
+        )
+        for seq in sorted(seqs)
+    }
+
+
+def test_bitmap_encoding_answers_like_sets(redis_client, make_player, make_game_record, monkeypatch):
+    game_records = __games(make_game_record, 120)
+    add_players(redis_client, [make_player(f"p{i}") for i in range(4)])
+    add_game_records(redis_client, game_records)
+    expected = __queries(redis_client, game_records)
+
+    redis_client.flushdb()
+    monkeypatch.setattr(config, "GAME_SETS_ENCODING", "bitmap")
+    monkeypatch.setattr(config, "GAME_SETS_BITMAP_MIN_GAMES", 4)
+    add_players(redis_client, [make_player(f"p{i}") for i in range(4)])
+    for i in range(0, len(game_records), 7):
+        add_game_records(redis_client, game_records[i:i + 7])
+    assert __queries(redis_client, game_records) == expected
+
+    # the common sequences and the players are bitmaps, while the rare sequences stay small sets of game indexes
+    assert redis_client.type(keys.GLOBAL_SEQ_GAMES_BITMAP.format(seq="e4,e5,e4")) == "string"
+    assert redis_client.type(keys.PLAYER_GAMES_BITMAP.format(pid="p0")) == "string"
+    assert not redis_client.exists(keys.PLAYER_GAMES_INDEXES.format(pid="p0"))
+    rare = [seq for seq, (games, _) in expected.items() if len(games) < 4]
+    assert rare
+    for seq in rare:
+        assert redis_client.scard(keys.GLOBAL_SEQ_GAMES_INDEXES.format(seq=seq)) == len(expected[seq][0])
+        assert not redis_client.exists(keys.GLOBAL_SEQ_GAMES_BITMAP.format(seq=seq))
+
+
+def test_game_set_becomes_a_bitmap_once_dense(redis_client, bitmap_encoding):
+    game_set = game_bitmaps.player_game_set("p0")
+    game_bitmaps.load_scripts(redis_client)
+    pipe = redis_client.pipeline(transaction=False)
+    # 3 games of 10: too few games
+    game_bitmaps.queue_add(pipe, game_set, [1, 5, 9], 10)
+    # 4 games of 200: too sparse (fewer than 1 in 32 games)
+    game_bitmaps.queue_add(pipe, game_set, [199], 200)
+    pipe.execute()
+    assert redis_client.smembers(game_set[0]) == {"1", "5", "9", "199"}
+    assert not redis_client.exists(game_set[1])
+
+    game_bitmaps.queue_add(pipe, game_set, [200, 201, 202], 203)
+    pipe.execute()
+    assert not redis_client.exists(game_set[0])
+    assert game_bitmaps.positions(game_bitmaps.get_bytes(redis_client, game_set[1])) == [1, 5, 9, 199, 200, 201, 202]
+
+
+def test_intersection_of_a_bitmap_and_a_set(redis_client, bitmap_encoding):
+    for index in range(8):
+        game_bitmaps.queue_index_mapping(redis_client, f"g{index}", index)
+    dense, sparse, empty = (game_bitmaps.seq_game_set(seq) for seq in ("dense", "sparse", "empty"))
+    game_bitmaps.load_scripts(redis_client)
+    pipe = redis_client.pipeline(transaction=False)
+    game_bitmaps.queue_add(pipe, dense, [0, 1, 2, 3, 4, 5], 8)
+    game_bitmaps.queue_add(pipe, sparse, [3, 6, 5], 8)
+    pipe.execute()
+
+    assert game_bitmaps.members(redis_client, dense) == ["g0", "g1", "g2", "g3", "g4", "g5"]
+    assert game_bitmaps.members(redis_client, sparse) == ["g3", "g5", "g6"]
+    assert game_bitmaps.intersection(redis_client, dense, sparse) == ["g3", "g5"]
+    assert game_bitmaps.intersection(redis_client, sparse, dense) == ["g3", "g5"]
+    assert game_bitmaps.intersection(redis_client, dense, dense) == game_bitmaps.members(redis_client, dense)
+    assert game_bitmaps.intersection(redis_client, sparse, empty) == []
+    assert game_bitmaps.intersection(redis_client, dense, empty) == []
+
+
+def test_backfill_converts_the_game_sets(redis_client, make_player, make_game_record, monkeypatch):
+    add_players(redis_client, [make_player(f"p{i}") for i in range(4)])
+    game_records = __games(make_game_record, 60)
+    add_game_records(redis_client, game_records)
+    expected = __queries(redis_client, game_records)
+
+    monkeypatch.setattr(config, "GAME_SETS_BITMAP_MIN_GAMES", 4)
+    written = backfill_funcs.backfill_game_bitmaps(redis_client, batch_size=10)
+    assert written == 4 + len(expected)
+    monkeypatch.setattr(config, "GAME_SETS_ENCODING", "bitmap")
+    for key in redis_client.scan_iter(match="global:seq:*:games"):
+        redis_client.delete(key)
+    assert __queries(redis_client, game_records) == expected
+    # re-running the backfill keeps the game indexes
+    assert backfill_funcs.backfill_game_bitmaps(redis_client) == 4
+    assert redis_client.get(keys.GLOBAL_GAMES_NEXT_INDEX) == "60"
+
+
+def test_backfill_skips_players_without_games(redis_client, make_player):
+    add_players(redis_client, [make_player("alice"), make_player("bob")])
+    assert backfill_funcs.backfill_game_bitmaps(redis_client) == 0
+    assert not redis_client.exists(keys.GLOBAL_GAMES_NEXT_INDEX)
@@ -0,0 +1,44 @@
+"""Behavior tests of the opening explorer (game_funcs.py), fed by the opening tree maintained at ingest"""
+
+import pytest
+
+import config
+from game_funcs import opening_explorer
+from write_funcs import add_game_records
+
+
+@pytest.fixture
+def games(redis_client, make_game_record):
+    """Four games: three 1. e4 (two won by white, one by black) and one drawn 1. d4"""
+    add_game_records(redis_client, [
+        make_game_record("g1", winner="white"),
+        make_game_record("g2", winner="white", moveset="['e4', 'c5', 'Nf3']"),
+        make_game_record("g3", winner="black", moveset="['e4', 'e5', 'Bc4']"),
+        make_game_record("g4", winner="draw", moveset="['d4', 'd5']"),
+    ])
+    return redis_client
+
+
+def test_explorer_tallies_the_moves_after_a_line(games):
+    assert opening_explorer(games) == [
+        {"move": "e4", "games": 3, "white": 2, "black": 1, "draw": 0,
+         "white_rate": pytest.approx(200 / 3), "black_rate": pytest.approx(100 / 3), "draw_rate": 0.0},
+        {"move": "d4", "games": 1, "white": 0, "black": 0, "draw": 1,
+         "white_rate": 0.0, "black_rate": 0.0, "draw_rate": 100.0},
+    ]
+    # ties are broken by move
+    assert [(entry["move"], entry["games"]) for entry in opening_explorer(games, "e4,e5")] == [("Bc4", 1), ("Nf3", 1)]
+    assert [entry["move"] for entry in opening_explorer(games, "e4")] == ["e5", "c5"]
+    assert opening_explorer(games, "e4,e5,Nf3,Nc6,Bb5+") == []
+    assert opening_explorer(games, "a3") == []
+
+
+def test_explorer_only_tracks_the_configured_depth(redis_client, make_game_record, monkeypatch):
+    monkeypatch.setattr(config, "OPENING_TREE_DEPTH", 2)
+    add_game_records(redis_client, [make_game_record("g1")])
+    assert [entry["move"] for entry in opening_explorer(redis_client, "e4")] == ["e5"]
+    assert opening_explorer(redis_client, "e4,e5") == []
+
+    monkeypatch.setattr(config, "OPENING_TREE_DEPTH", 0)
+    add_game_records(redis_client, [make_game_record("g2")])
+    assert opening_explorer(redis_client)[0]["games"] == 1
@@ -0,0 +1,83 @@
+"""Behavior tests of the streams ingest (ingest_stream.py) and of the batched game record writes it relies on"""
+
+import pytest
+
+import config
+import ingest_stream
+import keys
+from models import BoardGameClubInvalidRecordError
+from write_funcs import add_game_record, add_game_records
+
+
+def test_invalid_record_fails_the_batch_before_any_game_id_is_claimed(redis_client, make_game_record):
+    good, bad = make_game_record("g2"), make_game_record("g3", moveset="['e4', 'e5'")
+    with pytest.raises(BoardGameClubInvalidRecordError):
+        add_game_records(redis_client, [good, bad])
+    assert redis_client.smembers(keys.GLOBAL_GAMES_IDS) == set()
+
+    assert add_game_records(redis_client, [good]) == ["g2"]
+    assert redis_client.get(keys.GAME_WINNER.format(gid="g2")) == "white"
+
+
+@pytest.mark.parametrize("field, value", [
+    ("moveset", "not a moveset"),
+    ("moveset", "[]"),
+    ("moveset", "{'e4': 1}"),
+    ("number_of_turns", "many"),
+])
+def test_invalid_record_is_not_claimed(redis_client, make_game_record, field, value):
+    game_record = make_game_record("g1")
+    game_record[field] = value
+    with pytest.raises(BoardGameClubInvalidRecordError):
+        add_game_record(redis_client, game_record)
+    assert not redis_client.sismember(keys.GLOBAL_GAMES_IDS, "g1")
+
+
+def test_invalid_entries_are_dead_lettered_and_acknowledged(redis_client, make_game_record):
+    ingest_stream.ensure_consumer_group(redis_client)
+    ingest_stream.enqueue_game_record(redis_client, make_game_record("g1"))
+    bad_entry_id = ingest_stream.enqueue_game_record(redis_client, make_game_record("g2", moveset="['e4'"))
+
+    assert ingest_stream.consume_batch(redis_client, "worker-1", block_ms=10) == 1
+    assert redis_client.sismember(keys.GLOBAL_GAMES_IDS, "g1")
+    assert not redis_client.sismember(keys.GLOBAL_GAMES_IDS, "g2")
+
+    (_, dead_letter), = redis_client.xrange(keys.STREAM_DEAD_LETTERS)
+    assert dead_letter["game_id"] == "g2"
+    assert dead_letter["entry_id"] == bad_entry_id
+    assert "g2" in dead_letter["error"]
+    stats = ingest_stream.get_ingest_stats(redis_client)
+    assert (stats["depth"], stats["pending"]) == (0, 0)
+
+
+def test_failed_batch_stays_pending_and_is_applied_when_reclaimed(redis_client, make_game_record, monkeypatch):
+    ingest_stream.ensure_consumer_group(redis_client)
+    for gid in ("g1", "g2"):
+        ingest_stream.enqueue_game_record(redis_client, make_game_record(gid))
+
+    def fail(*_):
+        raise ConnectionError("connection lost")
+    with monkeypatch.context() as patched:
+        patched.setattr(ingest_stream, "add_game_records", fail)
+        with pytest.raises(ConnectionError):
+            ingest_stream.consume_batch(redis_client, "worker-1", block_ms=10)
+    assert ingest_stream.get_ingest_stats(redis_client)["pending"] == 2
+
+    monkeypatch.setattr(config, "INGEST_CLAIM_IDLE_MS", 0)
+    assert ingest_stream.consume_batch(redis_client, "worker-2", block_ms=10) == 2
+    assert redis_client.smembers(keys.GLOBAL_GAMES_IDS) == {"g1", "g2"}
+
+
+def test_worker_survives_a_failed_batch(redis_client, monkeypatch):
+    calls = []
+
+    def consume_batch(*_):
+        calls.append(None)
+        if len(calls) == 1:
+            raise ConnectionError("connection lost")
+        raise KeyboardInterrupt  # stops the worker
+    monkeypatch.setattr(ingest_stream, "consume_batch", consume_batch)
+    monkeypatch.setattr(ingest_stream, "WORKER_RETRY_DELAY", 0)
+    with pytest.raises(KeyboardInterrupt):
+        ingest_stream.run_worker("worker-1")
+    assert len(calls) == 2
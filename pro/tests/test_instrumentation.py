@@ -0,0 +1,96 @@
+"""Behavior tests of the command instrumentation (instrumentation.py)"""
+
+import re
+import urllib.request
+
+import pytest
+
+import instrumentation
+from instrumentation import CommandMetrics, InstrumentedRedis, traced
+
+
+@pytest.fixture
+def metrics():
+    return CommandMetrics()
+
+
+@pytest.fixture
+def instrumented_client(redis_client, metrics):
+    """An instrumented client of the test database, recording every command into `metrics`"""
+    client = InstrumentedRedis(metrics=metrics, **redis_client.connection_pool.connection_kwargs)
+    yield client
+    client.close()
+
+
+def __samples(metrics):
+    """Returns the samples of the rendered metrics, as {'name{labels}': value}"""
+    return {
+        sample: float(value)
+        for sample, value in re.findall(r"^(\S+) (\S+)$", metrics.render_prometheus(), re.MULTILINE)
+        if not sample.startswith("#")
+    }
+
+
+@traced
+def __outer(client):
+    client.set("counter", 1)
+    __inner(client)
+    pipe = client.pipeline(transaction=False)
+    pipe.incr("counter")
+    pipe.incr("counter")
+    pipe.get("counter")
+    pipe.execute()
+
+
+@traced
+def __inner(client):
+    client.get("counter")
+
+
+def test_commands_are_attributed_to_the_innermost_traced_function(instrumented_client, metrics):
+    __outer(instrumented_client)
+    instrumented_client.get("counter")
+
+    samples = __samples(metrics)
+    assert samples['bgc_redis_commands_total{function="__outer",command="SET"}'] == 1
+    assert samples['bgc_redis_commands_total{function="__outer",command="INCRBY"}'] == 2  # redis-py's INCR
+    assert samples['bgc_redis_commands_total{function="__outer",command="GET"}'] == 1
+    assert samples['bgc_redis_commands_total{function="__inner",command="GET"}'] == 1
+    assert samples[f'bgc_redis_commands_total{{function="{instrumentation.UNATTRIBUTED}",command="GET"}}'] == 1
+    # the pipeline is a single round-trip
+    assert samples['bgc_redis_roundtrips_total{function="__outer"}'] == 2
+    assert samples['bgc_redis_roundtrips_total{function="__inner"}'] == 1
+    assert samples['bgc_redis_roundtrip_latency_seconds_count{function="__outer"}'] == 2
+    assert samples['bgc_redis_roundtrip_latency_seconds_bucket{function="__outer",le="+Inf"}'] == 2
+    assert samples['bgc_redis_request_bytes_total{function="__inner"}'] == len("GET") + len("counter")
+    assert samples['bgc_redis_response_bytes_total{function="__inner"}'] == len("3")
+
+
+def test_sampled_round_trips_are_weighted(redis_client, metrics, monkeypatch):
+    client = InstrumentedRedis(metrics=metrics, sample_rate=0.25, **redis_client.connection_pool.connection_kwargs)
+    draws = iter([0.1, 0.9, 0.2])  # the second round-trip is not sampled
+    monkeypatch.setattr(instrumentation.random, "random", lambda: next(draws))
+    for _ in range(3):
+        client.ping()
+    assert __samples(metrics)['bgc_redis_roundtrips_total{function="unattributed"}'] == 8
+    with pytest.raises(ValueError):
+        InstrumentedRedis(sample_rate=0)
+
+
+def test_metrics_are_dumped_and_served(instrumented_client, metrics, tmp_path):
+    instrumented_client.ping()
+    path = tmp_path / "metrics.prom"
+    instrumentation.dump_prometheus(str(path), metrics)
+    assert path.read_text(encoding="utf-8") == metrics.render_prometheus()
+
+    server = instrumentation.start_metrics_server(0, metrics)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode("utf-8") == metrics.render_prometheus()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    metrics.reset()
+    assert "bgc_redis_commands_total{" not in metrics.render_prometheus()
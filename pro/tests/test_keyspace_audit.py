@@ -0,0 +1,66 @@
+"""Behavior tests of the keyspace memory audit (keyspace_audit.py)"""
+
+import string
+
+import pytest
+
+import keys
+from keyspace_audit import UNCLASSIFIED, audit_keyspace, classify, key_patterns
+from write_funcs import add_game_records, add_players, add_schedule
+
+
+def test_every_key_template_classifies_its_own_keys():
+    patterns = key_patterns()
+    assert "PLAYER_EMAIL" in dict(patterns)
+    assert not [name for name, _ in patterns if name.endswith("_PREFIX")]
+    for name, _ in patterns:
+        template = getattr(keys, name)
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+        key = template.format(**{field: f"{field}-1" for field in fields})
+        assert classify(patterns, key) == name, key
+
+
+@pytest.mark.parametrize("key, name", [
+    ("player:alice:most_freq_opening:count", "PLAYER_MOST_FREQ_OPENING_COUNT"),
+    ("player:alice:most_freq_opening", "PLAYER_MOST_FREQ_OPENING"),
+    ("player:alice:scheduled_games:g1:opponent", "PLAYER_SCHEDULED_GAME_OPPONENT"),
+    ("global:seq:e4,e5,Nf3:games", "GLOBAL_SEQ_GAMES"),
+    ("opening_tree:", "OPENING_TREE_NODE"),
+    ("opening_tree:e4,e5", "OPENING_TREE_NODE"),
+    ("analytics:top_wins", "ANALYTICS_TOP_WINS"),
+    ("player:alice:unknown", UNCLASSIFIED),
+    ("something:else", UNCLASSIFIED),
+])
+def test_classify(key, name):
+    assert classify(key_patterns(), key) == name
+
+
+def test_audit_totals(redis_client, make_player, make_game_record):
+    add_players(redis_client, [make_player(pid) for pid in ("alice", "bob", "carol")])
+    add_game_records(redis_client, [make_game_record(f"g{i}") for i in range(4)])
+    add_schedule(redis_client, {"game_id": "s1", "player_1": "bob", "player_2": "carol"})
+    redis_client.set("something:else", "value")
+
+    report = audit_keyspace(redis_client, samples=2, scan_count=10)
+    patterns = {pattern["pattern"]: pattern for pattern in report["patterns"]}
+    assert report["keys"] == redis_client.dbsize() == sum(pattern["keys"] for pattern in report["patterns"])
+    assert report["games"] == 4
+    assert report["used_memory"] > 0
+    assert patterns[UNCLASSIFIED]["keys"] == 1
+    assert patterns["PLAYER_EMAIL"]["keys"] == 3
+    assert patterns["PLAYER_SCHEDULED_GAME_OPPONENT"]["keys"] == 2
+
+    winners = patterns["GAME_WINNER"]
+    assert winners["template"] == keys.GAME_WINNER
+    assert (winners["keys"], winners["sampled"], winners["keys_per_game"]) == (4, 2, 1.0)
+    assert winners["est_total_bytes"] == pytest.approx(winners["avg_bytes"] * 4)
+    assert winners["bytes_per_game"] == pytest.approx(winners["avg_bytes"])
+    assert sum(winners["encodings"].values()) == 2
+    # largest estimated total first
+    totals = [pattern["est_total_bytes"] for pattern in report["patterns"]]
+    assert totals == sorted(totals, reverse=True)
+
+
+def test_audit_of_an_empty_keyspace(redis_client):
+    report = audit_keyspace(redis_client)
+    assert (report["keys"], report["games"], report["patterns"]) == (0, 0, [])
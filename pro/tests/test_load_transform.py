@@ -0,0 +1,85 @@
+"""Behavior tests of the incremental reloads of load_transform.py: skipped chunks, new rows, and modified rows"""
+
+import csv
+from pathlib import Path
+from typing import List
+
+import pytest
+
+import config
+import keys
+from load_transform import process_csv_file_incrementally
+from write_funcs import add_game_records, add_players
+
+
+def __write_csv(path: Path, header_row: List[str], rows: List[List[str]]) -> None:
+    with open(path, "w", newline="") as csv_file:
+        csv.writer(csv_file).writerows([header_row, *rows])
+
+
+@pytest.fixture
+def players_csv(tmp_path, monkeypatch):
+    """Returns a function writing the given rows (user ids and emails) to players.csv, read in chunks of 2 rows"""
+    monkeypatch.setattr(config, "LOAD_CHUNK_SIZE", 2)
+    path = tmp_path / "players.csv"
+
+    def write(rows: List[List[str]]) -> Path:
+        __write_csv(path, ["user_id", "email"], rows)
+        return path
+    return write
+
+
+def __reload(redis_client, path: Path):
+    return process_csv_file_incrementally(
+        redis_client, path, "user_id", lambda rows: len(add_players(redis_client, rows)))
+
+
+def test_reloads_apply_new_rows_and_skip_unchanged_chunks(redis_client, players_csv):
+    rows = [[f"p{i}", f"p{i}@example.com"] for i in range(5)]
+    path = players_csv(rows)
+    assert __reload(redis_client, path) == {
+        "chunks": 3, "skipped_chunks": 0, "unchanged_rows": 0, "new_rows": 5, "applied_rows": 5, "modified_ids": []}
+    assert redis_client.smembers(keys.GLOBAL_PLAYERS_IDS) == {f"p{i}" for i in range(5)}
+
+    assert __reload(redis_client, path) == {
+        "chunks": 3, "skipped_chunks": 3, "unchanged_rows": 5, "new_rows": 0, "applied_rows": 0, "modified_ids": []}
+
+    # two appended rows: the last chunk changes and a fourth chunk is added
+    path = players_csv(rows + [["p5", "p5@example.com"], ["p6", "p6@example.com"]])
+    assert __reload(redis_client, path) == {
+        "chunks": 4, "skipped_chunks": 2, "unchanged_rows": 5, "new_rows": 2, "applied_rows": 2, "modified_ids": []}
+    assert redis_client.scard(keys.GLOBAL_PLAYERS_IDS) == 7
+
+
+def test_modified_rows_are_reported_until_reverted(redis_client, players_csv):
+    rows = [[f"p{i}", f"p{i}@example.com"] for i in range(4)]
+    __reload(redis_client, players_csv(rows))
+
+    path = players_csv([rows[0], ["p1", "changed@example.com"], *rows[2:], ["p4", "p4@example.com"]])
+    assert __reload(redis_client, path) == {
+        "chunks": 3, "skipped_chunks": 1, "unchanged_rows": 3, "new_rows": 1, "applied_rows": 1, "modified_ids": ["p1"]}
+    # the chunk holding the modified row is not recorded, so the row is reported again by the next reload
+    assert __reload(redis_client, path) == {
+        "chunks": 3, "skipped_chunks": 2, "unchanged_rows": 4, "new_rows": 0, "applied_rows": 0, "modified_ids": ["p1"]}
+    assert redis_client.get(keys.PLAYER_EMAIL.format(pid="p1")) == "p1@example.com"
+
+    path = players_csv(rows + [["p4", "p4@example.com"]])
+    assert __reload(redis_client, path) == {
+        "chunks": 3, "skipped_chunks": 3, "unchanged_rows": 5, "new_rows": 0, "applied_rows": 0, "modified_ids": []}
+
+
+def test_repeated_rows_and_rows_loaded_without_digests(redis_client, make_game_record, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "LOAD_CHUNK_SIZE", 10)
+    records = [make_game_record("g1"), make_game_record("g2"), make_game_record("g1")]
+    header_row = list(records[0])
+    path = tmp_path / "game_records.csv"
+    __write_csv(path, header_row, [[record[column] for column in header_row] for record in records])
+    # g2 was loaded by a bootstrap, which records no digests
+    add_game_records(redis_client, [records[1]])
+
+    report = process_csv_file_incrementally(
+        redis_client, path, "game_id", lambda rows: len(add_game_records(redis_client, rows)))
+    # the repeat of g1 within the file is unchanged, and g2 is new to the digests but not to the database
+    assert report == {
+        "chunks": 1, "skipped_chunks": 0, "unchanged_rows": 1, "new_rows": 2, "applied_rows": 1, "modified_ids": []}
+    assert redis_client.hkeys(keys.LOAD_ROW_DIGESTS.format(dataset="game_records.csv")) == ["g1", "g2"]
@@ -0,0 +1,71 @@
+"""Behavior tests of the player directory of player_funcs.py: email lookups and paginated prefix searches"""
+
+import pytest
+
+import backfill_funcs
+import keys
+from models import BoardGameClubNotUniqueError
+from player_funcs import in_league, resolve_emails, search_emails, search_players
+from write_funcs import add_player, add_players
+
+
+@pytest.fixture
+def directory(redis_client, make_player):
+    """Players "ann", "anna", "annie", "bob", "boris", and "zoë"; "bob2" shares the email of "bob" """
+    add_players(redis_client, [make_player(pid) for pid in ("bob", "ann", "annie", "anna", "zoë", "boris")])
+    add_players(redis_client, [{"user_id": "bob2", "email": "bob@example.com"}])
+    return redis_client
+
+
+def test_add_players_skips_taken_ids(redis_client, make_player):
+    added = add_players(redis_client, [make_player("ann"), make_player("bob"), make_player("ann")])
+    assert added == ["ann", "bob"]
+    assert add_players(redis_client, [make_player("bob"), make_player("carl")]) == ["carl"]
+    assert add_players(redis_client, []) == []
+    with pytest.raises(BoardGameClubNotUniqueError):
+        add_player(redis_client, make_player("carl"))
+
+    assert redis_client.smembers(keys.GLOBAL_PLAYERS_IDS) == {"ann", "bob", "carl"}
+    assert redis_client.zrange(keys.GLOBAL_PIDS_LEX, 0, -1) == ["ann", "bob", "carl"]
+
+
+def test_resolve_emails(directory):
+    assert resolve_emails(directory, ["anna@example.com", "nobody@example.com", "bob@example.com"]) == [
+        "anna", None, "bob"]
+    assert resolve_emails(directory, []) == []
+    assert in_league(directory, "zoë@example.com")
+    assert not in_league(directory, "nobody@example.com")
+
+
+def test_search_players_pages_through_the_matches(directory):
+    assert search_players(directory, "ann") == ["ann", "anna", "annie"]
+    assert search_players(directory, "an", count=2) == ["ann", "anna"]
+    assert search_players(directory, "an", count=2, after="anna") == ["annie"]
+    assert search_players(directory, "an", count=2, after="annie") == []
+    assert search_players(directory, "bo") == ["bob", "bob2", "boris"]
+    assert search_players(directory, "zo") == ["zoë"]
+    assert search_players(directory, "c") == []
+    assert search_players(directory, "a", count=0) == []
+    # an empty prefix matches every player
+    assert len(search_players(directory, "", count=100)) == 7
+
+
+def test_search_emails_pages_through_the_matches(directory):
+    first_page = search_emails(directory, "bo", count=1)
+    assert first_page == [("bob@example.com", "bob")]
+    assert search_emails(directory, "bo", count=1, after=first_page[-1][0]) == [("boris@example.com", "boris")]
+    assert search_emails(directory, "bo", count=1, after="boris@example.com") == []
+    assert search_emails(directory, "zoë@") == [("zoë@example.com", "zoë")]
+
+
+def test_player_directory_backfill(directory):
+    expected = search_emails(directory, "", count=100)
+    directory.delete(keys.GLOBAL_PLAYERS_BY_EMAIL, keys.GLOBAL_PIDS_LEX, keys.GLOBAL_EMAILS_LEX)
+
+    assert backfill_funcs.backfill_player_directory(directory, batch_size=2) == 7
+    assert search_players(directory, "an") == ["ann", "anna", "annie"]
+    # the email shared by "bob" and "bob2" resolves to either of them
+    backfilled = search_emails(directory, "", count=100)
+    assert [pair for pair in backfilled if pair[0] != "bob@example.com"] == [
+        pair for pair in expected if pair[0] != "bob@example.com"]
+    assert dict(backfilled)["bob@example.com"] in ("bob", "bob2")
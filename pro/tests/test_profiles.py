@@ -0,0 +1,71 @@
+"""Behavior tests of the materialized player profiles (profiles.py), kept up to date by write_funcs.py"""
+
+import pytest
+
+import config
+import profiles
+from write_funcs import add_game_records, add_players, add_schedule
+
+# MODULE LIST reply, before redis-py's parsing, of a server loading RedisJSON (e.g., the redis-stack image)
+REDIS_STACK_MODULE_LIST = [["name", "ReJSON", "ver", 20809, "path", "/opt/redis-stack/lib/rejson.so", "args", []]]
+
+
+@pytest.fixture
+def detect_backend(monkeypatch):
+    """Forgets the backend resolved by earlier tests, so that the next call of `profiles.backend` detects it again"""
+    monkeypatch.setattr(config, "PROFILE_BACKEND", "auto")
+    monkeypatch.setattr(profiles, "__resolved_backend", None)
+
+
+@pytest.fixture
+def hash_backend(monkeypatch):
+    monkeypatch.setattr(profiles, "__resolved_backend", "hash")
+
+
+def test_backend_detects_a_loaded_json_module(redis_client, detect_backend, monkeypatch):
+    parse_response = redis_client.parse_response
+
+    def with_json_module(connection, command_name, **options):
+        response = parse_response(connection, command_name, **options)
+        if command_name.upper().startswith("MODULE"):
+            # the server's own reply is replaced, and parsed as redis-py would parse the reply of redis-stack
+            callback = redis_client.response_callbacks.get(command_name, lambda reply, **_: reply)
+            response = callback(REDIS_STACK_MODULE_LIST, **options)
+        return response
+    monkeypatch.setattr(redis_client, "parse_response", with_json_module)
+
+    assert profiles.backend(redis_client) == "json"
+
+
+def test_backend_falls_back_to_hashes_without_modules(redis_client, detect_backend):
+    if redis_client.module_list():
+        pytest.skip("the test server loads modules")
+    assert profiles.backend(redis_client) == "hash"
+
+
+def test_profile_follows_the_writes(redis_client, hash_backend, make_player, make_game_record, monkeypatch):
+    monkeypatch.setattr(config, "PROFILE_WINDOW", 2)
+    add_players(redis_client, [make_player(pid) for pid in ("alice", "bob", "carol")])
+    assert profiles.get_profile(redis_client, "alice") == profiles.empty_profile("alice", "alice@example.com")
+
+    add_game_records(redis_client, [
+        make_game_record("g1", "alice", "bob", "white", opening_eco="C60"),
+        make_game_record("g2", "bob", "alice", "draw", opening_eco="B21", number_of_turns=30),
+        make_game_record("g3", "carol", "alice", "white", opening_eco="B21", number_of_turns=12),
+    ])
+    add_schedule(redis_client, {"game_id": "s1", "player_1": "alice", "player_2": "carol"})
+
+    profile = profiles.get_profile(redis_client, "alice")
+    assert (profile["wins"], profile["losses"], profile["draws"]) == (1, 1, 1)
+    assert profile["most_freq_opening"] == "B21"
+    assert profile["friend_group"] is not None
+    assert profile["friend_group"] == profiles.get_profile(redis_client, "carol")["friend_group"]
+    # the window keeps the 2 most recent games, most recent first
+    assert profile["recent_games"] == [
+        {"game_id": "g3", "color": "black", "opponent": "carol", "result": "loss", "opening_eco": "B21",
+         "number_of_turns": 12},
+        {"game_id": "g2", "color": "black", "opponent": "bob", "result": "draw", "opening_eco": "B21",
+         "number_of_turns": 30},
+    ]
+    assert profile["scheduled_games"] == [{"game_id": "s1", "opponent": "carol"}]
+    assert profiles.get_profile(redis_client, "dave") is None
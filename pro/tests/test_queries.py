@@ -8,6 +8,7 @@ unordered (a Set) the comparison ignores ordering; otherwise it expects
 an exact match.
 """
 
+import os
 from typing import Any, Sequence
 from redis import Redis
 
@@ -22,11 +23,13 @@ def pretty(val: Any) -> str:
 
 
 ##### bind to Redis
-redis = Redis(host="localhost", port=6379, db=0, decode_responses=True)
+# BGC_TEST_REDIS_PORT can point the (read-only) queries at a replica
+port = int(os.environ.get("BGC_TEST_REDIS_PORT", "6379"))
+redis = Redis(host="localhost", port=port, db=0, decode_responses=True)
 try:
     redis.ping()
 except Exception as e:
-    raise SystemExit(f"Cannot reach Redis on localhost:6379 → {e}") from None
+    raise SystemExit(f"Cannot reach Redis on localhost:{port} → {e}") from None
 
 
 ##### test catalogue
@@ -0,0 +1,81 @@
+"""Behavior tests of the ranking read helpers (rankings.py), and of the most frequently used openings derived from the
+opening rankings at ingest
+"""
+
+import random
+
+import pytest
+
+import keys
+import player_funcs
+import profiles
+import rankings
+import write_funcs
+from write_funcs import add_game_records, add_players
+
+
+def test_top_k_breaks_ties_by_ascending_member(redis_client):
+    redis_client.zadd("ranking", {"A00": 5, "B21": 3, "C20": 3, "C50": 3, "D00": 1})
+    assert rankings.top_k(redis_client, "ranking", 3) == [("A00", 5), ("B21", 3), ("C20", 3)]
+    assert rankings.top_k(redis_client, "ranking", 10) == [("A00", 5), ("B21", 3), ("C20", 3), ("C50", 3), ("D00", 1)]
+    assert rankings.bottom_k(redis_client, "ranking", 2) == [("D00", 1), ("B21", 3)]
+    assert rankings.leader(redis_client, "ranking") == ("A00", 5)
+
+
+def test_top_k_fetches_at_most_k_tied_members(redis_client, monkeypatch):
+    redis_client.zadd("ranking", {f"g{i:04d}": 40 for i in range(1000)})
+    redis_client.zadd("ranking", {"longest": 90})
+    fetched = []
+    zrangebyscore = redis_client.zrangebyscore
+
+    def spy(*args, **kwargs):
+        members = zrangebyscore(*args, **kwargs)
+        fetched.extend(members)
+        return members
+    monkeypatch.setattr(redis_client, "zrangebyscore", spy)
+
+    assert rankings.top_k(redis_client, "ranking", 3) == [("longest", 90), ("g0000", 40), ("g0001", 40)]
+    assert len(fetched) == 2
+
+
+def test_most_freq_opening_keys_follow_the_ranking_leader(redis_client, make_player, make_game_record):
+    add_players(redis_client, [make_player("alice"), make_player("bob")])
+    # B20 then A00: tied at one game each, A00 leads
+    add_game_records(redis_client, [
+        make_game_record("g1", opening_eco="B20"),
+        make_game_record("g2", opening_eco="A00"),
+    ])
+    assert player_funcs.player_most_freq_opening(redis_client, "alice") == "A00"
+    assert redis_client.get(keys.PLAYER_MOST_FREQ_OPENING.format(pid="alice")) == "A00"
+    assert redis_client.get(keys.ANALYTICS_MOST_FREQ_OPENING) == "A00"
+    assert profiles.get_profile(redis_client, "alice")["most_freq_opening"] == "A00"
+
+    add_game_records(redis_client, [make_game_record("g3", opening_eco="B20")])
+    assert player_funcs.player_most_freq_opening(redis_client, "bob") == "B20"
+    assert redis_client.mget(keys.PLAYER_MOST_FREQ_OPENING.format(pid="bob"), keys.ANALYTICS_MOST_FREQ_OPENING) == \
+        ["B20", "B20"]
+
+
+@pytest.mark.parametrize("max_pending", [None, 3])
+def test_most_freq_opening_keys_match_the_rankings(redis_client, make_player, make_game_record, max_pending):
+    rnd = random.Random(13)
+    pids = [f"p{i}" for i in range(5)]
+    add_players(redis_client, [make_player(pid) for pid in pids])
+    if max_pending is not None:
+        write_funcs.enable_write_buffer(redis_client, max_pending=max_pending, max_delay_ms=60000)
+    try:
+        for i in range(150):
+            white, black = rnd.sample(pids, 2)
+            write_funcs.add_game_record(
+                redis_client, make_game_record(f"g{i}", white, black, opening_eco=rnd.choice(["A00", "B20", "C60"])))
+    finally:
+        write_funcs.disable_write_buffer()
+
+    for pid in pids:
+        leader, count = rankings.leader(redis_client, keys.PLAYER_OPENINGS_RANKING.format(pid=pid))
+        assert redis_client.mget(
+            keys.PLAYER_MOST_FREQ_OPENING.format(pid=pid), keys.PLAYER_MOST_FREQ_OPENING_COUNT.format(pid=pid)) == \
+            [leader, str(int(count))]
+    leader, count = rankings.leader(redis_client, keys.GLOBAL_OPENINGS_RANKING)
+    assert redis_client.mget(keys.ANALYTICS_MOST_FREQ_OPENING, keys.ANALYTICS_MOST_FREQ_OPENING_COUNT) == \
+        [leader, str(int(count))]
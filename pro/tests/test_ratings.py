@@ -0,0 +1,67 @@
+"""Behavior tests of the Elo ratings (ratings.py): the vectorized recompute must match the ratings applied at ingest"""
+
+import random
+
+import numpy as np
+import pytest
+
+import config
+import keys
+import ratings
+from write_funcs import add_game_records
+
+
+def test_recompute_matches_the_sequential_updates(redis_client, make_game_record):
+    rnd = random.Random(7)
+    pids = [f"p{i}" for i in range(6)]
+    game_records = []
+    for i in range(120):
+        white, black = rnd.sample(pids, 2)
+        game_records.append(make_game_record(f"g{i}", white, black, rnd.choice(["white", "black", "draw"])))
+    # a player's back-to-back games, including draws, land in consecutive rounds of the replay
+    game_records += [
+        make_game_record("r1", "p0", "p1", "draw"),
+        make_game_record("r2", "p1", "p0", "draw"),
+        make_game_record("r3", "p0", "p1", "white"),
+    ]
+    assert len(add_game_records(redis_client, game_records)) == len(game_records)
+    sequential = dict(redis_client.zrange(keys.ANALYTICS_RATINGS, 0, -1, withscores=True))
+
+    redis_client.delete(keys.ANALYTICS_RATINGS)
+    assert ratings.recompute_ratings(redis_client, batch_size=64) == len(pids)
+    recomputed = dict(redis_client.zrange(keys.ANALYTICS_RATINGS, 0, -1, withscores=True))
+
+    assert recomputed.keys() == sequential.keys()
+    for pid, rating in sequential.items():
+        assert recomputed[pid] == pytest.approx(rating, abs=1e-9)
+    # ratings are zero-sum
+    assert sum(recomputed.values()) == pytest.approx(config.RATING_INITIAL * len(pids))
+
+
+def test_replay_matches_a_game_by_game_replay():
+    rnd = np.random.default_rng(3)
+    white = rnd.integers(0, 20, 2000)
+    black = (white + rnd.integers(1, 20, 2000)) % 20  # never the white player
+    scores = rnd.choice([0.0, 0.5, 1.0], 2000)
+
+    expected = [config.RATING_INITIAL] * 20
+    for w, b, score in zip(white.tolist(), black.tolist(), scores.tolist()):
+        change = ratings.rating_change(expected[w], expected[b], score)
+        expected[w] += change
+        expected[b] -= change
+    assert ratings.replay(white, black, scores, 20) == pytest.approx(expected, abs=1e-9)
+
+
+def test_update_ratings_applies_the_elo_change(redis_client, make_game_record):
+    initial, half_k = config.RATING_INITIAL, config.RATING_K / 2
+    white, black = ratings.update_ratings(redis_client, make_game_record("g1", "alice", "bob", "white"))
+    assert (white, black) == (pytest.approx(initial + half_k), pytest.approx(initial - half_k))
+    # a draw against a weaker player costs the stronger one
+    white, black = ratings.update_ratings(redis_client, make_game_record("g2", "bob", "alice", "draw"))
+    assert white > initial - half_k and black < initial + half_k and white + black == pytest.approx(2 * initial)
+
+
+def test_recompute_without_games_clears_the_ratings(redis_client):
+    redis_client.zadd(keys.ANALYTICS_RATINGS, {"alice": 1600})
+    assert ratings.recompute_ratings(redis_client) == 0
+    assert not redis_client.exists(keys.ANALYTICS_RATINGS)
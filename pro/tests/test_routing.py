@@ -0,0 +1,206 @@
+"""Behavior tests of the primary/replica read routing (routing.py)
+
+The routing rules are tested with a primary and a "replica" client of the same (standalone) test server, whose
+replication offsets are set by the tests. The read-your-writes test uses a real replica: the one at
+BGC_TEST_REDIS_REPLICA_PORT if set (e.g., started with redis/replica-build-and-run.txt), otherwise a `redis-server
+--replicaof` process started for the tests; it is skipped if neither is available.
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import time
+from typing import Callable, Dict, Iterator, List
+
+import pytest
+from redis import Redis
+from redis.exceptions import ConnectionError, ReadOnlyError
+
+import config
+import keys
+import player_funcs
+from routing import ReplicaRouter, RoutedRedis, is_read_only
+from write_funcs import add_players
+
+REPLICA_SYNC_TIMEOUT_S = 30
+
+
+class Offsets:
+    """Replication offsets reported by INFO replication, set by the tests"""
+
+    def __init__(self) -> None:
+        self.primary = 100
+        self.replica = 100
+        self.link = "up"
+
+
+def __spied_client(
+        redis_client: Redis,
+        name: str,
+        served: List[str],
+        info: Callable[[], Dict[str, object]]) -> Redis:
+    """Returns a client of the test database that appends `name` to `served` for every command or pipeline it sends,
+    and whose INFO replies `info()`
+    """
+    client = Redis(**redis_client.connection_pool.connection_kwargs)
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def spy_execute_command(*args, **options):
+        served.append(name)
+        return execute_command(*args, **options)
+
+    def spy_pipeline(*args, **kwargs):
+        served.append(name)
+        return pipeline(*args, **kwargs)
+    client.execute_command = spy_execute_command
+    client.pipeline = spy_pipeline
+    client.info = lambda section=None: info()
+    return client
+
+
+@pytest.fixture
+def offsets() -> Offsets:
+    """The replication offsets of the primary and the replica of the `routed` client"""
+    return Offsets()
+
+
+@pytest.fixture
+def served() -> List[str]:
+    """The clients ("primary" or "replica") that served each command or pipeline"""
+    return []
+
+
+@pytest.fixture
+def routed(redis_client, offsets, served) -> RoutedRedis:
+    """A routed client whose replication offsets are refreshed before every read, with a lag bound of 10 bytes"""
+    primary = __spied_client(redis_client, "primary", served, lambda: {"master_repl_offset": offsets.primary})
+    replica = __spied_client(
+        redis_client, "replica", served,
+        lambda: {"master_link_status": offsets.link, "slave_repl_offset": offsets.replica})
+    return RoutedRedis(ReplicaRouter(primary, [replica], max_lag_bytes=10, refresh_ms=0))
+
+
+def test_is_read_only():
+    assert is_read_only("GET") and is_read_only("zrangebylex") and is_read_only("XINFO GROUPS")
+    assert not is_read_only("SET") and not is_read_only("EVALSHA") and not is_read_only("XREADGROUP")
+
+
+def test_commands_are_routed_by_kind(routed, served):
+    routed.set("a", 1)
+    assert routed.get("a") == "1"
+    assert routed.smembers("missing") == set()
+    routed.incr("a")
+    assert served == ["primary", "replica", "replica", "primary"]
+
+
+def test_pipelines_are_routed_by_their_commands(routed, served):
+    pipe = routed.pipeline(transaction=False)
+    pipe.set("a", 1)
+    pipe.get("a")
+    assert pipe.execute() == [True, "1"]
+    assert served == ["primary"]
+
+    pipe = routed.pipeline()
+    pipe.get("a")
+    pipe.exists("a")
+    assert pipe.execute() == ["1", 1]
+    assert served == ["primary", "replica"]
+
+    assert routed.pipeline().execute() == []
+    assert served == ["primary", "replica"]
+
+
+def test_reads_fall_back_to_the_primary(routed, offsets, served):
+    offsets.primary = 111  # the replica lags by more than 10 bytes
+    routed.get("a")
+    offsets.primary = 110
+    routed.get("a")
+    offsets.link = "down"
+    routed.get("a")
+    assert served == ["primary", "replica", "primary"]
+
+
+def test_reads_after_a_replica_error_go_to_the_primary(routed, served, monkeypatch):
+    replica = routed.router.replicas[0]
+
+    def unreachable(*args, **options):
+        served.append("replica")
+        raise ConnectionError("replica down")
+    monkeypatch.setattr(replica, "execute_command", unreachable)
+    routed.router.refresh_ms = 60_000
+
+    assert routed.get("a") is None
+    assert routed.get("a") is None  # marked down until the next refresh
+    assert served == ["replica", "primary", "primary"]
+
+
+def test_after_writes_waits_for_the_replica_to_catch_up(routed, offsets, served):
+    offsets.primary = 105  # within the lag bound, but the replica misses the last writes
+    routed.get("a")
+    after_writes = routed.after_writes()
+    assert after_writes.min_offset == 105
+    after_writes.get("a")
+    offsets.replica = 105
+    after_writes.get("a")
+    assert served == ["replica", "primary", "replica"]
+
+
+def __free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def replica_port(tmp_path_factory) -> Iterator[int]:
+    """The port of a replica of the test server (see the module docstring)"""
+    if os.environ.get("BGC_TEST_REDIS_REPLICA_PORT"):
+        yield int(os.environ["BGC_TEST_REDIS_REPLICA_PORT"])
+        return
+    if shutil.which("redis-server") is None:
+        pytest.skip("no replica: set BGC_TEST_REDIS_REPLICA_PORT or install redis-server")
+    port = __free_port()
+    process = subprocess.Popen(
+        ["redis-server", "--port", str(port), "--replicaof", config.REDIS_HOST, str(config.REDIS_PORT),
+         "--dir", str(tmp_path_factory.mktemp("replica")), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL)
+    try:
+        yield port
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@pytest.fixture
+def replica(redis_client, replica_port) -> Redis:
+    """A client of the test database on the replica, once its link to the primary is up"""
+    client = Redis(host=config.REDIS_HOST, port=replica_port, db=config.REDIS_DB, decode_responses=True)
+    deadline = time.monotonic() + REPLICA_SYNC_TIMEOUT_S
+    while True:
+        try:
+            if client.info("replication").get("master_link_status") == "up":
+                return client
+        except ConnectionError:
+            pass
+        if time.monotonic() > deadline:
+            pytest.skip(f"the replica at port {replica_port} did not sync with the primary")
+        time.sleep(0.05)
+
+
+def test_live_replica_serves_the_reads_of_the_writes_acknowledged(redis_client, replica, make_player):
+    router = ReplicaRouter(redis_client, [replica], refresh_ms=0)
+    routed = RoutedRedis(router)
+    with pytest.raises(ReadOnlyError):
+        replica.set("a", 1)
+
+    # the writes go to the primary, and `after_writes` only reads from the replica once it has replicated them
+    add_players(routed, [make_player(pid) for pid in ("ann", "anna", "bob")])
+    after_writes = routed.after_writes()
+    deadline = time.monotonic() + REPLICA_SYNC_TIMEOUT_S
+    while router.read_client(after_writes.min_offset) is not replica:
+        assert time.monotonic() < deadline, "the replica did not catch up"
+        time.sleep(0.01)
+    assert player_funcs.search_players(after_writes, "an") == ["ann", "anna"]
+    assert replica.zrange(keys.GLOBAL_PIDS_LEX, 0, -1) == ["ann", "anna", "bob"]
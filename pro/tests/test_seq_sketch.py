@@ -0,0 +1,93 @@
+"""Behavior tests of the approximate three-move sequence statistics (seq_sketch.py) of both backends"""
+
+import random
+from collections import Counter
+
+import pytest
+
+import analytics_funcs
+import config
+import game_funcs
+import keys
+import seq_sketch
+from models import BoardGameClubConfigError
+from write_funcs import add_game_records
+
+
+def __has_redisbloom(redis_client) -> bool:
+    return any(module["name"] == "bf" for module in redis_client.module_list())
+
+
+@pytest.fixture(params=["python", "redisbloom"])
+def backend(request, redis_client, monkeypatch):
+    """Selects each sketch backend in turn; the RedisBloom backend is skipped if the module is not loaded"""
+    if request.param == "redisbloom" and not __has_redisbloom(redis_client):
+        pytest.skip("the RedisBloom module is not loaded")
+    monkeypatch.setattr(config, "SEQ_SKETCH_BACKEND", request.param)
+    return redis_client
+
+
+def test_counts_never_undercount(backend):
+    rnd = random.Random(3)
+    sequences = [f"m{i},m{i + 1},m{i + 2}" for i in range(30)]
+    stream = rnd.choices(sequences, weights=range(1, 31), k=500)
+
+    counts = Counter()
+    for i in range(0, len(stream), 50):
+        batch = stream[i:i + 50]
+        estimates = seq_sketch.add_sequences(backend, batch)
+        # each estimate includes the occurrences recorded so far, this one included
+        for seq, estimate in zip(batch, estimates):
+            counts[seq] += 1
+            assert estimate >= counts[seq]
+
+    estimates = seq_sketch.query_sequences(backend, sequences + ["x,y,z"])
+    for seq, estimate in zip(sequences, estimates):
+        assert counts[seq] <= estimate <= counts[seq] + config.SEQ_SKETCH_ERROR * len(stream)
+    assert estimates[-1] == 0
+    assert seq_sketch.add_sequences(backend, []) == []
+    assert seq_sketch.query_sequences(backend, []) == []
+
+
+def test_top_sequences_are_the_most_common(backend, monkeypatch):
+    monkeypatch.setattr(config, "SEQ_TOPK", 3)
+    assert seq_sketch.top_sequences(backend) == []
+
+    # sequence "s{i}" is recorded i times, in an interleaved order
+    stream = [f"s{i}" for repeat in range(10) for i in range(1, 11) if repeat < i]
+    seq_sketch.add_sequences(backend, stream)
+    assert seq_sketch.top_sequences(backend) == [("s10", 10), ("s9", 9), ("s8", 8)]
+
+
+def test_redisbloom_backend_reports_a_missing_module(redis_client, monkeypatch):
+    if __has_redisbloom(redis_client):
+        pytest.skip("the RedisBloom module is loaded")
+    monkeypatch.setattr(config, "SEQ_SKETCH_BACKEND", "redisbloom")
+    with pytest.raises(BoardGameClubConfigError, match="RedisBloom"):
+        seq_sketch.add_sequences(redis_client, ["e4,e5,Nf3"])
+    assert seq_sketch.query_sequences(redis_client, ["e4,e5,Nf3"]) == [0]
+    assert seq_sketch.top_sequences(redis_client) == []
+
+
+def test_approximate_mode_feeds_the_sequence_queries(backend, make_game_record, monkeypatch):
+    monkeypatch.setattr(config, "SEQ_STATS_MODE", "approx")
+    monkeypatch.setattr(config, "SEQ_GAMES_MIN_COUNT", 2)
+    monkeypatch.setattr(analytics_funcs, "r", backend)
+    add_game_records(backend, [
+        make_game_record("g1", moveset="['e4', 'e5', 'Nf3', 'Nc6']"),
+        make_game_record("g2", moveset="['e4', 'e5', 'Nf3', 'Nf6']"),
+        make_game_record("g3", moveset="['d4', 'd5', 'c4']"),
+    ])
+
+    assert analytics_funcs.get_most_common_3move_sequence() == {"sequences": ["e4,e5,Nf3"], "count": 2}
+    assert analytics_funcs.get_top_3move_sequences(k=1) == [{"sequence": "e4,e5,Nf3", "count": 2}]
+    assert analytics_funcs.get_3move_sequence_counts(["e5,Nf3,Nc6", "d4,d5,c4", "c4,e5,Nf3"]) == {
+        "e5,Nf3,Nc6": 1, "d4,d5,c4": 1, "c4,e5,Nf3": 0}
+    with pytest.raises(BoardGameClubConfigError):
+        analytics_funcs.get_least_common_3move_sequence()
+
+    # only the sequences counted at least SEQ_GAMES_MIN_COUNT times (by the time of the game) have game sets, and the
+    # exact per-sequence counters are not kept
+    assert game_funcs.global_seq(backend, "e4,e5,Nf3") == ["g2"]
+    assert game_funcs.global_seq(backend, "d4,d5,c4") == []
+    assert not backend.exists(keys.GLOBAL_SEQ_COUNT.format(seq="e4,e5,Nf3"))
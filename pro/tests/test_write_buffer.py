@@ -0,0 +1,172 @@
+"""Behavior tests of the write-behind buffer (write_buffer.py) and of the buffered write path of write_funcs.py"""
+
+import os
+import random
+import subprocess
+import sys
+import time
+
+import pytest
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+import config
+import write_funcs
+from write_buffer import WriteBuffer
+
+MOVES = ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6", "d4", "d5", "c4", "Qh5+", "Bxf7+", "O-O"]
+
+
+@pytest.fixture
+def unreachable_client():
+    """A client of a server that refuses connections"""
+    return Redis(host="localhost", port=1, socket_connect_timeout=0.1, decode_responses=True)
+
+
+def __wait_for(condition, timeout=5.0):
+    """Waits until `condition()` is true, and returns whether it became true before `timeout` seconds"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_threshold_flush_sends_the_coalesced_writes(redis_client):
+    results = []
+    buffer = WriteBuffer(redis_client, max_pending=4, max_delay_ms=60000, on_flush=results.append)
+    buffer.incrby("counter")
+    buffer.incrby("counter", 2)
+    buffer.zincrby("ranking", 1.5, "C60")
+    assert buffer.pending() == 3
+    assert redis_client.get("counter") is None
+
+    buffer.sadd("set", "g1", "g2")
+    assert buffer.pending() == 0
+    assert redis_client.get("counter") == "3"
+    assert redis_client.zscore("ranking", "C60") == 1.5
+    assert redis_client.smembers("set") == {"g1", "g2"}
+    assert results == [{"counters": {"counter": 3}, "scores": {("ranking", "C60"): 1.5}}]
+    buffer.close()
+
+
+def test_timer_flushes_writes_once_overdue(redis_client):
+    buffer = WriteBuffer(redis_client, max_pending=1000, max_delay_ms=20)
+    buffer.incrby("counter", 5)
+    assert __wait_for(lambda: buffer.pending() == 0)
+    assert redis_client.get("counter") == "5"
+    buffer.close()
+
+
+def test_buffered_writes_are_flushed_at_exit(redis_client):
+    script = "\n".join([
+        "import sys",
+        f"sys.path.insert(0, {os.path.dirname(config.__file__)!r})",
+        "from connection import get_redis_client",
+        "from write_buffer import WriteBuffer",
+        "buffer = WriteBuffer(get_redis_client(), max_pending=1000, max_delay_ms=60000)",
+        "buffer.incrby('counter', 7)",
+        "buffer.sadd('set', 'g1')",
+    ])
+    subprocess.run([sys.executable, "-c", script], check=True, env=os.environ.copy())
+    assert redis_client.get("counter") == "7"
+    assert redis_client.smembers("set") == {"g1"}
+
+
+def test_failed_flush_keeps_the_writes(redis_client, unreachable_client):
+    buffer = WriteBuffer(unreachable_client, max_pending=1000, max_delay_ms=60000)
+    buffer.incrby("counter", 2)
+    buffer.zincrby("ranking", 1, "C60")
+    buffer.sadd("set", "g1")
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    assert buffer.pending() == 3
+
+    buffer.redis_client = redis_client
+    buffer.incrby("counter")
+    buffer.flush()
+    assert redis_client.get("counter") == "3"
+    assert redis_client.zscore("ranking", "C60") == 1
+    assert redis_client.smembers("set") == {"g1"}
+    buffer.close()
+
+
+def test_failed_timer_flush_is_reported_and_retried(redis_client, unreachable_client, capfd):
+    buffer = WriteBuffer(unreachable_client, max_pending=1000, max_delay_ms=20)
+    buffer.incrby("counter", 2)
+    assert __wait_for(lambda: "ConnectionError" in capfd.readouterr().err)
+    assert buffer.pending() == 1
+
+    # the overdue writes are flushed by the next write, in the writing thread
+    with pytest.raises(ConnectionError):
+        buffer.incrby("counter")
+    buffer.redis_client = redis_client
+    buffer.incrby("counter")
+    assert redis_client.get("counter") == "4"
+    buffer.close()
+
+
+def __games(count):
+    """Returns `count` random game records between 8 players"""
+    rnd = random.Random(11)
+    game_records = []
+    for i in range(count):
+        white, black = rnd.sample(range(8), 2)
+        moves = [rnd.choice(MOVES[:4] if ply < 3 else MOVES) for ply in range(rnd.randint(3, 12))]
+        game_records.append({
+            "game_id": f"g{i:03d}",
+            "moveset": str(moves),
+            "winner": rnd.choice(["white", "black", "draw"]),
+            "victory_status": "mate",
+            "number_of_turns": str(len(moves)),
+            "white_player_id": f"p{white}",
+            "black_player_id": f"p{black}",
+            "opening_eco": rnd.choice(["A00", "B21", "C60"]),
+        })
+    return game_records
+
+
+def __snapshot(redis_client):
+    """Returns the value of every key, leaving out the friend groups (whose ids are random)"""
+    snapshot = {}
+    for key in redis_client.scan_iter():
+        kind = redis_client.type(key)
+        if "friend_group" in key:
+            continue
+        elif kind == "string":
+            snapshot[key] = redis_client.dump(key)  # NOTE: HyperLogLogs are binary strings
+        elif kind == "list":
+            snapshot[key] = redis_client.lrange(key, 0, -1)
+        elif kind == "set":
+            snapshot[key] = redis_client.smembers(key)
+        elif kind == "zset":
+            snapshot[key] = redis_client.zrange(key, 0, -1, withscores=True)
+        elif kind == "hash":
+            snapshot[key] = {f: v for f, v in redis_client.hgetall(key).items() if f != "friend_group"}
+        else:
+            snapshot[key] = kind
+    return snapshot
+
+
+def __load(redis_client, make_player, game_records, max_pending=None):
+    """Loads 8 players and `game_records` into the flushed database, through the write buffer if `max_pending` is set"""
+    redis_client.flushdb()
+    write_funcs.add_players(redis_client, [make_player(f"p{i}") for i in range(8)])
+    if max_pending is not None:
+        write_funcs.enable_write_buffer(redis_client, max_pending=max_pending, max_delay_ms=60000)
+    try:
+        for i in range(0, len(game_records), 10):
+            write_funcs.add_game_records(redis_client, game_records[i:i + 10])
+    finally:
+        write_funcs.disable_write_buffer()
+    return __snapshot(redis_client)
+
+
+@pytest.mark.parametrize("max_pending", [1, 7, 10 ** 9])
+def test_buffered_load_matches_the_unbuffered_load(redis_client, make_player, max_pending):
+    game_records = __games(80)
+    unbuffered = __load(redis_client, make_player, game_records)
+    buffered = __load(redis_client, make_player, game_records, max_pending)
+    assert buffered.keys() == unbuffered.keys()
+    assert [key for key in unbuffered if buffered[key] != unbuffered[key]] == []